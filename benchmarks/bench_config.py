@@ -0,0 +1,100 @@
+"""
+Measure the per-conversion configuration overhead: building Config() in every stage that needs it and
+matching the decision headers with an uncompiled pattern, as the stages did, against the compiled
+config that is built once per process and injected into the stages.  Then time small conversions,
+where that overhead is the largest share.  Last, time loading a config file: parsing, validating and
+compiling it against reading its cached compiled form, which is what every later invocation does.
+
+Usage:
+    python -m benchmarks.bench_config [node_count ...]
+"""
+import dataclasses
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import generate_plan, plan_to_xl_csv
+from drawio_xl import config as config_module
+from drawio_xl.config import Config
+from drawio_xl.config import compile_config
+from drawio_xl.config import get_compiled_config
+from drawio_xl.config import load_config
+from drawio_xl.config import parse_config
+from drawio_xl.config import validate_config
+from drawio_xl.xl_to_drawio import prepare_drawio_csv
+
+# The decision headers of a draw.io CSV import with three decisions
+HEADERS = ['id', 'shape', 'next_step_id'] + [f'decision{i}_{suffix}' for i in range(3) for suffix in ['id', 'label']]
+
+
+def per_conversion_setup():
+    """What one conversion paid before: a Config per stage and an uncompiled match per header."""
+    for _ in range(5):
+        config = Config()
+    max(int(match.group(1)) for match in (re.match(r'decision(\d+)_(id|label)', header) for header in HEADERS) if match)
+    return config
+
+
+def compiled_setup():
+    """What one conversion pays now."""
+    config = get_compiled_config()
+    max(int(match.group(1)) for match in map(config.decision_header_pattern.match, HEADERS) if match)
+    return config
+
+
+def to_toml(settings):
+    """The default settings as a TOML file.  JSON strings and lists are valid TOML values."""
+    lines = [f'{name} = {json.dumps(value)}' for name, value in settings.items() if not isinstance(value, dict)]
+    for name, table in settings.items():
+        if isinstance(table, dict):
+            lines.append(f'[{name}]')
+            lines.extend(f'{json.dumps(key)} = {json.dumps(value)}' for key, value in table.items())
+    return '\n'.join(lines) + '\n'
+
+
+def per_call(fn, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return (time.perf_counter() - start) / number
+
+
+def main(node_counts, number=20000, repeat=20):
+    old_setup = per_call(per_conversion_setup, number)
+    new_setup = per_call(compiled_setup, number)
+    print(f'setup per conversion: {old_setup * 1e6:.2f} us -> {new_setup * 1e6:.2f} us '
+          f'({old_setup / new_setup:.1f}x)')
+
+    print(f'{"nodes":>8} {"conversions/s":>14} {"old setup share":>16}')
+    for node_count in node_counts:
+        data = plan_to_xl_csv(generate_plan(node_count))
+        best = min(per_call(lambda: prepare_drawio_csv(io.StringIO(data)), 50) for _ in range(repeat // 4 or 1))
+        print(f'{node_count:>8} {1 / best:>14.0f} {old_setup / (best + old_setup):>15.1%}')
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'settings.toml')
+        with open(path, 'w') as f:
+            f.write(to_toml(dataclasses.asdict(Config())))
+        with open(path, 'rb') as f:
+            data = f.read()
+        load_config(path)
+
+        def cold():
+            return compile_config(validate_config(parse_config(data, path), path))
+
+        def warm():
+            # A new invocation: nothing loaded in this process yet, the compiled file is on disk
+            config_module._load_config.cache_clear()
+            return load_config(path)
+
+        cold_time = per_call(cold, number // 10)
+        warm_time = per_call(warm, number // 10)
+        print(f'config file load: {cold_time * 1e6:.1f} us parsed -> {warm_time * 1e6:.1f} us from the compiled file')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [5, 20, 100])
@@ -0,0 +1,41 @@
+"""
+Show that convert_to_csv scales linearly with the number of shapes, and that its peak memory
+tracks the number of shapes rather than the size of the XML.
+
+Usage:
+    python -m benchmarks.bench_convert_to_csv [node_count ...]
+"""
+import io
+import sys
+import time
+import tracemalloc
+
+from benchmarks.synthetic import generate_plan, plan_to_drawio
+from drawio_xl.drawio_to_xl import convert_to_rows
+
+
+def main(node_counts, repeat=3):
+    print(f'{"shapes":>8} {"edges":>8} {"seconds":>10} {"us/shape":>10} {"xml MB":>8} {"peak MB":>8}')
+    for node_count in node_counts:
+        steps = generate_plan(node_count)
+        edge_count = sum(len(step['next']) for step in steps)
+        data = plan_to_drawio(steps)
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            convert_to_rows(io.StringIO(data))
+            best = min(best, time.perf_counter() - start)
+
+        # Measure the parser's own allocations; the input string is allocated before tracing starts
+        input_stream = io.StringIO(data)
+        tracemalloc.start()
+        convert_to_rows(input_stream)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f'{node_count:>8} {edge_count:>8} {best:>10.3f} {best / node_count * 1e6:>10.1f} '
+              f'{len(data) / 1e6:>8.1f} {peak / 1e6:>8.1f}')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
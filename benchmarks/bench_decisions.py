@@ -0,0 +1,46 @@
+"""
+Show how both pipelines scale with decision fan-out.  The decision branches are stored as sparse
+columns, so a wide decision adds column pairs to the CSV but only its own cells to the table held in
+memory; "stored" counts the decision cells kept against the cells dense columns would hold.
+
+Usage:
+    python -m benchmarks.bench_decisions [node_count] [fanout ...]
+"""
+import io
+import sys
+import time
+
+from benchmarks.synthetic import generate_plan, plan_to_drawio, plan_to_xl_csv
+from drawio_xl.drawio_to_xl import convert_to_table
+from drawio_xl.drawio_to_xl import drawio_to_xl
+from drawio_xl.table import SparseColumn
+from drawio_xl.xl_to_drawio import prepare_drawio_csv
+
+
+def best_of(fn, data, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(io.StringIO(data))
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(node_count, fanouts, repeat=3):
+    print(f'{"fanout":>7} {"xl->drawio s":>13} {"drawio->xl s":>13} {"stored":>9} {"dense":>9}')
+    for fanout in fanouts:
+        steps = generate_plan(node_count, decision_every=100, decision_fanout=fanout)
+        xl_csv = plan_to_xl_csv(steps)
+        drawio = plan_to_drawio(steps)
+        xl_time = best_of(prepare_drawio_csv, xl_csv, repeat)
+        drawio_time = best_of(drawio_to_xl, drawio, repeat)
+
+        table = convert_to_table(io.StringIO(drawio))
+        sparse = [column for column in table.columns if isinstance(column, SparseColumn)]
+        stored = sum(len(column.values) for column in sparse)
+        print(f'{fanout:>7} {xl_time:>13.3f} {drawio_time:>13.3f} {stored:>9} {len(sparse) * len(table):>9}')
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(args[0] if args else 10000, args[1:] or [2, 10, 30])
@@ -0,0 +1,64 @@
+"""
+Compare converting a batch of plans one at a time (csv_to_drawio, waiting for each) with queueing them all on a
+DrawioPool.
+
+Without an installed draw.io, a stand-in script that sleeps for --startup seconds and copies its input plays
+the part of Electron, so the numbers show how much start-up latency the pool hides.
+
+Usage:
+    python -m benchmarks.bench_drawio_pool [--plans 500] [--workers N] [--startup 0.05] [--drawio-path PATH]
+"""
+import argparse
+import io
+import os
+import stat
+import tempfile
+import time
+
+from benchmarks.synthetic import generate_plan, plan_to_xl_csv
+from drawio_xl.config import Config
+from drawio_xl.drawio_pool import DrawioPool
+from drawio_xl.xl_to_drawio import csv_to_drawio
+from drawio_xl.xl_to_drawio import prepare_drawio_csv
+
+
+def write_stand_in(directory, startup):
+    path = os.path.join(directory, 'draw.io')
+    with open(path, 'w') as f:
+        f.write(f'#!/bin/sh\nsleep {startup}\ncp "$2" "$6"\n')
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time batch draw.io conversions with and without DrawioPool.')
+    parser.add_argument('--plans', type=int, default=500)
+    parser.add_argument('--nodes', type=int, default=50, help='steps per plan')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--startup', type=float, default=0.05, help='stand-in draw.io start-up time in seconds')
+    parser.add_argument('--drawio-path', help='time a real draw.io instead of the stand-in')
+    args = parser.parse_args()
+
+    drawio_csvs = [prepare_drawio_csv(io.StringIO(plan_to_xl_csv(generate_plan(args.nodes, seed=seed)))).getvalue()
+                   for seed in range(args.plans)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        config = Config(drawio_path=args.drawio_path or write_stand_in(directory, args.startup), drawio_backend='cli')
+
+        start = time.perf_counter()
+        for drawio_csv in drawio_csvs:
+            csv_to_drawio(io.StringIO(drawio_csv), config)
+        sequential_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with DrawioPool(config, workers=args.workers) as pool:
+            for _ in pool.map(io.StringIO(drawio_csv) for drawio_csv in drawio_csvs):
+                pass
+        pool_time = time.perf_counter() - start
+
+    print(f'{"plans":>8} {"workers":>8} {"sequential s":>13} {"pool s":>8} {"speedup":>8}')
+    print(f'{args.plans:>8} {pool.workers:>8} {sequential_time:>13.2f} {pool_time:>8.2f} {sequential_time / pool_time:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
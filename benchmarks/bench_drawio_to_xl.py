@@ -0,0 +1,54 @@
+"""
+Compare the fused drawio_to_xl pipeline with chaining the stream-based stage functions.
+
+Usage:
+    python -m benchmarks.bench_drawio_to_xl [node_count ...]
+"""
+import io
+import sys
+import time
+
+from benchmarks.synthetic import generate_plan, plan_to_drawio
+from drawio_xl.drawio_to_xl import convert_to_csv
+from drawio_xl.drawio_to_xl import strip_front_matter
+from drawio_xl.drawio_to_xl import delete_height_width
+from drawio_xl.drawio_to_xl import replace_ids_with_xl_ids
+from drawio_xl.drawio_to_xl import delete_xl_ids
+from drawio_xl.drawio_to_xl import parse_decisions
+from drawio_xl.drawio_to_xl import rename_shapes
+from drawio_xl.drawio_to_xl import insert_newlines
+from drawio_xl.drawio_to_xl import rename_headers
+from drawio_xl.drawio_to_xl import reorder_headers
+from drawio_xl.drawio_to_xl import drawio_to_xl
+
+
+def drawio_to_xl_staged(input_stream):
+    """The stage-by-stage pipeline, with a full CSV round-trip between every stage."""
+    output_stream = convert_to_csv(input_stream)
+    for stage in [strip_front_matter, delete_height_width, replace_ids_with_xl_ids, delete_xl_ids,
+                  parse_decisions, rename_shapes, insert_newlines, rename_headers, reorder_headers]:
+        output_stream = stage(output_stream)
+    return output_stream
+
+
+def best_of(fn, data, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = fn(io.StringIO(data)).getvalue()
+        best = min(best, time.perf_counter() - start)
+    return best, output
+
+
+def main(node_counts, repeat=3):
+    print(f'{"nodes":>8} {"staged s":>10} {"fused s":>10} {"speedup":>8}')
+    for node_count in node_counts:
+        data = plan_to_drawio(generate_plan(node_count))
+        staged_time, staged_output = best_of(drawio_to_xl_staged, data, repeat)
+        fused_time, fused_output = best_of(drawio_to_xl, data, repeat)
+        assert staged_output == fused_output, 'fused output differs from the staged pipeline'
+        print(f'{node_count:>8} {staged_time:>10.3f} {fused_time:>10.3f} {staged_time / fused_time:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000])
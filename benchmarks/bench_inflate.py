@@ -0,0 +1,45 @@
+"""
+Measure the throughput of decoding compressed draw.io pages.
+
+Usage:
+    python -m benchmarks.bench_inflate [node_count ...]
+"""
+import io
+import sys
+import time
+
+from benchmarks.synthetic import compress_diagram, generate_plan, plan_to_drawio, plan_to_graph_model
+from drawio_xl.drawio_to_xl import convert_to_rows, inflate_diagram
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(node_counts, repeat=3):
+    print(f'{"nodes":>8} {"packed MB":>10} {"xml MB":>8} {"decode MB/s":>12} {"plain s":>9} {"compressed s":>13}')
+    for node_count in node_counts:
+        steps = generate_plan(node_count)
+        graph_model_xml = plan_to_graph_model(steps)
+        packed = compress_diagram(graph_model_xml)
+
+        plain_data = plan_to_drawio(steps)
+        compressed_data = plan_to_drawio(steps, compressed=True)
+
+        decode_time = best_of(lambda: sum(len(chunk) for chunk in inflate_diagram(packed)), repeat)
+        plain_time = best_of(lambda: convert_to_rows(io.StringIO(plain_data)), repeat)
+        compressed_time = best_of(lambda: convert_to_rows(io.StringIO(compressed_data)), repeat)
+
+        # Throughput is reported against the inflated XML size
+        xml_mb = len(graph_model_xml.encode('utf-8')) / 1e6
+        print(f'{node_count:>8} {len(packed) / 1e6:>10.2f} {xml_mb:>8.2f} {xml_mb / decode_time:>12.1f} '
+              f'{plain_time:>9.3f} {compressed_time:>13.3f}')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000])
@@ -0,0 +1,55 @@
+"""
+Time the native horizontalflow layout on its own and the whole in-process CSV-to-.drawio conversion.
+The per-node column should stay flat as the plan grows if layout is linear.
+
+Usage:
+    python -m benchmarks.bench_layout [node_count ...]
+"""
+import io
+import sys
+import time
+
+from benchmarks.synthetic import generate_plan, plan_to_xl_csv
+from drawio_xl.config import Config
+from drawio_xl.layout import layered_layout
+from drawio_xl.mxgraph import csv_to_mxfile
+from drawio_xl.xl_to_drawio import prepare_drawio_csv
+
+
+def plan_to_graph(steps):
+    """Return the (width, height) sizes and (source, target) index edges of a synthetic plan."""
+    dimensions = Config().shape_dimensions
+    index_of = {step['id']: index for index, step in enumerate(steps)}
+    sizes = []
+    edges = []
+    for step in steps:
+        shape = 'mxgraph.flowchart.decision' if step['shape'] == 'decision' else 'mxgraph.flowchart.process'
+        width, height = dimensions[shape]
+        sizes.append((float(width), float(height)))
+        edges.extend((index_of[step['id']], index_of[target]) for target, _ in step['next'] if target in index_of)
+    return sizes, edges
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(node_counts, repeat=3):
+    print(f'{"nodes":>8} {"layout s":>10} {"us/node":>8} {"emit s":>10}')
+    for node_count in node_counts:
+        steps = generate_plan(node_count)
+        sizes, edges = plan_to_graph(steps)
+        drawio_csv = prepare_drawio_csv(io.StringIO(plan_to_xl_csv(steps))).getvalue()
+
+        layout_time = best_of(lambda: layered_layout(sizes, edges), repeat)
+        emit_time = best_of(lambda: csv_to_mxfile(io.StringIO(drawio_csv)), repeat)
+        print(f'{node_count:>8} {layout_time:>10.3f} {layout_time / node_count * 1e6:>8.2f} {emit_time:>10.3f}')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000])
@@ -0,0 +1,95 @@
+"""
+Compare ways of remapping ids to xl_ids over every id-bearing column of a draw.io CSV table:
+
+- row loop: the original per-row loop, which looks the headers up with headers.index in every row and
+  splits and joins every cell.  It only covers decision0_id..decision2_id.
+- per cell: a map over each column that still splits and joins every cell.
+- stage: replace_ids_with_xl_ids_stage, one IdRemap lookup per cell, on dense columns read from CSV and
+  on the sparse decision columns the pipeline builds.
+
+Table construction is not timed.
+
+Usage:
+    python -m benchmarks.bench_replace_ids [node_count ...]
+"""
+import io
+import sys
+import time
+
+from benchmarks.synthetic import generate_plan, plan_to_drawio
+from drawio_xl.drawio_to_xl import convert_to_table
+from drawio_xl.drawio_to_xl import get_id_headers
+from drawio_xl.drawio_to_xl import get_id_to_xl_id
+from drawio_xl.drawio_to_xl import replace_ids_with_xl_ids_stage
+from drawio_xl.table import SparseColumn
+from drawio_xl.table import Table
+
+
+def row_loop(table, id_to_xl_id):
+    headers, rows = table
+    id_index = headers.index("id")
+    for row in rows:
+        row[id_index] = id_to_xl_id[row[id_index]]
+        for header in ["next_step_id", "decision0_id", "decision1_id", "decision2_id"]:
+            if header in headers:
+                index = headers.index(header)
+                ids = row[index].split(',')
+                row[index] = ','.join([id_to_xl_id[id] for id in ids if id in id_to_xl_id])
+
+
+def copy_rows(table):
+    return table.headers, [list(row) for row in table.rows()]
+
+
+def per_cell(table, id_to_xl_id):
+    def replace_id_list(ids):
+        return ','.join([id_to_xl_id[id] for id in ids.split(',') if id in id_to_xl_id])
+
+    table.map_column("id", id_to_xl_id.__getitem__)
+    for header in get_id_headers(table):
+        table.map_column(header, replace_id_list)
+
+
+def stage(table, id_to_xl_id):
+    replace_ids_with_xl_ids_stage(table, id_to_xl_id)
+
+
+def copy_table(table):
+    return Table(table.headers, [SparseColumn(dict(column.values), column.length) if isinstance(column, SparseColumn)
+                                 else list(column) for column in table.columns], len(table))
+
+
+def best_of(fn, table, id_to_xl_id, repeat, copy=copy_table):
+    best = float('inf')
+    for _ in range(repeat):
+        data = copy(table)
+        start = time.perf_counter()
+        fn(data, id_to_xl_id)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(node_counts, repeat=3):
+    print(f'{"nodes":>8} {"row loop s":>11} {"per cell s":>11} {"stage s":>9} {"sparse s":>9} {"speedup":>8}')
+    for node_count in node_counts:
+        steps = generate_plan(node_count, decision_every=10, decision_fanout=5)
+        sparse_table = convert_to_table(io.StringIO(plan_to_drawio(steps)))
+        dense_table = Table.read(sparse_table.write())
+        id_to_xl_id = get_id_to_xl_id(dense_table)
+
+        expected = copy_table(sparse_table)
+        per_cell(expected, id_to_xl_id)
+        actual = copy_table(sparse_table)
+        stage(actual, id_to_xl_id)
+        assert actual.write().getvalue() == expected.write().getvalue(), 'stage output differs'
+
+        row_time = best_of(row_loop, dense_table, id_to_xl_id, repeat, copy=copy_rows)
+        cell_time = best_of(per_cell, dense_table, id_to_xl_id, repeat)
+        stage_time = best_of(stage, dense_table, id_to_xl_id, repeat)
+        sparse_time = best_of(stage, sparse_table, id_to_xl_id, repeat)
+        print(f'{node_count:>8} {row_time:>11.3f} {cell_time:>11.3f} {stage_time:>9.3f} {sparse_time:>9.3f} '
+              f'{row_time / sparse_time:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [100000])
@@ -0,0 +1,45 @@
+"""
+Compare regenerating a diagram with the native backend (xl_to_drawio) against patching the previous diagram
+with update_drawio after editing a handful of rows.
+
+Usage:
+    python -m benchmarks.bench_update [node_count ...]
+"""
+import io
+import sys
+import time
+
+from benchmarks.synthetic import generate_plan, plan_to_xl_csv
+from drawio_xl.mxgraph import csv_to_mxfile
+from drawio_xl.update import update_drawio
+from drawio_xl.xl_to_drawio import prepare_drawio_csv
+
+EDITED_ROWS = 10
+
+
+def edit_plan(steps, count):
+    """Change the description and status of `count` steps spread through the plan."""
+    for step in steps[::max(len(steps) // count, 1)][:count]:
+        step['description'] += ' (revised)'
+        step['status'] = 'done'
+    return steps
+
+
+def main(node_counts):
+    print(f'{"nodes":>8} {"regenerate s":>13} {"update s":>9} {"changed":>8}')
+    for node_count in node_counts:
+        drawio = csv_to_mxfile(prepare_drawio_csv(io.StringIO(plan_to_xl_csv(generate_plan(node_count))))).getvalue()
+        edited_csv = plan_to_xl_csv(edit_plan(generate_plan(node_count), EDITED_ROWS))
+
+        start = time.perf_counter()
+        csv_to_mxfile(prepare_drawio_csv(io.StringIO(edited_csv)))
+        regenerate_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, changes = update_drawio(io.StringIO(drawio), io.StringIO(edited_csv))
+        update_time = time.perf_counter() - start
+        print(f'{node_count:>8} {regenerate_time:>13.3f} {update_time:>9.3f} {len(changes["changed"]):>8}')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000])
@@ -0,0 +1,55 @@
+"""
+Compare the fused xl_to_drawio executor (prepare_drawio_csv) with chaining the stream-based stage
+functions.  The final draw.io conversion is not timed.
+
+Usage:
+    python -m benchmarks.bench_xl_to_drawio [node_count ...]
+"""
+import io
+import sys
+import time
+
+from benchmarks.synthetic import generate_plan, plan_to_xl_csv
+from drawio_xl.utils import delete_empty_cols
+from drawio_xl.utils import delete_empty_rows
+from drawio_xl.xl_to_drawio import rename_headers
+from drawio_xl.xl_to_drawio import lower_shape_case
+from drawio_xl.xl_to_drawio import lower_status_case
+from drawio_xl.xl_to_drawio import replace_newlines
+from drawio_xl.xl_to_drawio import save_id
+from drawio_xl.xl_to_drawio import rename_shapes
+from drawio_xl.xl_to_drawio import insert_height_width
+from drawio_xl.xl_to_drawio import parse_decisions
+from drawio_xl.xl_to_drawio import add_frontmatter
+from drawio_xl.xl_to_drawio import prepare_drawio_csv
+
+
+def prepare_drawio_csv_staged(input_stream):
+    """The stage-by-stage pipeline, with a full CSV round-trip between every stage."""
+    for stage in [delete_empty_cols, delete_empty_rows, rename_headers, lower_shape_case, lower_status_case,
+                  replace_newlines, save_id, rename_shapes, insert_height_width, parse_decisions, add_frontmatter]:
+        input_stream = stage(input_stream)
+    return input_stream
+
+
+def best_of(fn, data, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = fn(io.StringIO(data)).getvalue()
+        best = min(best, time.perf_counter() - start)
+    return best, output
+
+
+def main(node_counts, repeat=3):
+    print(f'{"nodes":>8} {"staged s":>10} {"fused s":>10} {"speedup":>8}')
+    for node_count in node_counts:
+        data = plan_to_xl_csv(generate_plan(node_count))
+        staged_time, staged_output = best_of(prepare_drawio_csv_staged, data, repeat)
+        fused_time, fused_output = best_of(prepare_drawio_csv, data, repeat)
+        assert staged_output == fused_output, 'fused output differs from the staged pipeline'
+        print(f'{node_count:>8} {staged_time:>10.3f} {fused_time:>10.3f} {staged_time / fused_time:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000])
@@ -0,0 +1,281 @@
+"""
+Benchmark harness for both pipelines.  For every scenario it generates a synthetic plan, times each
+stage of drawio_to_xl and xl_to_drawio and both end-to-end conversions (best of --repeat), and measures
+the peak traced memory of every stage in a separate pass, so tracing does not slow the timed runs.
+
+A scenario is a node count combined with the generator options: decision density (--decision-every,
+--decision-fanout), extra attribute columns (--attributes), the number of .drawio pages (--pages) and
+plain or compressed pages (--compressed).  xl_to_drawio runs with the native backend, so draw.io does
+not need to be installed and the numbers do not depend on it.
+
+Results can be written as JSON with --output and compared against an earlier results file with
+--compare: every (scenario, pipeline, stage) in both files is listed with its time ratio, and the exit
+status is 1 if any got slower by more than --threshold.
+
+Usage:
+    python -m benchmarks.harness [--nodes N ...] [--decision-every N] [--decision-fanout N]
+        [--attributes N] [--pages N] [--compressed] [--repeat N] [--output FILE]
+        [--compare BASELINE] [--threshold RATIO]
+"""
+import argparse
+import datetime
+import io
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from benchmarks.synthetic import generate_pages, pages_to_drawio, plan_to_xl_csv
+from drawio_xl import drawio_to_xl as drawio_to_xl_module
+from drawio_xl import xl_to_drawio as xl_to_drawio_module
+from drawio_xl.config import Config
+from drawio_xl.config import compile_config
+from drawio_xl.table import Table
+from drawio_xl.utils import write_table
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RESULTS_VERSION = 1
+
+# Stages faster than this are reported but never flagged, their ratios are mostly timer noise
+MIN_COMPARED_SECONDS = 0.001
+
+
+def stage_step(stage, config):
+    """
+    Returns:
+        callable: A step that runs a table stage and passes the table on.
+    """
+    def step(table):
+        stage(table, config)
+        return table
+    return step
+
+
+def drawio_to_xl_steps(config):
+    """
+    Returns:
+        list: The (name, step) pairs of drawio_to_xl.  A step takes the previous step's result and returns its own,
+              starting from the .drawio text and ending with the Excel CSV.
+    """
+    # The replace_ids_with_xl_ids stage closes over this map, which get_id_to_xl_id fills in for each run
+    id_to_xl_id = {}
+
+    def get_id_to_xl_id(table):
+        id_to_xl_id.clear()
+        id_to_xl_id.update(drawio_to_xl_module.get_id_to_xl_id(table))
+        return table
+
+    steps = [
+        ('convert_to_table', lambda text: drawio_to_xl_module.convert_to_table(io.StringIO(text), config)),
+        ('get_id_to_xl_id', get_id_to_xl_id),
+    ]
+    steps += [(name, stage_step(stage, config)) for name, stage in drawio_to_xl_module.get_stages(id_to_xl_id)]
+    steps.append(('write', lambda table: write_table(table.headers, table.rows())))
+    return steps
+
+
+def xl_to_drawio_steps(config):
+    """
+    Returns:
+        list: The (name, step) pairs of xl_to_drawio, from the Excel CSV text to the .drawio output.
+    """
+    steps = [('read', lambda text: Table.read(io.StringIO(text)))]
+    steps += [(name, stage_step(stage, config)) for name, stage in xl_to_drawio_module.get_stages()]
+    steps.append(('add_frontmatter', lambda table: table.write(
+        frontmatter=xl_to_drawio_module.get_frontmatter(table.headers, config))))
+    steps.append(('csv_to_drawio', lambda stream: xl_to_drawio_module.csv_to_drawio(stream, config)))
+    return steps
+
+
+def time_steps(steps, data, repeat):
+    """
+    Returns:
+        dict: The best time of every step in seconds, by step name.
+    """
+    best = {name: float('inf') for name, _ in steps}
+    for _ in range(repeat):
+        value = data
+        for name, step in steps:
+            start = time.perf_counter()
+            value = step(value)
+            best[name] = min(best[name], time.perf_counter() - start)
+    return best
+
+
+def trace_steps(steps, data):
+    """
+    Returns:
+        dict: The peak traced memory of every step in bytes, by step name.  It includes the data the step was
+              given, so it is the memory held at the step's high-water mark.
+    """
+    peaks = {}
+    tracemalloc.start()
+    try:
+        value = data
+        for name, step in steps:
+            tracemalloc.reset_peak()
+            value = step(value)
+            peaks[name] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def time_total(convert, data, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        convert(io.StringIO(data))
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def trace_total(convert, data):
+    tracemalloc.start()
+    try:
+        convert(io.StringIO(data))
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def scenario_name(scenario):
+    return ','.join(f'{key}={value}' for key, value in scenario.items())
+
+
+def run_scenario(scenario, repeat, config):
+    """
+    Generate a scenario's inputs and benchmark both pipelines on them.
+
+    Returns:
+        tuple: The input sizes (dict) and the result entries (list of dicts).
+    """
+    plans = generate_pages(scenario['nodes'], pages=scenario['pages'], decision_every=scenario['decision_every'],
+                           decision_fanout=scenario['decision_fanout'], attribute_count=scenario['attributes'])
+    drawio = pages_to_drawio(plans, compressed=scenario['compressed'])
+    xl_csv = plan_to_xl_csv([step for steps in plans for step in steps])
+
+    name = scenario_name(scenario)
+    results = []
+    pipelines = [
+        ('drawio_to_xl', drawio, drawio_to_xl_steps(config),
+         lambda stream: drawio_to_xl_module.drawio_to_xl(stream, config=config)),
+        ('xl_to_drawio', xl_csv, xl_to_drawio_steps(config),
+         lambda stream: xl_to_drawio_module.xl_to_drawio(stream, config=config)),
+    ]
+    for pipeline, data, steps, convert in pipelines:
+        seconds = time_steps(steps, data, repeat)
+        peaks = trace_steps(steps, data)
+        for stage, _ in steps:
+            results.append({'scenario': name, 'pipeline': pipeline, 'stage': stage,
+                            'seconds': seconds[stage], 'peak_bytes': peaks[stage]})
+        results.append({'scenario': name, 'pipeline': pipeline, 'stage': 'total',
+                        'seconds': time_total(convert, data, repeat), 'peak_bytes': trace_total(convert, data)})
+    sizes = {'drawio_bytes': len(drawio.encode('utf-8')), 'xl_bytes': len(xl_csv.encode('utf-8'))}
+    return sizes, results
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_max_rss_bytes():
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def compare(results, baseline, threshold):
+    """
+    Print the time ratio of every (scenario, pipeline, stage) in both result files.
+
+    Returns:
+        list: The entries that got slower by more than threshold.
+    """
+    baseline_seconds = {(entry['scenario'], entry['pipeline'], entry['stage']): entry['seconds']
+                        for entry in baseline['results']}
+    regressions = []
+    print(f'{"pipeline":<13} {"stage":<24} {"baseline s":>11} {"current s":>10} {"ratio":>7}')
+    for entry in results['results']:
+        key = (entry['scenario'], entry['pipeline'], entry['stage'])
+        if key not in baseline_seconds:
+            continue
+        before = baseline_seconds[key]
+        ratio = entry['seconds'] / before if before else float('inf')
+        regressed = ratio > 1 + threshold and before >= MIN_COMPARED_SECONDS
+        if regressed:
+            regressions.append(entry)
+        print(f'{entry["pipeline"]:<13} {entry["stage"]:<24} {before:>11.4f} {entry["seconds"]:>10.4f} '
+              f'{ratio:>6.2f}x{" slower" if regressed else ""}')
+    return regressions
+
+
+def print_results(results):
+    for name, sizes in results['scenarios'].items():
+        print(f'\n{name} (.drawio {sizes["drawio_bytes"]} bytes, CSV {sizes["xl_bytes"]} bytes)')
+        print(f'{"pipeline":<13} {"stage":<24} {"seconds":>9} {"peak MB":>8}')
+        for entry in results['results']:
+            if entry['scenario'] == name:
+                print(f'{entry["pipeline"]:<13} {entry["stage"]:<24} {entry["seconds"]:>9.4f} '
+                      f'{entry["peak_bytes"] / 2 ** 20:>8.2f}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time every stage of drawio_to_xl and xl_to_drawio on synthetic plans.')
+    parser.add_argument('--nodes', type=int, nargs='+', default=[1000, 10000], help='Node counts, one scenario each')
+    parser.add_argument('--decision-every', type=int, default=10, help='Every Nth step is a decision (0 for none)')
+    parser.add_argument('--decision-fanout', type=int, default=2, help='Branches per decision')
+    parser.add_argument('--attributes', type=int, default=0, help='Extra attribute columns per step')
+    parser.add_argument('--pages', type=int, default=1, help='Pages the .drawio input is split over')
+    parser.add_argument('--compressed', action='store_true', help='Compress the .drawio pages')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement; the best is reported')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--compare', metavar='BASELINE', help='Compare with a results file written by --output')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Slowdown that counts as a regression with --compare, e.g. 0.1 for 10%%')
+    args = parser.parse_args(argv)
+
+    config = compile_config(Config(drawio_backend='native'))
+    results = {'version': RESULTS_VERSION, 'meta': {}, 'scenarios': {}, 'results': []}
+    for nodes in args.nodes:
+        scenario = {'nodes': nodes, 'decision_every': args.decision_every, 'decision_fanout': args.decision_fanout,
+                    'attributes': args.attributes, 'pages': args.pages, 'compressed': args.compressed}
+        sizes, entries = run_scenario(scenario, args.repeat, config)
+        results['scenarios'][scenario_name(scenario)] = sizes
+        results['results'].extend(entries)
+    results['meta'] = {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'git_commit': get_git_commit(),
+        'repeat': args.repeat,
+        'max_rss_bytes': get_max_rss_bytes(),
+    }
+
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print()
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
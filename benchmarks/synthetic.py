@@ -0,0 +1,202 @@
+"""
+Synthetic program plans for the benchmarks.
+
+The generated diagrams look like the ones draw.io produces from our CSV import: a chain of
+process steps where every decision_every-th step is a decision with decision_fanout branches.
+Steps can carry extra attribute columns, and several plans can be rendered as the pages of one
+.drawio file.
+"""
+import base64
+import csv
+import io
+import random
+import urllib.parse
+import zlib
+from xml.sax.saxutils import quoteattr
+
+STATUSES = ['todo', 'doing', 'waiting', 'done', 'stop', '']
+SHAPES = ['process', 'data', 'document', 'subprocess', 'custom 1', 'custom 2']
+DRAWIO_SHAPES = {
+    'process': 'mxgraph.flowchart.process',
+    'data': 'mxgraph.flowchart.data',
+    'document': 'mxgraph.flowchart.document',
+    'subprocess': 'mxgraph.flowchart.predefined_process',
+    'custom 1': 'mxgraph.flowchart.summing_function',
+    'custom 2': 'mxgraph.flowchart.or',
+    'decision': 'mxgraph.flowchart.decision',
+}
+CONNECTOR_STYLE = "endArrow=blockThin;endFill=1;fontSize=11;edgeStyle=orthogonalEdgeStyle;"
+
+
+def generate_plan(node_count, decision_every=10, decision_fanout=2, seed=0, attribute_count=0, first_id=2):
+    """
+    Generate the steps of a synthetic plan.
+
+    Args:
+        node_count (int): The number of process steps.
+        decision_every (int): Every decision_every-th step is a decision (0 disables decisions).
+        decision_fanout (int): The number of branches leaving each decision.
+        seed (int): The random seed, so runs are repeatable.
+        attribute_count (int): The number of extra attribute columns every step carries.
+        first_id (int): The id of the first step.  Plans rendered as pages of one file need distinct ids.
+
+    Returns:
+        list: One dict per step with 'id', 'shape', 'owner', 'description', 'status',
+              'attributes' (a dict of the extra attributes by Excel header) and
+              'next' (a list of (target_id, label) tuples).
+    """
+    rng = random.Random(seed)
+    last_id = first_id + node_count - 1
+    steps = []
+    for i in range(node_count):
+        step_id = str(first_id + i)
+        is_decision = decision_every and i % decision_every == decision_every - 1
+        if is_decision:
+            targets = [str(min(first_id + i + 1 + branch, last_id)) for branch in range(decision_fanout)]
+            next_steps = [(target, f'Option {branch}') for branch, target in enumerate(targets)]
+        elif i + 1 < node_count:
+            next_steps = [(str(first_id + i + 1), '')]
+        else:
+            next_steps = []
+        steps.append({
+            'id': step_id,
+            'shape': 'decision' if is_decision else rng.choice(SHAPES),
+            'owner': rng.choice(['nate', 'alan', '']),
+            'description': f'Step {step_id}: review the <b>design</b> package',
+            'status': rng.choice(STATUSES),
+            'attributes': {f'Attribute {k}': f'A{k}-{step_id}' for k in range(attribute_count)},
+            'next': next_steps,
+        })
+    return steps
+
+
+def generate_pages(node_count, pages=1, **options):
+    """
+    Generate the plans of a multi-page diagram: node_count steps split over pages plans with distinct ids.
+
+    Args:
+        node_count (int): The number of process steps over all pages.
+        pages (int): The number of pages.
+        options: Passed on to generate_plan.
+
+    Returns:
+        list: One list of steps per page.
+    """
+    plans = []
+    first_id = 2
+    for page in range(pages):
+        page_node_count = node_count // pages + (page < node_count % pages)
+        plans.append(generate_plan(page_node_count, seed=page, first_id=first_id, **options))
+        first_id += page_node_count
+    return plans
+
+
+def compress_diagram(graph_model_xml):
+    """
+    Compress an mxGraphModel the way draw.io does: base64(deflate_raw(encodeURIComponent(xml))).
+    """
+    deflater = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    quoted = urllib.parse.quote(graph_model_xml, safe="!*'()").encode('ascii')
+    return base64.b64encode(deflater.compress(quoted) + deflater.flush()).decode('ascii')
+
+
+def plan_to_drawio(steps, compressed=False):
+    """
+    Render synthetic plan steps as a .drawio document.
+
+    Args:
+        steps (list): The steps from generate_plan.
+        compressed (bool): Write the page compressed, as draw.io does by default.
+
+    Returns:
+        str: The .drawio XML.
+    """
+    return pages_to_drawio([steps], compressed)
+
+
+def pages_to_drawio(plans, compressed=False):
+    """
+    Render synthetic plans as the pages of one .drawio document.
+
+    Args:
+        plans (list): One list of steps per page, e.g. from generate_pages.
+        compressed (bool): Write the pages compressed, as draw.io does by default.
+
+    Returns:
+        str: The .drawio XML.
+    """
+    diagrams = []
+    for page, steps in enumerate(plans):
+        graph_model_xml = plan_to_graph_model(steps)
+        diagram = compress_diagram(graph_model_xml) if compressed else graph_model_xml
+        page_id = 'synthetic' if page == 0 else f'synthetic-{page + 1}'
+        diagrams.append(f'  <diagram id="{page_id}" name="Page-{page + 1}">{diagram}</diagram>\n')
+    return f'<mxfile host="Electron">\n{"".join(diagrams)}</mxfile>\n'
+
+
+def plan_to_graph_model(steps):
+    """
+    Render synthetic plan steps as an mxGraphModel.
+
+    Args:
+        steps (list): The steps from generate_plan.
+
+    Returns:
+        str: The mxGraphModel XML.
+    """
+    out = io.StringIO()
+    out.write('<mxGraphModel><root>\n        <mxCell id="0" />\n        <mxCell id="1" parent="0" />\n')
+    # Edge ids follow the last step id, as in a diagram draw.io imported from CSV
+    edge_id = int(steps[-1]['id']) + 1 if steps else 2
+    edges = []
+    for step in steps:
+        out.write(
+            f'        <UserObject label="%description%" owner={quoteattr(step["owner"])} '
+            f'description={quoteattr(step["description"])} status={quoteattr(step["status"])} '
+            + ''.join(f'{header.lower().replace(" ", "_")}={quoteattr(value)} '
+                      for header, value in step.get('attributes', {}).items()) +
+            f'xl_id="{step["id"]}" placeholders="1" id="{step["id"]}">\n'
+            f'          <mxCell style="whiteSpace=wrap;shape={DRAWIO_SHAPES[step["shape"]]};html=1;" parent="1" vertex="1">\n'
+            f'            <mxGeometry width="200" height="100" as="geometry" />\n'
+            f'          </mxCell>\n        </UserObject>\n'
+        )
+        for target, label in step['next']:
+            edges.append((str(edge_id), step['id'], target, label))
+            edge_id += 1
+    for edge_id, source, target, label in edges:
+        out.write(
+            f'        <mxCell id="{edge_id}" value={quoteattr(label)} style="{CONNECTOR_STYLE}" '
+            f'parent="1" source="{source}" target="{target}" edge="1">\n'
+            f'          <mxGeometry relative="1" as="geometry" />\n        </mxCell>\n'
+        )
+    out.write('    </root></mxGraphModel>')
+    return out.getvalue()
+
+
+def plan_to_xl_csv(steps):
+    """
+    Render synthetic plan steps as an Excel CSV export.
+
+    Args:
+        steps (list): The steps from generate_plan.
+
+    Returns:
+        str: The Excel CSV.
+    """
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    attribute_headers = list(steps[0].get('attributes', {})) if steps else []
+    writer.writerow(['Process Step ID', 'Owner', 'Description', 'Status', 'Next Step ID', 'Shape Type', 'Connector Label']
+                    + attribute_headers)
+    for step in steps:
+        separator = ', ' if step['shape'] == 'decision' else ','
+        writer.writerow([
+            step['id'],
+            step['owner'],
+            step['description'],
+            step['status'].upper(),
+            separator.join(target for target, _ in step['next']),
+            step['shape'].title(),
+            separator.join(label for _, label in step['next'] if label),
+        ] + [step['attributes'][header] for header in attribute_headers])
+    return out.getvalue()
@@ -0,0 +1,273 @@
+import concurrent.futures
+import glob
+import os
+import sys
+import time
+
+if __package__:
+    from drawio_xl.instrumentation import get_instrumentation
+    from drawio_xl.profiling import get_profiler
+    from drawio_xl.profiling import profile_call
+else:
+    from instrumentation import get_instrumentation
+    from profiling import get_profiler
+    from profiling import profile_call
+
+GLOB_CHARACTERS = '*?['
+
+
+def is_batch_input(path):
+    """
+    Returns:
+        bool: True if path names a directory or is a glob pattern rather than a single file.
+    """
+    return os.path.isdir(path) or any(character in path for character in GLOB_CHARACTERS)
+
+
+def glob_root(pattern):
+    """
+    Returns:
+        str: The leading directories of a glob pattern that contain no wildcards.
+    """
+    parts = []
+    for part in os.path.dirname(pattern).split(os.sep):
+        if any(character in part for character in GLOB_CHARACTERS):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or os.curdir
+
+
+def find_inputs(paths, extension):
+    """
+    Expand files, directories and glob patterns into the files to convert.
+
+    A directory contributes every file below it ending in extension; a glob contributes its matches.  Each file is
+    paired with its path relative to the directory or the fixed part of the glob, so the output tree can mirror it.
+
+    Args:
+        paths (list): Files, directories or glob patterns (recursive '**' is supported).
+        extension (str): The input file extension used when walking directories, e.g. '.drawio'.
+
+    Returns:
+        list: (input_file, relative_path) tuples, sorted within each path and with duplicates dropped.
+    """
+    inputs = []
+    seen = set()
+
+    def add(input_file, root):
+        key = os.path.abspath(input_file)
+        if key not in seen:
+            seen.add(key)
+            inputs.append((input_file, os.path.relpath(input_file, root)))
+
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, files in sorted(os.walk(path)):
+                for name in sorted(files):
+                    if name.endswith(extension):
+                        add(os.path.join(directory, name), path)
+        elif any(character in path for character in GLOB_CHARACTERS):
+            root = glob_root(path)
+            for input_file in sorted(glob.glob(path, recursive=True)):
+                if os.path.isfile(input_file):
+                    add(input_file, root)
+        else:
+            add(path, os.path.dirname(path) or os.curdir)
+    return inputs
+
+
+def get_output_file(output_dir, relative_path, extension):
+    """
+    Returns:
+        str: The mirrored output path: relative_path under output_dir with its extension replaced.
+    """
+    return os.path.join(output_dir, os.path.splitext(relative_path)[0] + extension)
+
+
+def partial_output_file(output_file):
+    """
+    Returns:
+        str: Where run_one has output_file written until the conversion succeeds, a hidden file next to it.
+    """
+    directory, name = os.path.split(output_file)
+    return os.path.join(directory, f'.{name}.tmp')
+
+
+def run_one(convert, input_file, output_file):
+    """
+    Convert one file, timing it.  Failures are recorded rather than raised so one bad file does not stop a batch.
+
+    The output is written to a temporary file (see partial_output_file) that is renamed to output_file when the
+    conversion succeeds and deleted when it fails, so a failed conversion leaves no partial output behind, nor
+    replaces the output of an earlier run.
+
+    Returns:
+        dict: input_file, output_file, seconds, bytes_in, bytes_out and error (None on success).
+    """
+    os.makedirs(os.path.dirname(output_file) or os.curdir, exist_ok=True)
+    partial_file = partial_output_file(output_file)
+    start = time.perf_counter()
+    error = None
+    try:
+        convert(input_file, partial_file)
+        os.replace(partial_file, output_file)
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+        try:
+            os.remove(partial_file)
+        except OSError:
+            pass
+    seconds = time.perf_counter() - start
+    return {
+        'input_file': input_file,
+        'output_file': output_file,
+        'seconds': seconds,
+        'bytes_in': os.path.getsize(input_file),
+        'bytes_out': os.path.getsize(output_file) if error is None else 0,
+        'error': error,
+    }
+
+
+def run_one_in_worker(convert, input_file, output_file, profile=False):
+    """
+    run_one in a worker process, also returning what was observed of the conversion so the parent process can
+    merge it: the instrumentation records (see instrumentation.py) and, if profile is set, its profile (see
+    profiling.py).
+
+    Returns:
+        tuple: The run_one result, the list of records and the exported profile (None unless profile is set).
+    """
+    instrumentation = get_instrumentation()
+    first_record = len(instrumentation.records) if instrumentation else 0
+    if profile:
+        result, exported_profile = profile_call(run_one, convert, input_file, output_file)
+    else:
+        result, exported_profile = run_one(convert, input_file, output_file), None
+    return result, instrumentation.records[first_record:] if instrumentation else [], exported_profile
+
+
+def convert_on_threads(convert, jobs, threads, profiler):
+    """
+    Convert (input_file, output_file) jobs on up to threads threads of this process, see convert_batch.
+
+    Returns:
+        list: The run_one result of every job, in order.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads or os.cpu_count()) as executor:
+        if profiler is None:
+            futures = [executor.submit(run_one, convert, input_file, output_file) for input_file, output_file in jobs]
+            return [future.result() for future in futures]
+
+        # The profiler only follows the thread that started it, so each file is profiled on its own thread.
+        # Instrumentation records go straight to this process's instrumentation.
+        futures = [executor.submit(profile_call, run_one, convert, input_file, output_file)
+                   for input_file, output_file in jobs]
+        results = []
+        for future in futures:
+            result, exported_profile = future.result()
+            profiler.add(*exported_profile)
+            results.append(result)
+        return results
+
+
+def convert_batch(convert, paths, output_dir, input_extension, output_extension, processes=None, threads=False):
+    """
+    Convert many files in parallel, writing the outputs to a tree under output_dir that mirrors the inputs.
+
+    Files are converted in worker processes, or with threads set on threads of this process.  Threads suit
+    conversions that mostly wait on another program, such as the draw.io CLI: the files then share this process's
+    DrawioPool (see drawio_pool.get_drawio_pool), which bounds how many draw.io processes run at once.  Memory
+    tracing (see instrumentation.py) is turned off while converting on threads.
+
+    Args:
+        convert (callable): convert(input_file, output_file).  It runs in worker processes, so it must be a
+                            module level function.
+        paths (list): Files, directories or glob patterns, see find_inputs.
+        output_dir (str): The root of the output tree.
+        input_extension (str): The extension of the files to pick up from directories.
+        output_extension (str): The extension given to the output files.
+        processes (int, optional): Worker processes, or threads with threads set.  Defaults to one per CPU; 1
+                                   converts in this process, one file at a time.
+        threads (bool): Convert on threads instead of in worker processes.
+
+    Returns:
+        list: The run_one result of every file, in input order.
+    """
+    jobs = [(input_file, get_output_file(output_dir, relative_path, output_extension))
+            for input_file, relative_path in find_inputs(paths, input_extension)]
+
+    if processes == 1 or len(jobs) <= 1:
+        return [run_one(convert, input_file, output_file) for input_file, output_file in jobs]
+
+    instrumentation = get_instrumentation()
+    profiler = get_profiler()
+    if threads:
+        # tracemalloc is process-wide, so with several files converting at once each stage would count the others'
+        # allocations too
+        memory = instrumentation is not None and instrumentation.memory
+        if memory:
+            print('Memory tracing is off while files are converted on threads', file=sys.stderr)
+            instrumentation.memory = False
+        try:
+            return convert_on_threads(convert, jobs, processes, profiler)
+        finally:
+            if memory:
+                instrumentation.memory = True
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        if instrumentation is None and profiler is None:
+            futures = [executor.submit(run_one, convert, input_file, output_file) for input_file, output_file in jobs]
+            return [future.result() for future in futures]
+
+        futures = [executor.submit(run_one_in_worker, convert, input_file, output_file, profiler is not None)
+                   for input_file, output_file in jobs]
+        results = []
+        for future in futures:
+            result, records, exported_profile = future.result()
+            if instrumentation is not None:
+                instrumentation.records.extend(records)
+            if profiler is not None:
+                profiler.add(*exported_profile)
+            results.append(result)
+        return results
+
+
+def format_summary(results, wall_seconds):
+    """
+    Format a per-file timing table followed by totals and throughput.
+
+    Args:
+        results (list): The results from convert_batch.
+        wall_seconds (float): The elapsed time of the whole batch.
+
+    Returns:
+        str: The summary, one line per file.
+    """
+    lines = [f'{"seconds":>9} {"KB in":>9} {"MB/s":>7}  file']
+    for result in results:
+        rate = result['bytes_in'] / result['seconds'] / 1e6 if result['seconds'] else 0
+        status = f'  FAILED {result["error"]}' if result['error'] else ''
+        lines.append(f'{result["seconds"]:>9.3f} {result["bytes_in"] / 1e3:>9.1f} {rate:>7.2f}  '
+                     f'{result["input_file"]}{status}')
+
+    failed = sum(1 for result in results if result['error'])
+    bytes_in = sum(result['bytes_in'] for result in results)
+    busy_seconds = sum(result['seconds'] for result in results)
+    files_per_second = len(results) / wall_seconds if wall_seconds else 0
+    mb_per_second = bytes_in / wall_seconds / 1e6 if wall_seconds else 0
+    lines.append(f'{len(results)} files ({failed} failed), {bytes_in / 1e6:.2f} MB in {wall_seconds:.2f}s wall '
+                 f'({busy_seconds:.2f}s converting): {files_per_second:.1f} files/s, {mb_per_second:.2f} MB/s')
+    return '\n'.join(lines)
+
+
+def run_batch(convert, paths, output_dir, input_extension, output_extension, processes=None, threads=False):
+    """
+    convert_batch followed by printing the summary.  The command line scripts use it when given a directory or glob.
+
+    Returns:
+        list: The run_one result of every file.
+    """
+    start = time.perf_counter()
+    results = convert_batch(convert, paths, output_dir, input_extension, output_extension, processes, threads)
+    print(format_summary(results, time.perf_counter() - start))
+    return results
@@ -0,0 +1,202 @@
+import dataclasses
+import functools
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+
+if __package__:
+    from drawio_xl.config import Config
+    from drawio_xl.config import compile_config
+    from drawio_xl.config import get_compiled_config
+    from drawio_xl.config import load_config
+    from drawio_xl.drawio_pool import get_drawio_backend
+else:
+    from config import Config
+    from config import compile_config
+    from config import get_compiled_config
+    from config import load_config
+    from drawio_pool import get_drawio_backend
+
+# Bump when a code change alters conversion output, so entries written by older code are never returned
+CACHE_VERSION = 1
+
+# Config fields that change how a conversion runs but not what it produces
+NON_OUTPUT_CONFIG_FIELDS = {'drawio_workers', 'drawio_timeout', 'drawio_retries'}
+
+
+def config_fingerprint(config):
+    """
+    Hash the Config fields that affect conversion output: shape mappings and dimensions, header names and
+    order, frontmatter, connector_style and the draw.io backend.  A Config and its CompiledConfig have the
+    same fingerprint.  The backend is hashed as resolved by get_drawio_backend, since 'auto' produces the native
+    emitter's output or draw.io's depending on whether draw.io is installed.
+
+    Returns:
+        str: A hex digest that changes whenever one of those fields does.
+    """
+    if isinstance(config, Config):
+        config = compile_config(config)
+    fields = {field.name: getattr(config, field.name) for field in dataclasses.fields(config)
+              if field.name not in NON_OUTPUT_CONFIG_FIELDS}
+    fields['drawio_backend'] = get_drawio_backend(config)
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, default=_jsonable).encode('utf-8')).hexdigest()
+
+
+def _jsonable(value):
+    # The read-only mappings and the compiled pattern of a CompiledConfig
+    if isinstance(value, re.Pattern):
+        return value.pattern
+    return dict(value)
+
+
+class ConversionCache:
+    """
+    Content-addressed on-disk cache of conversion outputs.
+
+    An entry is keyed on the conversion name, the input bytes and a fingerprint of the Config, so a changed
+    input or a changed shape mapping is a miss.  Entries are files under `directory`; a hit refreshes the
+    file's modification time, and when the store grows past `max_bytes` the least recently used entries are
+    deleted.  Writes go through a temporary file and os.replace, so concurrent batch workers can share a cache.
+
+    Args:
+        directory (str): Where entries are stored.  Created if it does not exist.
+        max_bytes (int): The size the store is trimmed back to after a write.
+        config (Config, optional): The configuration conversions run with, or its CompiledConfig.
+                                   Defaults to get_compiled_config().
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, config=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fingerprint = config_fingerprint(config or get_compiled_config())
+        self.hits = 0
+        self.misses = 0
+        # The store's size is only measured once a write needs it
+        self.size = None
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, conversion, input_bytes):
+        """
+        Returns:
+            str: The cache key of converting input_bytes with the named conversion under this cache's Config.
+        """
+        digest = hashlib.sha256()
+        for part in (str(CACHE_VERSION).encode(), conversion.encode(), self.fingerprint.encode()):
+            digest.update(part + b'\0')
+        digest.update(input_bytes)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Returns:
+            str: The cached output, or None on a miss.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                output = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return output
+
+    def put(self, key, output):
+        """
+        Store an output and evict least recently used entries if the store is over max_bytes.
+        """
+        path = self._path(key)
+        if self.size is None:
+            self.size = sum(stat.st_size for _, stat in self._entries())
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='', dir=os.path.dirname(path),
+                                         suffix='.tmp', delete=False) as f:
+            f.write(output)
+        try:
+            self.size -= os.path.getsize(path)
+        except FileNotFoundError:
+            pass
+        os.replace(f.name, path)
+        self.size += os.path.getsize(path)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        Delete least recently used entries until the store fits in max_bytes.
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[1].st_mtime)
+        self.size = sum(stat.st_size for _, stat in entries)
+        for path, stat in entries:
+            if self.size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= stat.st_size
+
+    def invalidate(self, key=None):
+        """
+        Delete one entry, or every entry when key is None.
+        """
+        paths = [self._path(key)] if key else [path for path, _ in self._entries()]
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.size = None
+
+    def convert(self, conversion, input_stream, convert):
+        """
+        Return the cached output of a conversion, running it and storing the result on a miss.
+
+        Args:
+            conversion (str): The conversion name, e.g. 'drawio_to_xl'.  Part of the key.
+            input_stream (io.StringIO): The conversion input.  It is read in full to compute the key.  A binary
+                                        stream, e.g. an XML file for the parser to decode, is keyed by its bytes.
+            convert (callable): convert(input_stream) -> io.StringIO, run on a miss.
+
+        Returns:
+            io.StringIO: The conversion output.
+        """
+        input_data = input_stream.read()
+        if isinstance(input_data, bytes):
+            key = self.key(conversion, input_data)
+            input_type = io.BytesIO
+        else:
+            key = self.key(conversion, input_data.encode('utf-8'))
+            input_type = io.StringIO
+        output = self.get(key)
+        if output is None:
+            output = convert(input_type(input_data)).getvalue()
+            self.put(key, output)
+        return io.StringIO(output)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _entries(self):
+        for directory, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.tmp'):
+                    path = os.path.join(directory, name)
+                    try:
+                        yield path, os.stat(path)
+                    except FileNotFoundError:
+                        pass
+
+
+@functools.lru_cache(maxsize=None)
+def open_cache(directory, config_file=None):
+    """
+    Returns:
+        ConversionCache: One cache per directory, config file (see config.load_config) and process, so batch
+                         workers do not re-measure the store per file.
+    """
+    return ConversionCache(directory, config=load_config(config_file) if config_file else None)
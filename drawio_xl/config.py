@@ -1,4 +1,26 @@
-from dataclasses import dataclass, field
+import dataclasses
+import functools
+import hashlib
+import json
+import os
+import re
+import tempfile
+import types
+from dataclasses import dataclass, field, fields
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+# Matches the decisionN_id / decisionN_label columns of a draw.io CSV import
+DECISION_HEADER_PATTERN = re.compile(r'decision(\d+)_(id|label)')
+
+# The width and height of a shape that is not in shape_dimensions
+DEFAULT_DIMENSIONS = ('100', '100')
 
 # Define your large string here
 STATIC_FRONTMATTER = """## ******Static Frontmatter*******
@@ -25,6 +47,14 @@ STATIC_FRONTMATTER = """## ******Static Frontmatter*******
 @dataclass
 class Config:
     drawio_path: str = "/Applications/draw.io.app/Contents/MacOS/draw.io"
+    # 'cli' runs the draw.io desktop app, 'native' uses the in-process emitter in mxgraph.py and
+    # 'auto' uses the desktop app when drawio_path exists and the native emitter otherwise
+    drawio_backend: str = "auto"
+    # DrawioPool settings: concurrent draw.io processes (0 = one per CPU), seconds before a conversion
+    # is killed and how many times a failed conversion is retried
+    drawio_workers: int = 0
+    drawio_timeout: float = 120.0
+    drawio_retries: int = 2
     static_frontmatter: str = STATIC_FRONTMATTER
     connector_style: str = "endArrow=blockThin;endFill=1;fontSize=11;edgeStyle=orthogonalEdgeStyle;"
     shape_dimensions: dict = field(default_factory=lambda: {
@@ -59,4 +89,271 @@ class Config:
         'mxgraph.flowchart.terminator': 'end',
         'mxgraph.flowchart.summing_function': 'custom 1',
         'mxgraph.flowchart.or': 'custom 2',
-    })
\ No newline at end of file
+    })
+    # Excel headers with a fixed draw.io name.  Other headers are lowercased with spaces turned to underscores
+    xl_to_drawio_header_mapping: dict = field(default_factory=lambda: {
+        'Process Step ID': 'id',
+        'Shape Type': 'shape',
+        'Connector Label': 'connector_label',
+        'Next Step ID': 'next_step_id',
+    })
+    # The column order of the Excel CSV.  Other columns follow in alphabetical order
+    xl_header_order: list = field(default_factory=lambda: [
+        "Process Step ID", "Owner", "Description", "Status", "Function", "Phase", "Estimated Duration",
+        "Estimated Completion Date", "Notes", "Wbs", "Oqe", "Next Step ID", "Shape Type", "Connector Label",
+    ])
+
+
+@dataclass(frozen=True)
+class CompiledConfig:
+    """
+    The read-only form of a Config that the conversion stages use, built by compile_config.
+
+    The mappings are read-only views, the reverse header mapping and the decision header pattern are
+    precomputed, and the whole object is built once per process (see get_compiled_config) instead of
+    once per stage call.  It has the same drawio_* attributes as Config, so it can be passed wherever a
+    Config selects the draw.io backend or sets up a DrawioPool.
+    """
+    drawio_path: str
+    drawio_backend: str
+    drawio_workers: int
+    drawio_timeout: float
+    drawio_retries: int
+    static_frontmatter: str
+    connector_style: str
+    shape_dimensions: types.MappingProxyType
+    xl_to_drawio_shape_mapping: types.MappingProxyType
+    drawio_to_xl_shape_mapping: types.MappingProxyType
+    xl_to_drawio_header_mapping: types.MappingProxyType
+    drawio_to_xl_header_mapping: types.MappingProxyType
+    xl_header_order: tuple
+    decision_header_pattern: re.Pattern = DECISION_HEADER_PATTERN
+    default_dimensions: tuple = DEFAULT_DIMENSIONS
+
+    def __reduce__(self):
+        # MappingProxyType cannot be pickled, so the mappings travel as dicts
+        return _thaw_compiled_config, (_freeze_compiled_config(self),)
+
+
+def _freeze_compiled_config(config):
+    return {f.name: dict(getattr(config, f.name)) if isinstance(getattr(config, f.name), types.MappingProxyType)
+            else getattr(config, f.name) for f in fields(config)}
+
+
+def _thaw_compiled_config(values):
+    return CompiledConfig(**{name: types.MappingProxyType(value) if isinstance(value, dict) else value
+                             for name, value in values.items()})
+
+
+def compile_config(config):
+    """
+    Returns:
+        CompiledConfig: The compiled form of config.
+    """
+    return CompiledConfig(
+        drawio_path=config.drawio_path,
+        drawio_backend=config.drawio_backend,
+        drawio_workers=config.drawio_workers,
+        drawio_timeout=config.drawio_timeout,
+        drawio_retries=config.drawio_retries,
+        static_frontmatter=config.static_frontmatter,
+        connector_style=config.connector_style,
+        shape_dimensions=types.MappingProxyType(dict(config.shape_dimensions)),
+        xl_to_drawio_shape_mapping=types.MappingProxyType(dict(config.xl_to_drawio_shape_mapping)),
+        drawio_to_xl_shape_mapping=types.MappingProxyType(dict(config.drawio_to_xl_shape_mapping)),
+        xl_to_drawio_header_mapping=types.MappingProxyType(dict(config.xl_to_drawio_header_mapping)),
+        drawio_to_xl_header_mapping=types.MappingProxyType(
+            {drawio_header: xl_header for xl_header, drawio_header in config.xl_to_drawio_header_mapping.items()}),
+        xl_header_order=tuple(config.xl_header_order),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_compiled_config():
+    """
+    Returns:
+        CompiledConfig: The compiled default Config, built on first use and then shared by every conversion in the process.
+    """
+    return compile_config(Config())
+
+
+# Bump when Config or the validation rules change, so compiled files written by older code are rebuilt
+COMPILED_CONFIG_VERSION = 3
+
+
+def validate_config(data, source='config'):
+    """
+    Check the settings read from a config file and build a Config from them.  Settings that are not given
+    keep their defaults; a mapping that is given replaces the default one as a whole.
+
+    Args:
+        data (dict): The parsed TOML or JSON document.
+        source (str): Named in error messages, usually the file name.
+
+    Returns:
+        Config: The validated configuration.
+
+    Raises:
+        ValueError: If a setting is unknown or has the wrong type.
+    """
+    def fail(message):
+        raise ValueError(f'{source}: {message}')
+
+    def is_str_mapping(value):
+        return isinstance(value, dict) and all(isinstance(key, str) and isinstance(item, str) for key, item in value.items())
+
+    if not isinstance(data, dict):
+        fail('expected a table of settings')
+    known = {f.name for f in fields(Config)}
+    for name in data:
+        if name not in known:
+            fail(f'unknown setting {name!r}')
+
+    settings = dict(data)
+    for name in ('drawio_path', 'drawio_backend', 'static_frontmatter', 'connector_style'):
+        if name in settings and not isinstance(settings[name], str):
+            fail(f'{name!r} must be a string')
+    if settings.get('drawio_backend', 'auto') not in ('cli', 'native', 'auto'):
+        fail(f"'drawio_backend' must be 'cli', 'native' or 'auto', not {settings['drawio_backend']!r}")
+    for name in ('drawio_workers', 'drawio_retries'):
+        if name in settings and (type(settings[name]) is not int or settings[name] < 0):
+            fail(f'{name!r} must be a whole number of at least 0')
+    if 'drawio_timeout' in settings:
+        timeout = settings['drawio_timeout']
+        if type(timeout) not in (int, float) or timeout <= 0:
+            fail("'drawio_timeout' must be a number of seconds greater than 0")
+        settings['drawio_timeout'] = float(timeout)
+
+    for name in ('xl_to_drawio_shape_mapping', 'drawio_to_xl_shape_mapping', 'xl_to_drawio_header_mapping'):
+        if name in settings and not is_str_mapping(settings[name]):
+            fail(f'{name!r} must map strings to strings')
+    header_mapping = settings.get('xl_to_drawio_header_mapping', {})
+    if len(set(header_mapping.values())) != len(header_mapping):
+        fail("'xl_to_drawio_header_mapping' maps two Excel headers to the same draw.io header")
+
+    if 'shape_dimensions' in settings:
+        shape_dimensions = settings['shape_dimensions']
+        if not isinstance(shape_dimensions, dict):
+            fail("'shape_dimensions' must map shapes to [width, height]")
+        for shape, dimensions in shape_dimensions.items():
+            if (not isinstance(dimensions, (list, tuple)) or len(dimensions) != 2
+                    or not all(type(value) in (int, float, str) for value in dimensions)):
+                fail(f"'shape_dimensions' entry {shape!r} must be [width, height]")
+        # The stages write the dimensions into the CSV as they are
+        settings['shape_dimensions'] = {shape: (str(width), str(height))
+                                        for shape, (width, height) in shape_dimensions.items()}
+
+    if 'xl_header_order' in settings:
+        header_order = settings['xl_header_order']
+        if not isinstance(header_order, list) or not all(isinstance(header, str) for header in header_order):
+            fail("'xl_header_order' must be a list of strings")
+
+    return Config(**settings)
+
+
+def parse_config(data, path):
+    """
+    Returns:
+        dict: The settings in data, the bytes of the config file at path.  The format follows the
+              extension: .toml or .json.
+
+    Raises:
+        ValueError: If the format is unknown or the file does not parse.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        if extension == '.json':
+            return json.loads(data.decode('utf-8'))
+        if extension == '.toml':
+            if tomllib is None:
+                raise ValueError('reading TOML needs Python 3.11 or the tomli package')
+            return tomllib.loads(data.decode('utf-8'))
+    except (UnicodeDecodeError, json.JSONDecodeError, getattr(tomllib, 'TOMLDecodeError', ValueError)) as e:
+        raise ValueError(f'{path}: {e}') from None
+    raise ValueError(f'{path}: config files must be .toml or .json')
+
+
+def compiled_config_path(path):
+    """
+    Returns:
+        str: Where the compiled form of the config file at path is cached, a hidden file next to it.
+    """
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f'.{name}.compiled')
+
+
+def load_config(path):
+    """
+    Load a TOML or JSON config file (see validate_config) and return its compiled form.
+
+    The file is only parsed when it has changed.  Its validated settings are saved as JSON next to it (see
+    compiled_config_path) together with the file's modification time, size and SHA-256: when the modification
+    time and size still match they are used without reading the file, and when only the modification time moved
+    but the content hash matches they are used as well.  Saved settings are validated again as they are loaded,
+    and only a file owned by the current user and writable by no one else is trusted, since the settings name
+    the draw.io program that is run.  Within a process a file is loaded once per modification.
+
+    Returns:
+        CompiledConfig: The compiled configuration.
+
+    Raises:
+        OSError: If the file cannot be read.
+        ValueError: If the file is not a valid config file.
+    """
+    stat = os.stat(path)
+    return _load_config(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=16)
+def _load_config(path, mtime_ns, size):
+    cache_path = compiled_config_path(path)
+    entry = _read_compiled_config(cache_path)
+
+    if entry is not None and (entry['mtime_ns'], entry['size']) == (mtime_ns, size):
+        return compile_config(validate_config(entry['settings'], source=cache_path))
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    if entry is not None and entry['sha256'] == digest:
+        config = validate_config(entry['settings'], source=cache_path)
+    else:
+        config = validate_config(parse_config(data, path), source=path)
+
+    _write_compiled_config(cache_path, {
+        'version': COMPILED_CONFIG_VERSION, 'mtime_ns': mtime_ns, 'size': size, 'sha256': digest,
+        'settings': dataclasses.asdict(config),
+    })
+    return compile_config(config)
+
+
+def _read_compiled_config(cache_path):
+    # A missing, unreadable, truncated, outdated or untrusted compiled file is rebuilt
+    try:
+        with open(cache_path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_mode & 0o022 or (hasattr(os, 'getuid') and stat.st_uid != os.getuid()):
+                return None
+            entry = json.loads(f.read().decode('utf-8'))
+    except (OSError, ValueError):
+        return None
+    if (not isinstance(entry, dict) or entry.get('version') != COMPILED_CONFIG_VERSION
+            or not {'mtime_ns', 'size', 'sha256', 'settings'} <= entry.keys()):
+        return None
+    return entry
+
+
+def _write_compiled_config(cache_path, entry):
+    # Written through a temporary file (created readable and writable by its owner only) and os.replace, so
+    # concurrent batch jobs never read half a file.  A directory that cannot be written only costs the next
+    # invocation a re-parse.
+    try:
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=os.path.dirname(cache_path), suffix='.tmp',
+                                         delete=False) as f:
+            json.dump(entry, f)
+    except OSError:
+        return
+    try:
+        os.replace(f.name, cache_path)
+    except OSError:
+        os.unlink(f.name)
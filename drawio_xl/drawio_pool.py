@@ -0,0 +1,231 @@
+import atexit
+import concurrent.futures
+import io
+import os
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+
+if __package__:
+    from drawio_xl.config import get_compiled_config
+    from drawio_xl.mxgraph import csv_to_mxfile
+else:
+    from config import get_compiled_config
+    from mxgraph import csv_to_mxfile
+
+
+def get_drawio_backend(config):
+    """
+    Resolve Config.drawio_backend to 'cli' or 'native'.  'auto' picks the draw.io desktop app when it is installed.
+
+    Raises:
+        ValueError: If drawio_backend is not 'cli', 'native' or 'auto'.
+    """
+    backend = config.drawio_backend
+    if backend == 'auto':
+        return 'cli' if os.path.exists(config.drawio_path) else 'native'
+    if backend not in ('cli', 'native'):
+        raise ValueError(f"Unknown drawio_backend '{backend}', expected 'cli', 'native' or 'auto'")
+    return backend
+
+
+def get_drawio_command(config, input_file, output_file):
+    """
+    Returns:
+        list: The draw.io command line that converts the CSV import in input_file to XML in output_file.
+    """
+    return [config.drawio_path, "-x", input_file, "-f", "xml", "-o", output_file]
+
+
+class DrawioPoolClosed(RuntimeError):
+    """Raised when a job is submitted to, or cancelled by, a DrawioPool that is shutting down."""
+
+
+def kill_process_tree(process):
+    """
+    Kill a draw.io process and the helper processes Electron starts.  On POSIX the process leads its own
+    process group (see DrawioPool._run_drawio), so the whole group is killed.
+    """
+    if os.name == 'posix':
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    else:
+        process.kill()
+
+
+class DrawioPool:
+    """
+    Run csv_to_drawio conversions concurrently with a bounded number of draw.io processes.
+
+    The draw.io CLI has no long-running server mode, so each conversion is still a draw.io process, but at most
+    `workers` run at once and the queue of waiting jobs is fed to them as they finish.  A conversion that runs
+    longer than `timeout` seconds is killed; failed or timed out conversions are retried up to `retries` times
+    with a linear backoff.  When the native backend is selected (see Config.drawio_backend) jobs run the
+    in-process emitter instead.
+
+    Use it as a context manager so it is always shut down:
+
+        with DrawioPool() as pool:
+            for output_stream in pool.map(input_streams):
+                ...
+
+    Args:
+        config (CompiledConfig, optional): drawio_path, drawio_backend and the pool defaults.  A Config works too.
+                                           Defaults to get_compiled_config().
+        workers (int, optional): Concurrent conversions.  Defaults to config.drawio_workers, or one per CPU.
+        timeout (float, optional): Seconds before a conversion is killed.  Defaults to config.drawio_timeout.
+        retries (int, optional): Extra attempts for a failed conversion.  Defaults to config.drawio_retries.
+        backoff (float): Seconds to wait before the first retry; the n-th retry waits n times as long.
+    """
+
+    def __init__(self, config=None, workers=None, timeout=None, retries=None, backoff=1.0):
+        self.config = config or get_compiled_config()
+        self.workers = workers or self.config.drawio_workers or os.cpu_count() or 1
+        self.timeout = self.config.drawio_timeout if timeout is None else timeout
+        self.retries = self.config.drawio_retries if retries is None else retries
+        self.backoff = backoff
+        self.backend = get_drawio_backend(self.config)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='drawio')
+        self._processes = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._cancelled = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Finish queued work on a normal exit, abandon it if the block raised
+        self.shutdown(wait=True, cancel=exc_type is not None)
+        return False
+
+    def submit(self, input_stream):
+        """
+        Queue a conversion.
+
+        Args:
+            input_stream (io.StringIO): The draw.io CSV import, frontmatter included.
+
+        Returns:
+            concurrent.futures.Future: Resolves to an io.StringIO with the .drawio XML, or raises the last
+            subprocess.CalledProcessError / subprocess.TimeoutExpired once the retries are used up.
+        """
+        if self._closed:
+            raise DrawioPoolClosed('DrawioPool has been shut down')
+        return self._executor.submit(self._convert, input_stream.read())
+
+    def map(self, input_streams):
+        """
+        Convert every stream, yielding the results in input order.
+        """
+        futures = [self.submit(input_stream) for input_stream in input_streams]
+        for future in futures:
+            yield future.result()
+
+    def shutdown(self, wait=True, cancel=False):
+        """
+        Stop accepting jobs.
+
+        Args:
+            wait (bool): Block until running conversions have finished.
+            cancel (bool): Drop queued jobs and kill the draw.io processes that are running.
+        """
+        self._closed = True
+        if cancel:
+            with self._lock:
+                self._cancelled = True
+                processes = list(self._processes)
+            for process in processes:
+                kill_process_tree(process)
+        self._executor.shutdown(wait=wait, cancel_futures=cancel)
+
+    def _convert(self, csv_text):
+        if self.backend == 'native':
+            return csv_to_mxfile(io.StringIO(csv_text))
+
+        for attempt in range(self.retries + 1):
+            if self._cancelled:
+                raise DrawioPoolClosed('DrawioPool was shut down before the conversion started')
+            try:
+                return self._run_drawio(csv_text)
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+                # A process killed by shutdown(cancel=True) is not retried
+                if self._cancelled:
+                    raise DrawioPoolClosed('DrawioPool was shut down during the conversion')
+                if attempt == self.retries:
+                    raise
+            time.sleep(self.backoff * (attempt + 1))
+
+    def _run_drawio(self, csv_text):
+        with tempfile.TemporaryDirectory(prefix='drawio_pool_') as directory:
+            input_file = os.path.join(directory, 'input.csv')
+            output_file = os.path.join(directory, 'output.drawio')
+            with open(input_file, 'w') as f:
+                f.write(csv_text)
+
+            command = get_drawio_command(self.config, input_file, output_file)
+            # Started and registered under the lock, so shutdown(cancel=True) either finds the process to kill or
+            # has already cancelled and it is never started
+            with self._lock:
+                if self._cancelled:
+                    raise DrawioPoolClosed('DrawioPool was shut down before the conversion started')
+                process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                           start_new_session=os.name == 'posix')
+                self._processes.add(process)
+            try:
+                stdout, stderr = process.communicate(timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                kill_process_tree(process)
+                process.communicate()
+                raise
+            finally:
+                with self._lock:
+                    self._processes.discard(process)
+
+            if process.returncode:
+                raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+            with open(output_file) as f:
+                return io.StringIO(f.read())
+
+
+# The shared pools of this process, one per set of draw.io settings (see get_drawio_pool)
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_drawio_pool(config):
+    """
+    Return this process's DrawioPool for config's draw.io settings, starting it on first use.  csv_to_drawio runs
+    the 'cli' backend through it, so every conversion in the process, including the files of a batch, shares its
+    bounded number of draw.io processes, timeouts and retries.  The pools are shut down when the process exits.
+
+    Args:
+        config (CompiledConfig): drawio_path, drawio_backend and the pool settings.  A Config works too.
+
+    Returns:
+        DrawioPool: The shared pool.
+    """
+    key = (config.drawio_path, config.drawio_backend, config.drawio_workers, config.drawio_timeout,
+           config.drawio_retries)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            if not _pools:
+                atexit.register(shutdown_drawio_pools)
+            pool = _pools[key] = DrawioPool(config)
+        return pool
+
+
+def shutdown_drawio_pools(cancel=False):
+    """
+    Shut down the pools started by get_drawio_pool, see DrawioPool.shutdown.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True, cancel=cancel)
@@ -1,19 +1,149 @@
 import argparse
-import csv
+import codecs
+import base64
+import concurrent.futures
+import functools
+import re
+import urllib.parse
+import zlib
 import xml.etree.ElementTree as ET
 import sys
 import io
 import os
 
-if __name__ == '__main__':
+# __mp_main__ is the name the script gets when process pool workers re-import it, and a module imported
+# by another script (no __package__) needs the same sibling imports
+if __name__ in ['__main__', '__mp_main__'] or not __package__:
     from utils import delete_column
+    from utils import delete_column_stage
     from utils import get_max_decision_count_from_headers
-    from config import Config
+    from utils import read_table
+    from table import Table
+    from table import SparseColumn
+    from utils import get_decision_branches
+    from utils import get_decision_columns
+    from utils import write_table
+    from utils import write_csv
+    from utils import copy_output
+    from utils import run_stages
+    from utils import apply_stage
+    from utils import observer_enabled
+    from observers import DirectorySink
+    from batch import is_batch_input
+    from batch import run_batch
+    from cache import open_cache
+    from config import get_compiled_config
+    from config import load_config
+    from instrumentation import METRICS_ENV_VAR
+    from instrumentation import METRICS_MEMORY_ENV_VAR
+    from instrumentation import enable_instrumentation
+    from instrumentation import instrument
+    from instrumentation import instrument_pipeline
+    from profiling import start_profiling
+    from encoding import open_xml_input
+    from encoding import open_output
+    from encoding import DEFAULT_CHUNK_SIZE
+    from encoding import STDOUT
 else:
     from drawio_xl.utils import delete_column
+    from drawio_xl.utils import delete_column_stage
     from drawio_xl.utils import get_max_decision_count_from_headers
-    from drawio_xl.config import Config
+    from drawio_xl.utils import read_table
+    from drawio_xl.table import Table
+    from drawio_xl.table import SparseColumn
+    from drawio_xl.utils import get_decision_branches
+    from drawio_xl.utils import get_decision_columns
+    from drawio_xl.utils import write_table
+    from drawio_xl.utils import write_csv
+    from drawio_xl.utils import copy_output
+    from drawio_xl.utils import run_stages
+    from drawio_xl.utils import apply_stage
+    from drawio_xl.utils import observer_enabled
+    from drawio_xl.observers import DirectorySink
+    from drawio_xl.batch import is_batch_input
+    from drawio_xl.batch import run_batch
+    from drawio_xl.cache import open_cache
+    from drawio_xl.config import get_compiled_config
+    from drawio_xl.config import load_config
+    from drawio_xl.instrumentation import METRICS_ENV_VAR
+    from drawio_xl.instrumentation import METRICS_MEMORY_ENV_VAR
+    from drawio_xl.instrumentation import enable_instrumentation
+    from drawio_xl.instrumentation import instrument
+    from drawio_xl.instrumentation import instrument_pipeline
+    from drawio_xl.profiling import start_profiling
+    from drawio_xl.encoding import open_xml_input
+    from drawio_xl.encoding import open_output
+    from drawio_xl.encoding import DEFAULT_CHUNK_SIZE
+    from drawio_xl.encoding import STDOUT
+
+
+def percent_decode(data):
+    """
+    Decode percent escapes in bytes, like urllib.parse.unquote_to_bytes but much faster.
 
+    encodeURIComponent escapes every backslash, so the escapes can be rewritten as \\xNN and
+    decoded by the unicode_escape codec, which runs in C.  Anything else falls back to
+    unquote_to_bytes.
+
+    Parameters:
+    data (bytes): The percent-encoded data.
+
+    Returns:
+    bytes: The decoded data.
+    """
+    if b'\\' not in data:
+        try:
+            return data.replace(b'%', b'\\x').decode('unicode_escape').encode('latin-1')
+        except UnicodeError:
+            pass
+    return urllib.parse.unquote_to_bytes(data)
+
+def inflate_diagram(text, chunk_size=65536):
+    """
+    Decode the content of a compressed draw.io <diagram> element.
+
+    draw.io compresses a page as base64(deflate_raw(encodeURIComponent(xml))).  The payload is decoded
+    chunk by chunk, so the inflated XML is never held in memory as a whole.
+
+    Parameters:
+    text (str): The text of the <diagram> element.
+    chunk_size (int): The number of base64 characters to decode at a time.
+
+    Returns:
+    generator: Chunks of the UTF-8 encoded mxGraphModel XML (bytes).
+    """
+    encoded = ''.join(text.split())
+    # Keep chunks aligned to whole base64 quanta
+    chunk_size -= chunk_size % 4
+    inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+    carry = b''
+    for start in range(0, len(encoded), chunk_size):
+        data = carry + inflater.decompress(base64.b64decode(encoded[start:start + chunk_size]))
+        # Hold back a percent escape that is split across chunks
+        split = data.rfind(b'%', max(len(data) - 2, 0))
+        if split != -1:
+            data, carry = data[:split], data[split:]
+        else:
+            carry = b''
+        yield percent_decode(data)
+    yield percent_decode(carry + inflater.flush())
+
+def iterparse_compressed_diagram(text):
+    """
+    Parse the content of a compressed draw.io <diagram> element incrementally.
+
+    Parameters:
+    text (str): The text of the <diagram> element.
+
+    Returns:
+    generator: ('start' | 'end', element) events, like ElementTree.iterparse.
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    for chunk in inflate_diagram(text):
+        parser.feed(chunk)
+        yield from parser.read_events()
+    parser.close()
+    yield from parser.read_events()
 
 def convert_to_csv(input_stream):
     """
@@ -21,23 +151,52 @@ def convert_to_csv(input_stream):
 
     This function parses a draw.io (XML) file from the provided input stream, 
     extracts shapes, shape properties, and relationships.  It returns a draw.io 
-    formatted CSV string without frontmatter.
+    formatted CSV string without frontmatter.  Both plain and compressed diagrams
+    are supported.
 
     Parameters:
-    input_stream (io.TextIOWrapper): The input stream from which to read the draw.io XML file.
+    input_stream (io.TextIOWrapper): The input stream from which to read the draw.io XML file, as text or as bytes
+                                     for the XML parser to decode (see encoding.open_xml_input).
     
-    The function uses the xml.etree.ElementTree module to parse the XML file. 
+    The function uses xml.etree.ElementTree.iterparse to stream the XML file.
 
     Returns:
     io.StringIO: The draw.io formatted CSV stream without frontmatter.
     """
-    # Load and parse the XML
-    tree = ET.parse(input_stream)
-    root = tree.getroot()
-    
-    #create config instance
-    config = Config()
+    return convert_to_table(input_stream).write()
+
+def convert_to_rows(input_stream):
+    """
+    Convert a .drawio (XML) file to in-memory draw.io CSV rows.
+
+    Parameters:
+    input_stream (io.TextIOWrapper): The input stream from which to read the draw.io XML file, as text or as bytes
+                                     for the XML parser to decode (see encoding.open_xml_input).
+
+    Returns:
+    tuple: The sorted fieldnames (list of str) and one row (list of str) per shape.
+    """
+    table = convert_to_table(input_stream)
+    return table.headers, [list(row) for row in table.rows()]
+
+def convert_to_table(input_stream, config=None):
+    """
+    Convert a .drawio (XML) file to a column-oriented Table of draw.io CSV data.
+
+    This is the in-memory counterpart of convert_to_csv and is used by the fused
+    drawio_to_xl pipeline so the diagram is never serialized to CSV until the end.
+
+    Parameters:
+    input_stream (io.TextIOWrapper): The input stream from which to read the draw.io XML file, as text or as bytes
+                                     for the XML parser to decode (see encoding.open_xml_input).
+    config (CompiledConfig): Optional configuration.  Defaults to get_compiled_config().
+
+    Returns:
+    Table: One column per sorted fieldname and one row per shape.
+    """
+    config = config or get_compiled_config()
     shape_dimensions = config.shape_dimensions
+    default_dimensions = config.default_dimensions
     # Required fields that will be built from any diagram are
     # id, shape, width, height, next_step_id, decisionN_id, decisionN_label, xl_id
 
@@ -67,86 +226,100 @@ def convert_to_csv(input_stream):
             return style[start:end]
         return 'unknown'
 
-    # Extract nodes
+    def extract_node(element):
+        mxcell = element.find('.//mxCell')
+        if mxcell is not None and 'style' in mxcell.attrib:
+            style = mxcell.get('style', '')
+            shape = parse_shape(style)
+
+            # add some required fields
+            details = {
+                'id': element.get('id'),
+                'shape': shape,
+                'width': shape_dimensions.get(shape, default_dimensions)[0],
+                'height': shape_dimensions.get(shape, default_dimensions)[1],
+                'xl_id': element.get('xl_id', element.get('id')), # default to the id if no xl_id is present
+            }
+
+            # add all the other properties from the element
+            for property in element.keys():
+                if property not in ['id', 'shape', 'width', 'height', 'xl_id'] and property not in ignored_properties:
+                    details[property] = element.get(property)
+                    fieldnames.add(property)
+            
+            nodes.append(details)
+
+    # Stream the XML.  Each UserObject (node) and edge mxCell is extracted as soon as its end tag
+    # is parsed and is then dropped from the tree, so memory is proportional to the number of
+    # nodes and edges rather than to the size of the document.
     nodes = []
-    for element in root.iter():
-        if element.tag.endswith('UserObject'):
-            mxcell = element.find('.//mxCell')
-            if mxcell is not None and 'style' in mxcell.attrib:
-                style = mxcell.get('style', '')
-                shape = parse_shape(style)
-
-                # add some required fields
-                details = {
-                    'id': element.get('id'),
-                    'shape': shape,
-                    'width': shape_dimensions.get(shape, ('100', '100'))[0], # default to 100 if the shape is not found
-                    'height': shape_dimensions.get(shape, ('100', '100'))[1], # default to 100 if the shape is not found
-                    'xl_id': element.get('xl_id', element.get('id')), # default to the id if no xl_id is present
-                }
-
-                # add all the other properties from the element
-                for property in element.keys():
-                    if property not in ['id', 'shape', 'width', 'height', 'xl_id'] and property not in ignored_properties:
-                        details[property] = element.get(property)
-                        fieldnames.add(property)
-                
-                nodes.append(details)
-
-    # Extract edges
-    edges = []
-    for element in root.iter():
-        if element.tag.endswith('mxCell') and 'edge' in element.attrib:
-            edges.append({
-                'source': element.get('source'),
-                'target': element.get('target'),
-                'label': element.get('value', '').strip()
-            })
-
-    # Determine max_decision_count based on connections to decision nodes
-    max_decision_count = 0
-    for node in nodes:
-        connected_edges = [edge for edge in edges if edge['source'] == node['id']]
-        decision_count = 0
+    # Edges are indexed by source id so each node's edges are found in O(1).
+    # Edges keep their document order within each source.
+    edges_by_source = {}
+
+    def process_events(events):
+        open_elements = []
+        open_user_objects = 0
+        for event, element in events:
+            tag = element.tag
+            if event == 'start':
+                open_elements.append(element)
+                if tag.endswith('UserObject'):
+                    open_user_objects += 1
+                continue
+
+            open_elements.pop()
+            if tag.endswith('UserObject'):
+                open_user_objects -= 1
+                extract_node(element)
+            elif tag.endswith('mxCell'):
+                if 'edge' in element.attrib:
+                    edges_by_source.setdefault(element.get('source'), []).append({
+                        'source': element.get('source'),
+                        'target': element.get('target'),
+                        'label': element.get('value', '').strip()
+                    })
+            elif tag.endswith('diagram'):
+                # A compressed page has no children, just the encoded mxGraphModel as text
+                if len(element) == 0 and element.text and element.text.strip():
+                    process_events(iterparse_compressed_diagram(element.text))
+                    element.text = None
+                continue
+            elif not tag.endswith('object'):
+                continue
+
+            # A cell that has been handled is always the last child of its parent.  Cells inside a
+            # UserObject are kept until the UserObject itself is extracted.
+            if open_elements and not open_user_objects:
+                del open_elements[-1][-1]
+
+    process_events(ET.iterparse(input_stream, events=('start', 'end')))
+
+    # Assign relationships.  A decision's edges are kept as a sparse edge list, one entry per decision
+    # node, and become one decisionN_id / decisionN_label column pair per branch
+    branches = {}
+    for row_index, node in enumerate(nodes):
+        connected_edges = edges_by_source.get(node['id'], [])
+        if node['shape'] == 'mxgraph.flowchart.decision':
+            if connected_edges:
+                branches[row_index] = [(edge['target'] or '', edge['label']) for edge in connected_edges]
+            continue
         for edge in connected_edges:
-            if node['shape'] == 'mxgraph.flowchart.decision':
-                decision_count += 1
-        # Update max_decision_count if necessary
-        max_decision_count = max(max_decision_count, decision_count)
-
-    # Add decision fields to fieldnames
-    for i in range(max_decision_count):
-        fieldnames.add(f'decision{i}_id')
-        fieldnames.add(f'decision{i}_label')
-
-    # Assign relationships
-    for node in nodes:
-        connected_edges = [edge for edge in edges if edge['source'] == node['id']]
-        decision_count = 0
-        for edge in connected_edges:
-            if node['shape'] == 'mxgraph.flowchart.decision' and decision_count < max_decision_count:
-                decision_key_id = f'decision{decision_count}_id'
-                decision_key_label = f'decision{decision_count}_label'
-                node[decision_key_id] = edge['target']
-                node[decision_key_label] = edge['label']
-                decision_count += 1
-            elif node['shape'] != 'mxgraph.flowchart.decision':
-                if 'next_step_id' in node and node['next_step_id']:
-                    node['next_step_id'] += ',' + edge['target']
-                else:
-                    node['next_step_id'] = edge['target']
-
-    output = io.StringIO()
+            if 'next_step_id' in node and node['next_step_id']:
+                node['next_step_id'] += ',' + edge['target']
+            else:
+                node['next_step_id'] = edge['target']
+
+    decision_columns = dict(get_decision_columns(branches, len(nodes)))
+    fieldnames.update(decision_columns)
+
     # Sort the fieldnames for consistency in the output for testing
     fieldnames = sorted(list(fieldnames))
-    writer = csv.DictWriter(output, fieldnames=fieldnames, lineterminator='\n')
-    writer.writeheader()
-    for node in nodes:
-        writer.writerow({key: node.get(key, '') for key in fieldnames})
-    # Add a newline
-    #output.write('\n') #deleted because this is not needed.
-    output.seek(0)
-    return output
+    # Missing attributes (e.g. a UserObject without an id) are written as empty strings, as csv.DictWriter did.
+    # The columns are built straight from the nodes, without going through rows.
+    columns = [decision_columns[key] if key in decision_columns else [node.get(key) or '' for node in nodes]
+               for key in fieldnames]
+    return Table(fieldnames, columns, len(nodes))
 
 def strip_front_matter(input_stream):
     """
@@ -167,6 +340,17 @@ def strip_front_matter(input_stream):
     output_stream.seek(0)
     return output_stream
 
+def delete_height_width_stage(table, config=None):
+    """
+    Table stage that removes the 'height' and 'width' columns.
+
+    Args:
+    table (Table): The table.
+    config (CompiledConfig): Unused.
+    """
+    for column_name in ["height", "width"]:
+        delete_column_stage(table, column_name)
+
 def delete_height_width(input_stream):
     """
     Remove the 'height' and 'width' columns from the CSV content.
@@ -181,9 +365,79 @@ def delete_height_width(input_stream):
     Returns:
     io.StringIO: The CSV content without the 'height' and 'width' columns.
     """
-    csv_content = delete_column(input_stream, "height")
-    csv_content = delete_column(csv_content, "width")
-    return csv_content
+    return apply_stage(input_stream, delete_height_width_stage)
+
+def get_id_to_xl_id(table):
+    """
+    Build the map from draw.io 'id' to 'xl_id'.  If the 'xl_id' column is empty in ANY row, every id maps to itself.
+
+    Args:
+    table (Table): The table, with every row.
+
+    Returns:
+    dict: The map from 'id' to the id that should replace it.
+    """
+    ids = table.column("id")
+    xl_ids = table.column("xl_id")
+
+    # If any xl_id is empty, keep the original id for all rows
+    # otherwise, replace the id with the corresponding xl_id
+    if not all(xl_ids):
+        return dict(zip(ids, ids))
+    return dict(zip(ids, xl_ids))
+
+class IdRemap(dict):
+    """
+    The id to xl_id map, looked up with one dict access per cell.
+
+    A cell holding a single known id is found directly.  Any other cell, a comma-separated list of ids or an
+    unknown id, is remapped id by id the first time it is seen (unknown ids are dropped) and the result is
+    stored, so a repeated cell is not split and joined again.
+
+    Args:
+        id_to_xl_id (dict): The map built by get_id_to_xl_id.
+    """
+    __slots__ = ('id_to_xl_id',)
+
+    def __init__(self, id_to_xl_id):
+        super().__init__(id_to_xl_id)
+        self.id_to_xl_id = id_to_xl_id
+
+    def __missing__(self, ids):
+        id_to_xl_id = self.id_to_xl_id
+        value = self[ids] = ','.join([id_to_xl_id[id] for id in ids.split(',') if id in id_to_xl_id])
+        return value
+
+def get_id_headers(table, config=None):
+    """
+    Returns:
+    list: The headers of the columns holding id lists: 'next_step_id' and every 'decisionN_id', in column order.
+    """
+    config = config or get_compiled_config()
+    pattern = config.decision_header_pattern
+    # A duplicated header names one column, the first, as everywhere else
+    return list(dict.fromkeys(header for header in table.headers
+                              if header == 'next_step_id' or ((match := pattern.fullmatch(header)) and match.group(2) == 'id')))
+
+def replace_ids_with_xl_ids_stage(table, id_to_xl_id, config=None):
+    """
+    Table stage that replaces the 'id', 'next_step_id' and every 'decisionN_id' value using id_to_xl_id.
+
+    The id-bearing columns are found once from the headers and each is remapped with a single map over the
+    column through an IdRemap, so a cell costs one dict lookup.  Decision columns are sparse and only their
+    decision rows are visited.
+
+    Args:
+    table (Table): The table.
+    id_to_xl_id (dict): The map built by get_id_to_xl_id.
+    config (CompiledConfig): Supplies decision_header_pattern.  Defaults to get_compiled_config().
+    """
+    # Replace the "id" with the corresponding "xl_id"
+    table.map_column("id", id_to_xl_id.__getitem__)
+
+    remap = IdRemap(id_to_xl_id).__getitem__
+    for header in get_id_headers(table, config):
+        table.map_column(header, remap)
 
 def replace_ids_with_xl_ids(input_stream):
     """
@@ -199,64 +453,9 @@ def replace_ids_with_xl_ids(input_stream):
     Returns:
     io.StringIO: The CSV content with the 'id' column renamed to 'xl_id' and 'id' column values with 'xl_id' column values.
     """
-    reader = csv.reader(input_stream)
-    output_stream = io.StringIO()
-    
-    # Get the headers from the first row
-    headers = next(reader)
-    # Find the index of the "id" and "xl_id" columns
-    id_index = headers.index("id")
-    xl_id_index = headers.index("xl_id")
-
-    # Create a dictionary to map "id" to "xl_id"
-    id_to_xl_id = {}
-
-    # Create a list to store the rows
-    rows = []
-
-    # Iterate over the rows in the original CSV file if ANY xl_id is empty, set xl_id_empty = true
-    xl_id_empty = False
-    for row in reader:
-        if not row[xl_id_index]:
-            xl_id_empty = True
-        rows.append(row)
-    
-    # If any xl_id is empty, keep the original id for all rows
-    # otherwise, replace the id with the corresponding xl_id
-    if xl_id_empty:
-        for row in rows:
-            id_to_xl_id[row[id_index]] = row[id_index]
-            #row[id_index] = row[id_index]
-    else:
-        for row in rows:
-            id_to_xl_id[row[id_index]] = row[xl_id_index]
-            #row[id_index] = row[xl_id_index]
-
-    # Create a CSV writer
-    writer = csv.writer(output_stream, lineterminator='\n')
-    # Write the headers to the output
-    writer.writerow(headers)
-
-    # Iterate over the rows again
-    for row in rows:
-        # Replace the "id" with the corresponding "xl_id"
-        row[id_index] = id_to_xl_id[row[id_index]]
-
-        # Replace the "next_step_id", "decision0_id", "decision1_id", and "decision2_id" with the corresponding "xl_id"
-        for header in ["next_step_id", "decision0_id", "decision1_id", "decision2_id"]:
-            if header in headers:
-                index = headers.index(header)
-                # Handle the case where the cell contains a comma-separated list of ids
-                ids = row[index].split(',')
-                xl_ids = [id_to_xl_id[id] for id in ids if id in id_to_xl_id]
-                row[index] = ','.join(xl_ids)
-
-        # Write the modified row to the new CSV file
-        writer.writerow(row)
-    
-    output_stream.seek(0)
-
-    return output_stream
+    table = Table.read(input_stream)
+    replace_ids_with_xl_ids_stage(table, get_id_to_xl_id(table))
+    return table.write()
 
 def delete_xl_ids(input_stream):
     """
@@ -273,6 +472,19 @@ def delete_xl_ids(input_stream):
     """
     return delete_column(input_stream, "xl_id")
 
+def rename_shapes_stage(table, config):
+    """
+    Table stage that maps draw.io shape names to their Visio equivalents.
+
+    Args:
+    table (Table): The table.
+    config (CompiledConfig): Supplies drawio_to_xl_shape_mapping.
+    """
+    drawio_to_xl_shape_mapping = config.drawio_to_xl_shape_mapping
+
+    shapes = table.column('shape')
+    table.set_column('shape', list(map(drawio_to_xl_shape_mapping.get, shapes, shapes)))
+
 def rename_shapes(input_stream):
     """
     Rename shapes in the CSV content to maintain correspondence between Drawio and Visio shapes.  If the shape is not found in the mapping, the shape is left unchanged.
@@ -287,23 +499,33 @@ def rename_shapes(input_stream):
     Returns:
     io.StringIO: The CSV content with shapes renamed.
     """
-    reader = csv.DictReader(input_stream)
-    output_stream = io.StringIO()
-    writer = csv.DictWriter(output_stream, fieldnames=reader.fieldnames, lineterminator='\n')
-    
-    writer.writeheader()
+    return apply_stage(input_stream, rename_shapes_stage)
 
-    config = Config()
-    drawio_to_xl_shape_mapping = config.drawio_to_xl_shape_mapping
+def parse_decisions_stage(table, config=None):
+    """
+    Table stage that folds the 'decisionN_id' and 'decisionN_label' columns into 'next_step_id' and a new
+    'connector_label' column.  Only decision rows are visited.
 
-    for row in reader:
-        if row['shape'] in drawio_to_xl_shape_mapping:
-            row['shape'] = drawio_to_xl_shape_mapping[row['shape']]
-        writer.writerow(row)
+    Args:
+    table (Table): The table.
+    config (CompiledConfig): Unused.
+    """
+    max_decision_count = get_max_decision_count_from_headers(table.headers)
+    next_step_ids = table.column('next_step_id')
+    connector_labels = SparseColumn({}, len(table))
+
+    # Handle decision-specific fields
+    decision_rows = [row_index for row_index, shape in enumerate(table.column('shape'))
+                     if shape == "mxgraph.flowchart.decision"]
+    for row_index, row_branches in get_decision_branches(table, decision_rows).items():
+        next_step_ids[row_index] = ', '.join(filter(None, [decision_id for decision_id, _ in row_branches]))
+        connector_labels[row_index] = ', '.join(filter(None, [decision_label for _, decision_label in row_branches]))
+
+    # The decision columns are dropped in one pass and 'connector_label' is appended
+    decision_headers = {f'decision{i}_{suffix}' for i in range(max_decision_count) for suffix in ['id', 'label']}
+    table.keep([i for i, header in enumerate(table.headers) if header not in decision_headers])
+    table.add_column('connector_label', connector_labels)
 
-    output_stream.seek(0)
-    return output_stream
-    
 def parse_decisions(input_stream):
     """
     This function parses decision-related fields in a CSV data stream. It combines decision_id and decision_label fields
@@ -316,50 +538,28 @@ def parse_decisions(input_stream):
     Returns:
     io.StringIO: A new stream with the parsed decision fields.
     """
-    
-    # first pass
-    reader = csv.reader(input_stream)
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    headers = next(reader)
-    max_decision_count = get_max_decision_count_from_headers(headers)
-    shape_index = headers.index('shape')
-    next_step_id_index = headers.index('next_step_id')
-
-    decision_id_indices = [headers.index(f'decision{i}_id') for i in range(max_decision_count)]
-    decision_label_indices = [headers.index(f'decision{i}_label') for i in range(max_decision_count)]
-
-    headers.append('connector_label')
-    connector_label_index = headers.index('connector_label')
-    
-    writer.writerow(headers)
-
-    for row in reader:
-        row.append('') # Append the connector_label field to the row
-        # Handle decision-specific fields
-        if row[shape_index] == "mxgraph.flowchart.decision":
-            decision_ids = [row[index] for index in decision_id_indices]
-            decision_labels = [row[index] for index in decision_label_indices]
-            row[next_step_id_index] = ', '.join(filter(None, decision_ids))
-            row[connector_label_index] = ', '.join(filter(None, decision_labels))
-        else:
-            row[connector_label_index] = ''
+    return apply_stage(input_stream, parse_decisions_stage)
 
-        writer.writerow(row)
-    
-    # second pass
-    output.seek(0)
+def insert_newlines_stage(table, config=None):
+    """
+    Table stage that replaces '<br>' tags with newline characters in every cell, headers included.
 
-    for i in range(max_decision_count):
-        output = delete_column(output, f'decision{i}_id')
-        output = delete_column(output, f'decision{i}_label')
+    Args:
+    table (Table): The table.
+    config (CompiledConfig): Unused.
+    """
+    def replace(cell):
+        return cell.replace('<br>', '\n')
 
-    return output
+    table.rename([replace(header) for header in table.headers])
+    for position, column in enumerate(table.columns):
+        # Most columns have no tags at all, which one scan of the joined column shows
+        if '<br>' in '\0'.join(column):
+            table.columns[position] = list(map(replace, column))
 
 def insert_newlines(input_stream):
     """
-    This function replaces '<br>' tags with newline characters ('\n') in each cell of the CSV data read from the input stream.
+    This function replaces '<br>' tags with newline characters ('\\n') in each cell of the CSV data read from the input stream.
 
     Parameters:
     input_stream (io.StringIO): The input stream containing the CSV data.
@@ -367,15 +567,25 @@ def insert_newlines(input_stream):
     Returns:
     io.StringIO: A new stream with '<br>' tags replaced by newline characters in each cell.
     """
-    reader = csv.reader(input_stream)
-    output_stream = io.StringIO()
-    writer = csv.writer(output_stream, lineterminator='\n')
-    for row in reader:
-        modified_row = [cell.replace('<br>', '\n') for cell in row]
-        writer.writerow(modified_row)
+    return apply_stage(input_stream, insert_newlines_stage)
 
-    output_stream.seek(0)
-    return output_stream
+def rename_headers_stage(table, config):
+    """
+    Table stage that converts draw.io CSV headers to Excel headers (see rename_headers).  Only the
+    header names change.
+
+    Args:
+    table (Table): The table.
+    config (CompiledConfig): Supplies drawio_to_xl_header_mapping, the headers with a fixed name.
+    """
+    fixed_headers = config.drawio_to_xl_header_mapping
+    missing = [header for header in fixed_headers if header not in table]
+    if missing:
+        raise ValueError(f'{missing[0]!r} is not in list')
+
+    # rename fixed headers; for all other headers replace underscores with spaces and capitalize the first letter of each word
+    table.rename([fixed_headers[header] if header in fixed_headers else header.replace('_', ' ').title()
+                  for header in table.headers])
 
 def rename_headers(input_stream):
     """
@@ -391,39 +601,28 @@ def rename_headers(input_stream):
     Returns:
     io.StringIO: A new stream with renamed headers.
     """
+    return apply_stage(input_stream, rename_headers_stage)
 
-    #TODO naming should be pulled from a config file
-    fixed_headers = ['id', 'shape', 'connector_label', 'next_step_id']
-
-    reader = csv.reader(input_stream)
-    output_stream = io.StringIO()
-    writer = csv.writer(output_stream, lineterminator='\n')
-
-    headers = next(reader)
+def reorder_headers_stage(table, config):
+    """
+    Table stage that reorders the columns (see reorder_headers).  Only the column order changes.
 
-    # for all headers not in fixed_headers, replace underscores with spaces and capitalize the first letter of each word
-    headers = [header.replace('_', ' ').title() if header not in fixed_headers else header for header in headers]
-    
-    # rename fixed headers
-    # TODO add to config file
-    headers[headers.index('id')] = 'Process Step ID'
-    headers[headers.index('shape')] = 'Shape Type'
-    headers[headers.index('connector_label')] = 'Connector Label'
-    headers[headers.index('next_step_id')] = 'Next Step ID'
-    
-    writer.writerow(headers)
+    Args:
+    table (Table): The table.
+    config (CompiledConfig): Supplies xl_header_order.
+    """
+    header_order = config.xl_header_order
 
-    for row in reader:
-        writer.writerow(row)
-    
-    output_stream.seek(0)
-    return output_stream
+    ordered_headers = [header for header in header_order if header in table]
+    remaining_headers = [header for header in table.headers if header not in header_order]
+    remaining_headers.sort() # sort any remaining headers alphabetically
+    table.select(ordered_headers + remaining_headers)
 
 def reorder_headers(input_stream):
     """
     This function reorders the headers of the CSV data read from the input stream. 
 
-    The headers are reordered according to a hardcoded predefined list. Headers not in this list are sorted alphabetically and appended after the ordered headers.
+    The headers are reordered according to Config.xl_header_order. Headers not in this list are sorted alphabetically and appended after the ordered headers.
 
     Parameters:
     input_stream (io.StringIO): The input stream containing the CSV data.
@@ -431,34 +630,10 @@ def reorder_headers(input_stream):
     Returns:
     io.StringIO: A new stream with reordered headers.
     """
+    return apply_stage(input_stream, reorder_headers_stage)
 
-    #TODO This should be pulled from a config file
-    header_order = ["Process Step ID","Owner","Description","Status","Function","Phase","Estimated Duration","Estimated Completion Date","Notes","Wbs","Oqe","Next Step ID","Shape Type","Connector Label"]
-
-    reader = csv.reader(input_stream)
-    output_stream = io.StringIO()
-    writer = csv.writer(output_stream, lineterminator='\n')
-
-    # reorder the headers and row elements to match the header_order list
-    original_headers = next(reader)
-    ordered_headers = [header for header in header_order if header in original_headers]
-    
-    remaining_headers = [header for header in original_headers if header not in header_order]
-    remaining_headers.sort() # sort any remaining headers alphabetically
-    headers = ordered_headers + remaining_headers
-
-    writer.writerow(headers)
-
-    # reorder the row elements to match the header_order list
-    for row in reader:
-        row_dict = dict(zip(original_headers, row))
-        row = [row_dict[header] for header in headers]
-        writer.writerow(row)
-    
-    output_stream.seek(0)
-    return output_stream
-
-def drawio_to_xl(input_stream):
+@instrument_pipeline('drawio_to_xl')
+def drawio_to_xl(input_stream, observer=None, cache=None, config=None, output_stream=None):
     """
     This function processes a draw.io XML file and converts it to an Excel file.
 
@@ -474,85 +649,295 @@ def drawio_to_xl(input_stream):
     9. Rename the headers in the CSV file.
     10. Reorder the headers in the CSV file.
 
+    The steps run fused on an in-memory Table: the diagram is parsed once into columns, the
+    stages transform the columns, and the CSV is serialized once at the end.
+    The output is identical to chaining the stream-based stage functions.  Step 2 is
+    not needed because convert_to_table never produces front matter.
+
     Parameters:
     input_stream (io.StringIO): The input stream containing the draw.io XML data.
+    observer (object): Optional stage observer (see observers.py) that receives the CSV after every step.
+                       Intermediates are only serialized when an observer is enabled.
+    cache (ConversionCache): Optional cache (see cache.py).  On a hit the stored output is returned without parsing.
+                             It is bypassed when an observer is enabled, since the stages then have to run.
+    config (CompiledConfig): Optional configuration.  Defaults to get_compiled_config().  A cache should be
+                             opened with the Config this was compiled from.
+    output_stream (io.TextIOBase): Optional stream, e.g. a file from encoding.open_output, that the CSV is written
+                                   to a chunk at a time once the stages have run, instead of being collected in memory.
 
     Returns:
-    io.StringIO: The output stream containing the processed Excel data.
+    io.StringIO: The output stream containing the processed Excel data, or output_stream when one is given.
     """
+    if cache is not None and not observer_enabled(observer):
+        return copy_output(cache.convert('drawio_to_xl', input_stream, functools.partial(drawio_to_xl, config=config)),
+                           output_stream)
+    if output_stream is not None:
+        return instrument('write', write_csv, *drawio_to_xl_rows(input_stream, observer, config), output_stream)
+    return instrument('write', write_table, *drawio_to_xl_rows(input_stream, observer, config))
+
+def get_stages(id_to_xl_id):
+    """
+    Returns:
+    list: The (name, stage) pairs that follow convert_to_table in drawio_to_xl, in order, as drawio_to_xl_rows
+          runs them.  id_to_xl_id is the map from get_id_to_xl_id.
+    """
+    return [
+        ('delete_height_width', delete_height_width_stage),
+        ('replace_ids_with_xl_ids', lambda table, config: replace_ids_with_xl_ids_stage(table, id_to_xl_id, config)),
+        ('delete_xl_ids', lambda table, config: delete_column_stage(table, "xl_id")),
+        ('parse_decisions', parse_decisions_stage),
+        ('rename_shapes', rename_shapes_stage),
+        ('insert_newlines', insert_newlines_stage),
+        ('rename_headers', rename_headers_stage),
+        ('reorder_headers', reorder_headers_stage),
+    ]
+
+@instrument_pipeline('drawio_to_xl')
+def drawio_to_xl_rows(input_stream, observer=None, config=None):
+    """
+    drawio_to_xl without the final serialization: the Excel headers and an iterator of Excel rows.
 
-    output_stream = convert_to_csv(input_stream) # Call the convert_to_csv function
-    with open('tests/debug_output/0_convert_to_csv.csv', 'w') as f:
-        f.write(output_stream.getvalue())
-    output_stream.seek(0)
+    The diagram is parsed into a column-oriented Table and every stage runs on the whole table in
+    place, so all the columns are held in memory before the first row is returned.  Only the rows
+    themselves are assembled from the columns as the iterator is consumed, so a caller that writes
+    them out as it goes never holds the CSV text as well.
 
-    output_stream = strip_front_matter(output_stream)
-    with open('tests/debug_output/1_strip_front_matter.csv', 'w') as f:
-        f.write(output_stream.getvalue())
-    output_stream.seek(0)
+    Parameters:
+    input_stream (io.TextIOBase): The draw.io XML.  Any text stream works, including an open file.
+    observer (object): Optional stage observer (see observers.py).
+    config (CompiledConfig): Optional configuration injected into every stage.  Defaults to get_compiled_config().
 
-    output_stream = delete_height_width(output_stream)
-    with open('tests/debug_output/2_delete_height_width.csv', 'w') as f:
-        f.write(output_stream.getvalue())
-    output_stream.seek(0)
+    Returns:
+    tuple: The headers (list of str) and an iterator of rows (tuples of str).
+    """
+    config = config or get_compiled_config()
+    table = instrument('convert_to_table', convert_to_table, input_stream, config)
 
-    output_stream = replace_ids_with_xl_ids(output_stream)
-    with open('tests/debug_output/3_replace_ids_with_xl_ids.csv', 'w') as f:
-        f.write(output_stream.getvalue())
-    output_stream.seek(0)
+    # replace_ids_with_xl_ids needs every row before it can build its id map
+    id_to_xl_id = instrument('get_id_to_xl_id', get_id_to_xl_id, table)
 
-    output_stream = delete_xl_ids(output_stream)
-    with open('tests/debug_output/4_delete_xl_ids.csv', 'w') as f:
-        f.write(output_stream.getvalue())
-    output_stream.seek(0)
+    if observer_enabled(observer):
+        observer.observe('convert_to_csv', table.write().getvalue())
 
-    output_stream = parse_decisions(output_stream)
-    with open('tests/debug_output/5_parse_decisions.csv', 'w') as f:
-        f.write(output_stream.getvalue())
-    output_stream.seek(0)
+    table = run_stages(table, get_stages(id_to_xl_id), observer, config)
+    return table.headers, table.rows()
 
-    output_stream = rename_shapes(output_stream)
-    with open('tests/debug_output/6_rename_shapes.csv', 'w') as f:
-        f.write(output_stream.getvalue())
-    output_stream.seek(0)
+def iter_pages(input_stream):
+    """
+    Split a .drawio file into its pages without extracting any shapes.
 
-    output_stream = insert_newlines(output_stream)
-    with open('tests/debug_output/7_insert_newlines.csv', 'w') as f:
-        f.write(output_stream.getvalue())
-    output_stream.seek(0)
+    Each page is yielded as a small standalone XML document that convert_to_table accepts: the page's
+    mxGraphModel, or for a compressed page a <diagram> element holding the encoded text.  Only one
+    page is held in memory at a time.  A file without <diagram> elements is treated as one page.
 
-    output_stream = rename_headers(output_stream)
-    with open('tests/debug_output/8_rename_headers.csv', 'w') as f:
-        f.write(output_stream.getvalue())
-    output_stream.seek(0)
+    Parameters:
+    input_stream (io.TextIOWrapper): The input stream from which to read the draw.io XML file, as text or as bytes
+                                     for the XML parser to decode (see encoding.open_xml_input).
 
-    output_stream = reorder_headers(output_stream)
-    with open('tests/debug_output/9_reorder_headers.csv', 'w') as f:
-        f.write(output_stream.getvalue())
-    output_stream.seek(0)
+    Returns:
+    generator: (page_name, page_xml) tuples in document order.
+    """
+    root = None
+    page_count = 0
+    for event, element in ET.iterparse(input_stream, events=('start', 'end')):
+        if root is None:
+            root = element
+        if event == 'end' and element.tag.endswith('diagram'):
+            page_count += 1
+            page_name = element.get('name') or f'Page-{page_count}'
+            if len(element):
+                page_xml = ET.tostring(element[0], encoding='unicode')
+            else:
+                page_xml = f'<diagram>{element.text or ""}</diagram>'
+            element.clear()
+            yield page_name, page_xml
+
+    if page_count == 0 and root is not None:
+        yield 'Page-1', ET.tostring(root, encoding='unicode')
+
+def convert_page(page_xml, config=None):
+    """
+    Run drawio_to_xl on a single page from iter_pages.  This is the unit of work for the process pool.
 
-    return output_stream
+    Parameters:
+    page_xml (str): The page XML.
+    config (CompiledConfig): Optional configuration.
+
+    Returns:
+    str: The Excel CSV for the page.
+    """
+    return drawio_to_xl(io.StringIO(page_xml), config=config).getvalue()
+
+def drawio_to_xl_pages(input_stream, processes=None, config=None):
+    """
+    Convert every page of a draw.io file to its own Excel CSV.
+
+    Pages are independent, so when there is more than one page they are converted concurrently in a
+    process pool.
+
+    Parameters:
+    input_stream (io.StringIO): The input stream containing the draw.io XML data.
+    processes (int): The number of worker processes.  None uses one per CPU, 1 converts in-process.
+    config (CompiledConfig): Optional configuration, sent to the workers with every page.
+
+    Returns:
+    list: (page_name, io.StringIO) tuples in page order.
+    """
+    convert = functools.partial(convert_page, config=config)
+    pages = list(iter_pages(input_stream))
+    page_names = [page_name for page_name, _ in pages]
+    page_xmls = [page_xml for _, page_xml in pages]
+
+    if processes == 1 or len(pages) <= 1:
+        outputs = map(convert, page_xmls)
+        return [(page_name, io.StringIO(output)) for page_name, output in zip(page_names, outputs)]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        outputs = executor.map(convert, page_xmls)
+        return [(page_name, io.StringIO(output)) for page_name, output in zip(page_names, outputs)]
+
+def add_page_column(page_outputs, output_stream=None):
+    """
+    Combine per-page Excel CSVs into one CSV with a leading 'Page' column.
+
+    Headers are the union of every page's headers in order of first appearance.  A page that lacks a
+    column gets empty cells for it.
+
+    Parameters:
+    page_outputs (list): (page_name, io.StringIO) tuples from drawio_to_xl_pages.
+    output_stream (io.TextIOBase): Optional stream the combined CSV is written to as it is built.
+
+    Returns:
+    io.StringIO: The combined Excel CSV, or output_stream when one is given.
+    """
+    headers = ['Page']
+    tables = []
+    for page_name, page_stream in page_outputs:
+        page_headers, page_rows = read_table(page_stream)
+        headers.extend(header for header in page_headers if header not in headers)
+        tables.append((page_name, page_headers, page_rows))
+
+    def rows():
+        for page_name, page_headers, page_rows in tables:
+            positions = [page_headers.index(header) if header in page_headers else None for header in headers[1:]]
+            for row in page_rows:
+                yield [page_name] + [row[i] if i is not None else '' for i in positions]
+
+    if output_stream is not None:
+        return write_csv(headers, rows(), output_stream)
+    return write_table(headers, rows())
+
+def page_output_file(output_file, page_name):
+    """
+    Returns:
+    str: The per-page output file name, e.g. plan.csv and 'Page 1' give plan_Page_1.csv.
+    """
+    stem, extension = os.path.splitext(output_file)
+    safe_name = re.sub(r'[^\w\-]+', '_', page_name).strip('_') or 'page'
+    return f'{stem}_{safe_name}{extension}'
+
+def convert_file(input_file, output_file, cache_dir=None, config_file=None, encoding=None, errors='strict',
+                 buffer_size=DEFAULT_CHUNK_SIZE):
+    """
+    Convert one .drawio file to an Excel CSV file.  This is the unit of work of batch mode.
+    """
+    config = load_config(config_file) if config_file else None
+    cache = open_cache(cache_dir, config_file) if cache_dir else None
+    with open_xml_input(input_file, encoding, errors) as input_stream, open_output(output_file, buffer_size) as f:
+        drawio_to_xl(input_stream, cache=cache, config=config, output_stream=f)
 
 def main():
     # Create the argument parser
     parser = argparse.ArgumentParser(description='Convert a drawio file to a CSV file.')
-    parser.add_argument('input_file', help='The input drawio file.')
-    parser.add_argument('output_file', help='The output CSV file.')
+    parser.add_argument('input_file', help='The input drawio file, or a directory or quoted glob of them for batch mode.')
+    parser.add_argument('output_file', help='The output CSV file, - for standard output, or in batch mode the directory to '
+                                            'mirror the inputs into.')
+    parser.add_argument('--debug-dir', help='Write the intermediate CSV after every step to this directory.')
+    parser.add_argument('--pages', choices=['merge', 'split', 'column'], default='merge',
+                        help='merge: one flat CSV for all pages (default); split: one CSV per page, named '
+                             '<output>_<page>.csv; column: one CSV with a Page column.')
+    parser.add_argument('--processes', type=int, help='Worker processes for batch mode and --pages split/column (default: one per CPU).')
+    parser.add_argument('--cache-dir', help='Reuse the output of earlier conversions of identical input from this directory.')
+    parser.add_argument('--clear-cache', action='store_true', help='Empty --cache-dir before converting.')
+    parser.add_argument('--config', help='Read settings from this TOML or JSON file instead of the defaults in config.py.')
+    parser.add_argument('--encoding', help='The input encoding.  By default it is told from the BOM, or is UTF-8 if the start of '
+                                           'the file decodes as UTF-8 and cp1252 otherwise.')
+    parser.add_argument('--strip-invalid', action='store_true', help='Drop bytes that are invalid in the input encoding '
+                                                                      'instead of stopping with an error.')
+    parser.add_argument('--metrics', help='Record the time, rows, bytes and memory of every stage and write them to this file '
+                                          'when done: JSON for a .json file, OpenMetrics text otherwise.')
+    parser.add_argument('--metrics-memory', action='store_true', help='With --metrics, also trace memory allocations (slower).')
+    parser.add_argument('--profile', metavar='PREFIX', help='Profile the run and write PREFIX.pstats and PREFIX.collapsed '
+                                                             '(collapsed stacks for a flame graph).  Batch runs write one '
+                                                             'profile for all files.')
+    parser.add_argument('--buffer-size', type=int, default=DEFAULT_CHUNK_SIZE, metavar='BYTES',
+                        help=f'Buffer this much output before writing it out (default: {DEFAULT_CHUNK_SIZE}).')
 
     # Parse the command-line arguments
     args = parser.parse_args()
 
-    # Read the input file
-    with open(args.input_file, 'r') as f:
-        input_data = f.read()
-    input_stream = io.StringIO(input_data)
-
-    # Call the drawio_to_xl function
-    output_stream = drawio_to_xl(input_stream)
-
-    # Write the output to the output file
-    with open(args.output_file, 'w') as f:
-        f.write(output_stream.getvalue())
+    if args.buffer_size < 1:
+        parser.error('--buffer-size must be at least 1')
+
+    try:
+        config = load_config(args.config) if args.config else None
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    if args.encoding:
+        try:
+            codecs.lookup(args.encoding)
+        except LookupError as e:
+            parser.error(str(e))
+    errors = 'ignore' if args.strip_invalid else 'strict'
+
+    if args.profile:
+        start_profiling(args.profile)
+
+    if args.metrics:
+        # Batch workers started without fork turn instrumentation on from the environment
+        os.environ[METRICS_ENV_VAR] = args.metrics
+        os.environ[METRICS_MEMORY_ENV_VAR] = '1' if args.metrics_memory else ''
+        enable_instrumentation(args.metrics, memory=args.metrics_memory)
+
+    if args.cache_dir and args.clear_cache:
+        open_cache(args.cache_dir, args.config).invalidate()
+
+    if is_batch_input(args.input_file):
+        if args.output_file == STDOUT:
+            parser.error('batch mode writes to a directory, not to standard output')
+        if args.debug_dir:
+            parser.error('--debug-dir only works for a single input file')
+        if args.pages != 'merge':
+            parser.error('--pages only works for a single input file')
+        convert = functools.partial(convert_file, cache_dir=args.cache_dir, config_file=args.config,
+                                    encoding=args.encoding, errors=errors, buffer_size=args.buffer_size)
+        results = run_batch(convert, [args.input_file], args.output_file, '.drawio', '.csv', args.processes)
+        sys.exit(1 if any(result['error'] for result in results) else 0)
+
+    if args.pages == 'split' and args.output_file == STDOUT:
+        parser.error('--pages split writes one file per page, not to standard output')
+
+    if args.pages != 'merge':
+        with open_xml_input(args.input_file, args.encoding, errors) as input_stream:
+            page_outputs = drawio_to_xl_pages(input_stream, args.processes, config)
+
+        if args.pages == 'split':
+            for page_name, output_stream in page_outputs:
+                with open_output(page_output_file(args.output_file, page_name), args.buffer_size) as f:
+                    copy_output(output_stream, f)
+        else:
+            with open_output(args.output_file, args.buffer_size) as f:
+                add_page_column(page_outputs, f)
+        return
+
+    # Call the drawio_to_xl function.  The diagram is parsed straight from the memory-mapped file rather than read into
+    # memory first, and rows are written to the output as they leave the last stage instead of being collected first.
+    observer = DirectorySink(args.debug_dir) if args.debug_dir else None
+    cache = open_cache(args.cache_dir, args.config) if args.cache_dir else None
+    with open_xml_input(args.input_file, args.encoding, errors) as input_stream, \
+            open_output(args.output_file, args.buffer_size) as f:
+        drawio_to_xl(input_stream, observer, cache, config, output_stream=f)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
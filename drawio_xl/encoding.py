@@ -0,0 +1,215 @@
+import codecs
+import io
+import mmap
+import re
+import sys
+
+# How much of the input is looked at to tell its encoding
+SNIFF_BYTES = 65536
+# How much is read from the file and decoded at a time
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# The output file name that means standard output
+STDOUT = '-'
+# What an Excel CSV that is not UTF-8 is most likely to be: Excel on Windows saves plain CSV in the ANSI code page
+FALLBACK_ENCODING = 'cp1252'
+
+# Longest first, so a UTF-32 LE BOM is not taken for a UTF-16 LE one
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+ERRORS = ('strict', 'ignore', 'replace')
+
+# A UTF-8 encoded character beyond ASCII.  Text in a single-byte code page hardly ever contains one by chance
+UTF8_MULTIBYTE_PATTERN = re.compile(rb'[\xc2-\xdf][\x80-\xbf]|[\xe0-\xef][\x80-\xbf]{2}|[\xf0-\xf4][\x80-\xbf]{3}')
+
+
+def sniff_encoding(head, fallback=FALLBACK_ENCODING):
+    """
+    Tell the encoding of an input from its first bytes.
+
+    A BOM decides it, and the codec returned skips the BOM.  Without one the input is UTF-8 if head decodes as
+    UTF-8 (a character cut off at the end of head is allowed), or if it holds at least as many UTF-8 encoded
+    characters as invalid bytes, i.e. it is UTF-8 with a few stray bytes.  Otherwise it is fallback.
+
+    Args:
+        head (bytes): The first bytes of the input, e.g. SNIFF_BYTES of them.
+        fallback (str): The encoding of input that is not UTF-8.
+
+    Returns:
+        str: A codec name.
+    """
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+    except UnicodeDecodeError:
+        invalid_count = head.decode('utf-8', 'replace').count('\ufffd')
+        if len(UTF8_MULTIBYTE_PATTERN.findall(head)) < max(invalid_count, 1):
+            return fallback
+    return 'utf-8'
+
+
+def decode_stream(binary_stream, encoding=None, errors='strict', chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Wrap a binary stream in a text stream that decodes it incrementally, so a large input is never held as both
+    bytes and str.
+
+    Args:
+        binary_stream (io.BufferedIOBase): The input, e.g. a file opened in 'rb' mode or sys.stdin.buffer.
+        encoding (str, optional): The input encoding.  By default it is sniffed from the first SNIFF_BYTES (see
+                                  sniff_encoding) without consuming them.
+        errors (str): 'strict' raises UnicodeDecodeError on bytes that are invalid in the encoding, 'ignore'
+                      strips them and 'replace' turns them into U+FFFD.
+        chunk_size (int): The buffer size of a binary_stream that has no peek() and so has to be buffered.
+
+    Returns:
+        io.TextIOWrapper: The decoded text, with universal newlines as in a file opened in text mode.
+    """
+    if errors not in ERRORS:
+        raise ValueError(f"Unknown errors '{errors}', expected 'strict', 'ignore' or 'replace'")
+    if not hasattr(binary_stream, 'peek'):
+        binary_stream = io.BufferedReader(binary_stream, chunk_size)
+    if encoding is None:
+        encoding = sniff_encoding(binary_stream.peek(SNIFF_BYTES)[:SNIFF_BYTES])
+    return io.TextIOWrapper(binary_stream, encoding=encoding, errors=errors)
+
+
+class MappedFile(io.RawIOBase):
+    """
+    A read-only binary stream over a memory-mapped file.  Reads are served from the OS page cache, so however large
+    the file, the process only holds the chunk being read rather than a private copy of the whole input.
+
+    It has peek() like io.BufferedReader, so decode_stream() uses it as it is instead of buffering it again.  The file
+    must not be truncated while it is mapped.
+
+    Args:
+        path (str): The file to map.  It must be a non-empty regular file; mmap raises ValueError or OSError otherwise.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self._file = open(path, 'rb', buffering=0)
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        if hasattr(self._map, 'madvise'):
+            # The input is read once from start to end
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+        self.name = path
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def read(self, size=-1):
+        return self._map.read(size)
+
+    def readinto(self, buffer):
+        start = self._map.tell()
+        end = min(start + len(buffer), len(self._map))
+        with memoryview(self._map) as view:
+            buffer[:end - start] = view[start:end]
+        self._map.seek(end)
+        return end - start
+
+    def peek(self, size=1):
+        start = self._map.tell()
+        return self._map[start:start + max(size, 1)]
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._map.seek(offset, whence)
+        return self._map.tell()
+
+    def tell(self):
+        return self._map.tell()
+
+    def close(self):
+        if not self.closed:
+            self._map.close()
+            self._file.close()
+        super().close()
+
+
+def open_binary(path, chunk_size=DEFAULT_CHUNK_SIZE, mapped=True):
+    """
+    Open an input file for reading as bytes: memory-mapped (see MappedFile) when mapped is true and the file can be
+    mapped, and as a buffered file otherwise, e.g. for an empty file, a pipe or /dev/stdin.
+
+    Returns:
+        MappedFile or io.BufferedReader: The input.  Close it when done, e.g. in a with statement.
+    """
+    if mapped:
+        try:
+            return MappedFile(path)
+        except (OSError, ValueError):
+            pass
+    return open(path, 'rb', buffering=chunk_size)
+
+
+def open_input(path, encoding=None, errors='strict', chunk_size=DEFAULT_CHUNK_SIZE, mapped=True):
+    """
+    Open an input file for reading as text in its own encoding, see decode_stream.  The file is memory-mapped unless
+    mapped is false, see open_binary.
+
+    Returns:
+        io.TextIOWrapper: The decoded text.  Close it when done, e.g. in a with statement.
+    """
+    binary_stream = open_binary(path, chunk_size, mapped)
+    try:
+        return decode_stream(binary_stream, encoding, errors, chunk_size)
+    except Exception:
+        binary_stream.close()
+        raise
+
+
+def open_xml_input(path, encoding=None, errors='strict', chunk_size=DEFAULT_CHUNK_SIZE, mapped=True):
+    """
+    Open an XML input file, e.g. a .drawio file, for ElementTree to parse.
+
+    A UTF-8 file (the encoding draw.io writes) opened with neither encoding nor lenient errors is returned as bytes
+    straight from the mapped file: the XML parser decodes it itself, as it reads, honouring the BOM and the XML
+    declaration.  Any other input is decoded as by open_input.
+
+    Returns:
+        MappedFile, io.BufferedReader or io.TextIOWrapper: The input.  Close it when done, e.g. in a with statement.
+    """
+    binary_stream = open_binary(path, chunk_size, mapped)
+    try:
+        if (encoding is None and errors == 'strict' and
+                sniff_encoding(binary_stream.peek(SNIFF_BYTES)[:SNIFF_BYTES]) in ('utf-8', 'utf-8-sig')):
+            return binary_stream
+        return decode_stream(binary_stream, encoding, errors, chunk_size)
+    except Exception:
+        binary_stream.close()
+        raise
+
+
+def open_output(path, buffer_size=DEFAULT_CHUNK_SIZE):
+    """
+    Open an output file for writing UTF-8 text through a buffer of buffer_size bytes, so the conversions can write
+    their output as they produce it.  Lines end in '\n' on every platform, as in the in-memory outputs.  The path '-'
+    is standard output, e.g. for piping into another command; closing it flushes it but leaves standard output open.
+
+    Returns:
+        io.TextIOWrapper: The output.  Close it when done, e.g. in a with statement.
+    """
+    if path == STDOUT:
+        sys.stdout.flush()
+        binary_stream = open(sys.stdout.fileno(), 'wb', buffering=buffer_size, closefd=False)
+    else:
+        binary_stream = open(path, 'wb', buffering=buffer_size)
+    # Text goes straight to the binary buffer, so buffer_size alone decides when it is written out
+    return io.TextIOWrapper(binary_stream, encoding='utf-8', newline='\n', write_through=True)
@@ -0,0 +1,331 @@
+import atexit
+import functools
+import json
+import multiprocessing
+import os
+import threading
+import time
+import tracemalloc
+
+if __package__:
+    from drawio_xl.table import SparseColumn
+    from drawio_xl.table import Table
+else:
+    from table import SparseColumn
+    from table import Table
+
+# Setting this to a file name turns instrumentation on; the metrics are written there when the process exits
+METRICS_ENV_VAR = 'DRAWIO_XL_METRICS'
+# 'json' or 'openmetrics'.  Defaults to json for a .json file and openmetrics otherwise
+METRICS_FORMAT_ENV_VAR = 'DRAWIO_XL_METRICS_FORMAT'
+# Set to 1 to trace allocations with tracemalloc.  This slows every stage down, so it is off by default
+METRICS_MEMORY_ENV_VAR = 'DRAWIO_XL_METRICS_MEMORY'
+
+METRICS_FORMATS = ('json', 'openmetrics')
+
+# (name, record field, OpenMetrics type, unit, help) of the exported metric families
+METRIC_FAMILIES = [
+    ('drawio_xl_stage_runs', 'runs', 'counter', '', 'Times the stage ran.'),
+    ('drawio_xl_stage_wall_seconds', 'wall_seconds', 'counter', 'seconds', 'Wall time spent in the stage.'),
+    ('drawio_xl_stage_cpu_seconds', 'cpu_seconds', 'counter', 'seconds', 'CPU time of the process spent in the stage.'),
+    ('drawio_xl_stage_rows_in', 'rows_in', 'counter', '', 'Table rows the stage was given.'),
+    ('drawio_xl_stage_rows_out', 'rows_out', 'counter', '', 'Table rows the stage produced.'),
+    ('drawio_xl_stage_in_bytes', 'bytes_in', 'counter', 'bytes', 'UTF-8 size of the data the stage was given.'),
+    ('drawio_xl_stage_out_bytes', 'bytes_out', 'counter', 'bytes', 'UTF-8 size of the data the stage produced.'),
+    # A stage that frees more than it allocates is negative, so this is not a counter
+    ('drawio_xl_stage_allocated_bytes', 'allocated_bytes', 'gauge', 'bytes',
+     'Net memory the stage left allocated, summed over its runs, when memory tracing is on.'),
+    ('drawio_xl_stage_peak_bytes', 'peak_bytes', 'gauge', 'bytes',
+     'Largest memory high-water mark of the stage above its starting point, when memory tracing is on.'),
+]
+
+
+def table_bytes(table):
+    """
+    Returns:
+        int: The UTF-8 size of a table's headers and cells, separators not included.  A sparse column counts its
+             default for every row it does not store.
+    """
+    size = len(''.join(table.headers).encode('utf-8'))
+    for column in table.columns:
+        if isinstance(column, SparseColumn):
+            size += len(''.join(column.values.values()).encode('utf-8'))
+            size += len(column.default.encode('utf-8')) * (column.length - len(column.values))
+        else:
+            size += len(''.join(column).encode('utf-8'))
+    return size
+
+
+def measure(value):
+    """
+    Returns:
+        tuple: The rows and bytes of a stage input or output, each None when it cannot be told without consuming
+               the data: a Table has both, text and in-memory streams have a size, an open file has its file size
+               and an output file what was written to it.
+    """
+    if isinstance(value, Table):
+        return len(value), table_bytes(value)
+    if isinstance(value, str):
+        return None, len(value.encode('utf-8'))
+    if hasattr(value, 'getvalue'):
+        data = value.getvalue()
+        return None, len(data) if isinstance(data, bytes) else len(data.encode('utf-8'))
+    if hasattr(value, 'fileno'):
+        try:
+            if value.writable():
+                # The file size would leave out what is still buffered
+                return None, value.tell()
+            return None, os.fstat(value.fileno()).st_size
+        except (OSError, ValueError):
+            pass
+    return None, None
+
+
+class Instrumentation:
+    """
+    Records wall time, CPU time, rows and bytes in and out and, optionally, allocated memory for every stage
+    the pipelines run.
+
+    There is at most one per process (see get_instrumentation).  The pipelines call instrument() and
+    instrument_pipeline(), which only do any work when it is on.  Records are plain dicts, so they can be sent
+    back from batch workers.
+
+    Args:
+        memory (bool): Trace allocations with tracemalloc to fill in allocated_bytes and peak_bytes.
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.records = []
+        # The pipeline each thread is running, which labels the records of its stages.  Per thread, since a batch
+        # that runs draw.io converts several files on threads at once
+        self._local = threading.local()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @property
+    def pipeline(self):
+        return getattr(self._local, 'pipeline', None)
+
+    @pipeline.setter
+    def pipeline(self, pipeline):
+        self._local.pipeline = pipeline
+
+    @property
+    def _peaks(self):
+        # The highest traced memory seen so far by each of this thread's calls in progress, innermost last.  A call
+        # resets the tracemalloc peak to measure its own, so it first folds the peak so far into the call enclosing
+        # it.  tracemalloc itself is process-wide, so memory is only traced while one thread runs stages (see
+        # batch.convert_batch)
+        peaks = getattr(self._local, 'peaks', None)
+        if peaks is None:
+            peaks = self._local.peaks = []
+        return peaks
+
+    def call(self, stage, fn, *args, **kwargs):
+        """
+        Call fn(*args, **kwargs) and record it as a stage.  The first argument is the stage input.  The return
+        value is its output, or the input again for a stage that returns None because it changed a Table in place.
+
+        Returns:
+            object: What fn returned.
+        """
+        rows_in, bytes_in = measure(args[0]) if args else (None, None)
+        memory = self.memory
+        if memory:
+            peaks = self._peaks
+            memory_before, memory_peak = tracemalloc.get_traced_memory()
+            if peaks:
+                peaks[-1] = max(peaks[-1], memory_peak)
+            tracemalloc.reset_peak()
+            peaks.append(memory_before)
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        wall_seconds = time.perf_counter() - wall_start
+        cpu_seconds = time.process_time() - cpu_start
+        allocated_bytes = peak_bytes = None
+        if memory:
+            memory_after, memory_peak = tracemalloc.get_traced_memory()
+            memory_peak = max(memory_peak, peaks.pop())
+            if peaks:
+                peaks[-1] = max(peaks[-1], memory_peak)
+            allocated_bytes = memory_after - memory_before
+            peak_bytes = memory_peak - memory_before
+        rows_out, bytes_out = measure(args[0] if result is None and args else result)
+        self.records.append({
+            'pipeline': self.pipeline,
+            'stage': stage,
+            'wall_seconds': wall_seconds,
+            'cpu_seconds': cpu_seconds,
+            'rows_in': rows_in,
+            'rows_out': rows_out,
+            'bytes_in': bytes_in,
+            'bytes_out': bytes_out,
+            'allocated_bytes': allocated_bytes,
+            'peak_bytes': peak_bytes,
+        })
+        return result
+
+    def summary(self):
+        """
+        Returns:
+            list: One dict per (pipeline, stage), in order of first appearance, with the record fields summed over
+                  its runs (peak_bytes is the largest), a runs count, and None for a field no run measured.
+        """
+        summaries = {}
+        for record in self.records:
+            key = (record['pipeline'], record['stage'])
+            if key not in summaries:
+                summaries[key] = {'pipeline': record['pipeline'], 'stage': record['stage'], 'runs': 0}
+                summaries[key].update((field, None) for _, field, _, _, _ in METRIC_FAMILIES if field != 'runs')
+            summary = summaries[key]
+            summary['runs'] += 1
+            for _, field, _, _, _ in METRIC_FAMILIES:
+                if field == 'runs' or record[field] is None:
+                    continue
+                if summary[field] is None:
+                    summary[field] = record[field]
+                elif field == 'peak_bytes':
+                    summary[field] = max(summary[field], record[field])
+                else:
+                    summary[field] += record[field]
+        return list(summaries.values())
+
+    def to_json(self):
+        """
+        Returns:
+            str: Every record and the per-stage summary as JSON.
+        """
+        return json.dumps({'records': self.records, 'summary': self.summary()}, indent=2)
+
+    def to_openmetrics(self):
+        """
+        Returns:
+            str: The per-stage summary in the OpenMetrics text format, labelled by pipeline and stage.
+        """
+        summaries = self.summary()
+        lines = []
+        for name, field, metric_type, unit, help_text in METRIC_FAMILIES:
+            lines.append(f'# TYPE {name} {metric_type}')
+            if unit:
+                lines.append(f'# UNIT {name} {unit}')
+            lines.append(f'# HELP {name} {help_text}')
+            sample_name = f'{name}_total' if metric_type == 'counter' else name
+            for summary in summaries:
+                if summary[field] is not None:
+                    labels = f'pipeline="{summary["pipeline"] or ""}",stage="{summary["stage"]}"'
+                    lines.append(f'{sample_name}{{{labels}}} {summary[field]}')
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path, metrics_format=None):
+        """
+        Write the metrics to a file.
+
+        Args:
+            path (str): The file to write.
+            metrics_format (str, optional): 'json' or 'openmetrics'.  Defaults to json for a .json file and
+                                            openmetrics otherwise.
+        """
+        metrics_format = metrics_format or ('json' if path.endswith('.json') else 'openmetrics')
+        if metrics_format not in METRICS_FORMATS:
+            raise ValueError(f"Unknown metrics format '{metrics_format}', expected 'json' or 'openmetrics'")
+        content = self.to_json() if metrics_format == 'json' else self.to_openmetrics()
+        with open(path, 'w') as f:
+            f.write(content)
+
+
+# The process's Instrumentation, or None when instrumentation is off
+_instrumentation = None
+
+
+def get_instrumentation():
+    """
+    Returns:
+        Instrumentation: The process's instrumentation, or None when it is off.
+    """
+    return _instrumentation
+
+
+def enable_instrumentation(path=None, metrics_format=None, memory=False):
+    """
+    Turn instrumentation on for this process.
+
+    Args:
+        path (str, optional): Write the metrics to this file when the process exits.  Only the process that was
+                              started directly writes it; batch workers send their records back instead.
+        metrics_format (str, optional): 'json' or 'openmetrics', see Instrumentation.write.
+        memory (bool): Trace allocations, see Instrumentation.
+
+    Returns:
+        Instrumentation: The new instrumentation.
+    """
+    global _instrumentation
+    if metrics_format is not None and metrics_format not in METRICS_FORMATS:
+        raise ValueError(f"Unknown metrics format '{metrics_format}', expected 'json' or 'openmetrics'")
+    instrumentation = Instrumentation(memory)
+    _instrumentation = instrumentation
+    if path and multiprocessing.parent_process() is None:
+        atexit.register(instrumentation.write, path, metrics_format)
+    return instrumentation
+
+
+def disable_instrumentation():
+    """
+    Turn instrumentation off.  Records are kept by the Instrumentation object but no longer added to.
+    """
+    global _instrumentation
+    _instrumentation = None
+
+
+def enable_from_environment(environ=os.environ):
+    """
+    Turn instrumentation on if DRAWIO_XL_METRICS is set.  Run once on import.
+
+    Returns:
+        Instrumentation: The new instrumentation, or None if the variable is not set.
+    """
+    path = environ.get(METRICS_ENV_VAR)
+    if not path:
+        return None
+    return enable_instrumentation(path, environ.get(METRICS_FORMAT_ENV_VAR) or None,
+                                  environ.get(METRICS_MEMORY_ENV_VAR, '') not in ('', '0'))
+
+
+def instrument(stage, fn, *args):
+    """
+    Call fn(*args), recording it as a stage when instrumentation is on (see Instrumentation.call).  When it is
+    off this is just the call.
+
+    Returns:
+        object: What fn returned.
+    """
+    if _instrumentation is None:
+        return fn(*args)
+    return _instrumentation.call(stage, fn, *args)
+
+
+def instrument_pipeline(pipeline):
+    """
+    Decorator for a whole conversion: each call is recorded as the pipeline's 'total' stage and the stages it runs
+    are labelled with the pipeline name.  A conversion started inside another one (e.g. on a cache miss, or
+    drawio_to_xl calling drawio_to_xl_rows) is not recorded again.  When instrumentation is off this is just the
+    call.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            instrumentation = _instrumentation
+            if instrumentation is None or instrumentation.pipeline is not None:
+                return fn(*args, **kwargs)
+            instrumentation.pipeline = pipeline
+            try:
+                return instrumentation.call('total', fn, *args, **kwargs)
+            finally:
+                instrumentation.pipeline = None
+        return wrapper
+    return decorator
+
+
+enable_from_environment()
@@ -0,0 +1,210 @@
+"""
+Layered (Sugiyama-style) layout for the diagrams emitted by mxgraph.py.
+
+The layout follows draw.io's horizontalflow/verticalflow layouts closely enough that the generated plans read
+the same way: steps are placed in layers along the flow direction, levelspacing apart, and stacked nodespacing apart
+within a layer.  Edges between the same two steps are pulled apart edgespacing apart.  Every phase is linear in the number of vertices and edges except the per-layer ordering, which sorts.
+"""
+
+HORIZONTAL = 'horizontal'
+VERTICAL = 'vertical'
+
+
+def break_cycles(vertex_count, edges):
+    """
+    Find the edges to ignore so the graph becomes acyclic, using an iterative depth-first search.
+
+    Args:
+        vertex_count (int): The number of vertices.
+        edges (list): (source, target) index pairs.
+
+    Returns:
+        list: The (source, target) pairs of the acyclic graph, self loops and back edges removed.
+    """
+    successors = [[] for _ in range(vertex_count)]
+    for source, target in edges:
+        if source != target:
+            successors[source].append(target)
+
+    # 0 = unvisited, 1 = on the current path, 2 = finished
+    state = [0] * vertex_count
+    back_edges = set()
+    for start in range(vertex_count):
+        if state[start]:
+            continue
+        state[start] = 1
+        stack = [(start, iter(successors[start]))]
+        while stack:
+            vertex, remaining = stack[-1]
+            for target in remaining:
+                if state[target] == 1:
+                    back_edges.add((vertex, target))
+                elif state[target] == 0:
+                    state[target] = 1
+                    stack.append((target, iter(successors[target])))
+                    break
+            else:
+                state[vertex] = 2
+                stack.pop()
+
+    return [(source, target) for source, target in edges if source != target and (source, target) not in back_edges]
+
+
+def assign_layers(vertex_count, edges):
+    """
+    Assign each vertex the length of the longest path reaching it, then pull vertices without predecessors
+    forward so they sit one layer before their nearest successor.
+
+    Args:
+        vertex_count (int): The number of vertices.
+        edges (list): Acyclic (source, target) index pairs.
+
+    Returns:
+        list: The layer of each vertex.
+    """
+    successors = [[] for _ in range(vertex_count)]
+    in_degree = [0] * vertex_count
+    for source, target in edges:
+        successors[source].append(target)
+        in_degree[target] += 1
+
+    layers = [0] * vertex_count
+    remaining = in_degree[:]
+    queue = [vertex for vertex in range(vertex_count) if not in_degree[vertex]]
+    for vertex in queue:
+        layer = layers[vertex] + 1
+        for target in successors[vertex]:
+            if layers[target] < layer:
+                layers[target] = layer
+            remaining[target] -= 1
+            if not remaining[target]:
+                queue.append(target)
+
+    for vertex in range(vertex_count):
+        if not in_degree[vertex] and successors[vertex]:
+            layers[vertex] = min(layers[target] for target in successors[vertex]) - 1
+
+    return layers
+
+
+def order_layers(layers, edges):
+    """
+    Order the vertices within each layer by the barycenter of their predecessors, sweeping once along the flow.
+
+    Args:
+        layers (list): The layer of each vertex.
+        edges (list): Acyclic (source, target) index pairs.
+
+    Returns:
+        list: One list of vertex indexes per layer, in order.
+    """
+    layer_count = max(layers, default=-1) + 1
+    ordered = [[] for _ in range(layer_count)]
+    for vertex, layer in enumerate(layers):
+        ordered[layer].append(vertex)
+
+    predecessors = [[] for _ in layers]
+    for source, target in edges:
+        predecessors[target].append(source)
+
+    position = [0.0] * len(layers)
+
+    def barycenter(vertex):
+        sources = predecessors[vertex]
+        if not sources:
+            return position[vertex]
+        return sum(position[source] for source in sources) / len(sources)
+
+    for layer in ordered:
+        for index, vertex in enumerate(layer):
+            position[vertex] = index
+        layer.sort(key=barycenter)
+        for index, vertex in enumerate(layer):
+            position[vertex] = index
+
+    return ordered
+
+
+def layered_layout(sizes, edges, direction=HORIZONTAL, nodespacing=100, levelspacing=200, left=20, top=20):
+    """
+    Compute the top left corner of every vertex for a layered layout.
+
+    Layers run along the flow direction.  Each layer is as deep as its largest vertex and vertices are centred
+    within it; the vertices of a layer are stacked across the flow and the layer is centred on the tallest one.
+
+    Args:
+        sizes (list): (width, height) of each vertex.
+        edges (list): (source, target) index pairs, which may contain cycles.
+        direction (str): HORIZONTAL (left to right) or VERTICAL (top to bottom).
+        nodespacing (float): The gap between vertices in the same layer.
+        levelspacing (float): The gap between layers.
+        left (float): The x coordinate of the diagram's left edge.
+        top (float): The y coordinate of the diagram's top edge.
+
+    Returns:
+        list: (x, y) of each vertex.
+    """
+    acyclic_edges = break_cycles(len(sizes), edges)
+    ordered = order_layers(assign_layers(len(sizes), acyclic_edges), acyclic_edges)
+
+    # Work in flow coordinates: 'depth' runs along the flow, 'breadth' across it
+    if direction == HORIZONTAL:
+        depth_of, breadth_of = (lambda size: size[0]), (lambda size: size[1])
+    else:
+        depth_of, breadth_of = (lambda size: size[1]), (lambda size: size[0])
+
+    layer_breadths = [sum(breadth_of(sizes[vertex]) for vertex in layer) + nodespacing * max(len(layer) - 1, 0)
+                      for layer in ordered]
+    widest = max(layer_breadths, default=0)
+
+    positions = [None] * len(sizes)
+    depth = 0
+    for layer, layer_breadth in zip(ordered, layer_breadths):
+        layer_depth = max((depth_of(sizes[vertex]) for vertex in layer), default=0)
+        breadth = (widest - layer_breadth) / 2
+        for vertex in layer:
+            size = sizes[vertex]
+            positions[vertex] = (depth + (layer_depth - depth_of(size)) / 2, breadth)
+            breadth += breadth_of(size) + nodespacing
+        if layer:
+            depth += layer_depth + levelspacing
+
+    if direction == HORIZONTAL:
+        return [(left + flow, top + across) for flow, across in positions]
+    return [(left + across, top + flow) for flow, across in positions]
+
+
+def parallel_edge_points(positions, sizes, edges, edgespacing=10):
+    """
+    Spread out edges that connect the same two vertices, in either direction, which would otherwise be drawn on top
+    of each other.  Each gets one waypoint halfway between the centres of its vertices, and the waypoints are
+    edgespacing apart on the line through that point at right angles to the one joining the centres.
+
+    Args:
+        positions (list): (x, y) of each vertex, as returned by layered_layout.
+        sizes (list): (width, height) of each vertex.
+        edges (list): (source, target) index pairs.
+        edgespacing (float): The gap between parallel edges.
+
+    Returns:
+        list: The waypoints of each edge, a list of (x, y), empty for an edge with no parallel edge or a self loop.
+    """
+    parallel = {}
+    for index, (source, target) in enumerate(edges):
+        if source != target:
+            parallel.setdefault((min(source, target), max(source, target)), []).append(index)
+
+    points = [[] for _ in edges]
+    for (first, second), indexes in parallel.items():
+        if len(indexes) < 2:
+            continue
+        (x1, y1), (width1, height1) = positions[first], sizes[first]
+        (x2, y2), (width2, height2) = positions[second], sizes[second]
+        x1, y1, x2, y2 = x1 + width1 / 2, y1 + height1 / 2, x2 + width2 / 2, y2 + height2 / 2
+        length = ((x2 - x1) ** 2 + (y2 - y1) ** 2) ** 0.5
+        # Vertices on top of each other have no line between them, so spread across the default flow instead
+        normal_x, normal_y = ((y1 - y2) / length, (x2 - x1) / length) if length else (0, 1)
+        for offset, index in enumerate(indexes):
+            distance = (offset - (len(indexes) - 1) / 2) * edgespacing
+            points[index] = [((x1 + x2) / 2 + normal_x * distance, (y1 + y2) / 2 + normal_y * distance)]
+    return points
@@ -0,0 +1,361 @@
+"""
+An in-process stand-in for draw.io's CSV import, used when the desktop app is not installed (see
+xl_to_drawio.csv_to_drawio).
+
+The output is structurally equivalent to what draw.io writes for the same CSV: the same cells, styles, attributes
+and edges, with the same cell ids.  Like draw.io, the namespace directive only prefixes the ids of rows that the
+identity directive names a column for; without identity, cells are numbered from 2 after the root and layer cells.
+"""
+import csv
+import io
+import itertools
+import json
+import re
+from xml.sax.saxutils import escape
+
+if __package__:
+    from drawio_xl.layout import layered_layout, parallel_edge_points, HORIZONTAL, VERTICAL
+else:
+    from layout import layered_layout, parallel_edge_points, HORIZONTAL, VERTICAL
+
+# The cell ids draw.io reserves for the root cell and the default layer
+ROOT_CELL_ID = '0'
+LAYER_CELL_ID = '1'
+
+DEFAULT_VERTEX_STYLE = 'whiteSpace=wrap;html=1;'
+
+# UserObject attributes written by the emitter itself; columns with these names are not copied
+RESERVED_ATTRIBUTES = {'id', 'label', 'link', 'placeholders'}
+
+# The frontmatter layouts laid out natively, mapped to their flow direction
+FLOW_LAYOUTS = {'horizontalflow': HORIZONTAL, 'verticalflow': VERTICAL}
+
+PLACEHOLDER_PATTERN = re.compile(r'%([^%\s]+)%')
+
+XML_ATTRIBUTE_ENTITIES = {'"': '&quot;', '\n': '&#xa;', '\r': '&#xd;', '\t': '&#x9;'}
+NEEDS_ESCAPE_PATTERN = re.compile('[&<>"\n\r\t]')
+
+
+def quote_attribute(value):
+    """
+    Returns:
+        str: The value escaped and quoted for use as an XML attribute.
+    """
+    if NEEDS_ESCAPE_PATTERN.search(value) is None:
+        return '"' + value + '"'
+    return '"' + escape(value, XML_ATTRIBUTE_ENTITIES) + '"'
+
+
+def parse_frontmatter(lines):
+    """
+    Parse draw.io CSV import frontmatter.
+
+    Lines starting with '##' are comments.  Other lines have the form '# key: value' and a line
+    ending with a backslash continues on the next line.  'connect' may appear more than once and
+    is collected into a list.  'connect' and 'styles' values are JSON, 'ignore' is a comma separated
+    list and everything else is kept as a string.
+
+    Args:
+        lines (iterable): The frontmatter lines, including their leading '#'.
+
+    Returns:
+        dict: The directives.
+    """
+    directives = {'connect': []}
+    pending = ''
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line.startswith('##') or not line.startswith('#'):
+            continue
+        text = line[1:].strip()
+        if text.endswith('\\'):
+            pending += text[:-1]
+            continue
+        text = pending + text
+        pending = ''
+
+        key, separator, value = text.partition(':')
+        if not separator:
+            continue
+        key = key.strip()
+        value = value.strip()
+        if key == 'connect':
+            directives['connect'].append(json.loads(value))
+        elif key == 'styles':
+            directives['styles'] = json.loads(value)
+        elif key == 'ignore':
+            directives['ignore'] = [name.strip() for name in value.split(',') if name.strip()]
+        else:
+            directives[key] = value
+    return directives
+
+
+def read_drawio_csv(input_stream):
+    """
+    Read a draw.io CSV import: frontmatter followed by the CSV data.
+
+    Args:
+        input_stream (io.StringIO): The draw.io CSV import data.
+
+    Returns:
+        tuple: The frontmatter directives (dict), the headers (list) and the rows (list of lists).
+    """
+    frontmatter = []
+    first_data_line = None
+    for line in input_stream:
+        if line.strip().startswith('#'):
+            frontmatter.append(line)
+        else:
+            first_data_line = line
+            break
+
+    directives = parse_frontmatter(frontmatter)
+    if first_data_line is None:
+        return directives, [], []
+
+    reader = csv.reader(itertools.chain([first_data_line], input_stream))
+    headers = [header.strip() for header in next(reader)]
+    rows = [row + [''] * (len(headers) - len(row)) for row in reader if row]
+    return directives, headers, rows
+
+
+def get_dimension(directive, row_values, default):
+    """
+    Resolve a width or height directive.  '@column' takes the value from a column, a number is used as is.
+    """
+    if not directive:
+        return default
+    if directive.startswith('@'):
+        value = row_values.get(directive[1:], '')
+    else:
+        value = directive
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
+def replace_placeholders(template, row_values):
+    """
+    Replace %column% placeholders in a style with the row's values.  Unknown placeholders are left unchanged.
+    """
+    return PLACEHOLDER_PATTERN.sub(lambda match: row_values.get(match.group(1), match.group(0)), template)
+
+
+def format_number(value):
+    """
+    Returns:
+        str: The number formatted the way draw.io writes geometry, without a trailing '.0'.
+    """
+    return str(int(value)) if float(value).is_integer() else str(value)
+
+
+def build_graph(directives, headers, rows):
+    """
+    Build the vertices and edges described by a draw.io CSV import.
+
+    Vertices get sequential cell ids after the root and layer cells, in row order, unless the identity
+    directive names a column: a row with a value there gets the namespace directive followed by that value
+    as its id, and a later row with the same value updates that vertex, as a draw.io import does.  Edges
+    follow, in the order of the connect directives and then of the rows, which is the order draw.io creates
+    them in, numbered on from the vertices without an identity.
+
+    Args:
+        directives (dict): The frontmatter directives from parse_frontmatter.
+        headers (list): The CSV headers.
+        rows (list): The CSV rows.
+
+    Returns:
+        tuple: The vertices (list of dicts with 'id', 'attributes', 'style', 'width', 'height') and the
+               edges (list of dicts with 'id', 'source', 'target', 'value', 'style').
+    """
+    ignored = set(directives.get('ignore', []))
+    styles = directives.get('styles', {})
+    stylename = directives.get('stylename')
+    default_style = directives.get('style', DEFAULT_VERTEX_STYLE)
+    label = directives.get('label', '')
+    link = directives.get('link')
+    attribute_names = [header for header in headers if header not in ignored and header not in RESERVED_ATTRIBUTES]
+
+    identity = directives.get('identity')
+    if identity == '-':
+        identity = None
+    namespace = directives.get('namespace', '')
+
+    vertices = []
+    vertex_by_id = {}
+    next_id = 2
+    for row in rows:
+        row_values = dict(zip(headers, row))
+        style = styles.get(row_values.get(stylename), default_style) if stylename else default_style
+        attributes = [('label', label)] + [(name, row_values[name]) for name in attribute_names]
+        if link and row_values.get(link):
+            attributes.append(('link', row_values[link]))
+        attributes.append(('placeholders', '1'))
+        if identity and row_values.get(identity):
+            cell_id = namespace + row_values[identity]
+        else:
+            cell_id = str(next_id)
+            next_id += 1
+        vertex = {
+            'id': cell_id,
+            'values': row_values,
+            'attributes': attributes,
+            'style': replace_placeholders(style, row_values),
+            'width': get_dimension(directives.get('width'), row_values, 120),
+            'height': get_dimension(directives.get('height'), row_values, 60),
+        }
+        if cell_id in vertex_by_id:
+            vertex_by_id[cell_id].update(vertex)
+            continue
+        vertex_by_id[cell_id] = vertex
+        vertices.append(vertex)
+
+    edges = []
+    lookups = {}
+    for connect in directives['connect']:
+        to_column = connect.get('to')
+        if to_column not in lookups:
+            lookups[to_column] = {}
+            for vertex in vertices:
+                lookups[to_column].setdefault(vertex['values'].get(to_column), vertex)
+        lookup = lookups[to_column]
+
+        for vertex in vertices:
+            value = vertex['values'].get(connect.get('from'), '')
+            if not value:
+                continue
+            for target_key in value.split(','):
+                target = lookup.get(target_key.strip())
+                if target is None:
+                    continue
+                edge_label = vertex['values'].get(connect['fromlabel'], '') if 'fromlabel' in connect else ''
+                edge_label += connect.get('label', '')
+                if 'tolabel' in connect:
+                    edge_label += target['values'].get(connect['tolabel'], '')
+                source, target = (target, vertex) if connect.get('invert') else (vertex, target)
+                edges.append({
+                    'id': str(next_id),
+                    'source': source['id'],
+                    'target': target['id'],
+                    'value': edge_label,
+                    'style': connect.get('style', ''),
+                })
+                next_id += 1
+
+    return vertices, edges
+
+
+def assign_grid_geometry(vertices, directives):
+    """
+    Place vertices on a simple grid, spaced by the nodespacing directive.
+    """
+    spacing = float(directives.get('nodespacing', 40))
+    columns = max(int(len(vertices) ** 0.5), 1)
+    left = float(directives.get('left', 20))
+    top = float(directives.get('top', 20))
+    cell_width = max((vertex['width'] for vertex in vertices), default=0) + spacing
+    cell_height = max((vertex['height'] for vertex in vertices), default=0) + spacing
+    for index, vertex in enumerate(vertices):
+        vertex['x'] = left + (index % columns) * cell_width
+        vertex['y'] = top + (index // columns) * cell_height
+
+
+def assign_geometry(vertices, edges, directives):
+    """
+    Place vertices according to the layout directive.  horizontalflow and verticalflow use the layered layout
+    in layout.py with the nodespacing and levelspacing directives; any other layout falls back to a grid.
+    Edges between the same two vertices are then given waypoints edgespacing apart, so they do not overlap.
+    """
+    direction = FLOW_LAYOUTS.get(directives.get('layout'))
+    sizes = [(vertex['width'], vertex['height']) for vertex in vertices]
+    index_of = {vertex['id']: index for index, vertex in enumerate(vertices)}
+    edge_indexes = [(index_of[edge['source']], index_of[edge['target']]) for edge in edges]
+    if direction is None:
+        assign_grid_geometry(vertices, directives)
+        positions = [(vertex['x'], vertex['y']) for vertex in vertices]
+    else:
+        positions = layered_layout(
+            sizes,
+            edge_indexes,
+            direction=direction,
+            nodespacing=float(directives.get('nodespacing', 100)),
+            levelspacing=float(directives.get('levelspacing', 200)),
+            left=float(directives.get('left', 20)),
+            top=float(directives.get('top', 20)),
+        )
+        for vertex, (x, y) in zip(vertices, positions):
+            vertex['x'] = x
+            vertex['y'] = y
+
+    edgespacing = float(directives.get('edgespacing', 10))
+    for edge, points in zip(edges, parallel_edge_points(positions, sizes, edge_indexes, edgespacing)):
+        edge['points'] = points
+
+
+def write_mxfile(vertices, edges, output_stream, page_name='Page-1'):
+    """
+    Write vertices and edges as an uncompressed draw.io document.
+    """
+    write = output_stream.write
+    write('<mxfile host="drawio_xl">\n')
+    write(f'  <diagram id="csv-import" name={quote_attribute(page_name)}>\n')
+    write('    <mxGraphModel grid="0" gridSize="10" guides="1" tooltips="1" connect="1" arrows="1" fold="0" '
+          'page="0" pageScale="1" pageWidth="850" pageHeight="1100" math="0" shadow="0">\n')
+    write('      <root>\n')
+    write(f'        <mxCell id="{ROOT_CELL_ID}" />\n')
+    write(f'        <mxCell id="{LAYER_CELL_ID}" parent="{ROOT_CELL_ID}" />\n')
+    for vertex in vertices:
+        attributes = ' '.join(f'{name}={quote_attribute(value)}' for name, value in vertex['attributes'])
+        write(f'        <UserObject {attributes} id="{vertex["id"]}">\n')
+        write(f'          <mxCell style={quote_attribute(vertex["style"])} parent="{LAYER_CELL_ID}" vertex="1">\n')
+        write(f'            <mxGeometry x="{format_number(vertex["x"])}" y="{format_number(vertex["y"])}" '
+              f'width="{format_number(vertex["width"])}" height="{format_number(vertex["height"])}" as="geometry" />\n')
+        write('          </mxCell>\n')
+        write('        </UserObject>\n')
+    for edge in edges:
+        write(f'        <mxCell id="{edge["id"]}" value={quote_attribute(edge["value"])} style={quote_attribute(edge["style"])} '
+              f'parent="{LAYER_CELL_ID}" source="{edge["source"]}" target="{edge["target"]}" edge="1">\n')
+        if edge.get('points'):
+            write('          <mxGeometry relative="1" as="geometry">\n')
+            write('            <Array as="points">\n')
+            for x, y in edge['points']:
+                write(f'              <mxPoint x="{format_number(x)}" y="{format_number(y)}" />\n')
+            write('            </Array>\n')
+            write('          </mxGeometry>\n')
+        else:
+            write('          <mxGeometry relative="1" as="geometry" />\n')
+        write('        </mxCell>\n')
+    write('      </root>\n')
+    write('    </mxGraphModel>\n')
+    write('  </diagram>\n')
+    write('</mxfile>\n')
+
+
+def csv_to_mxfile(input_stream, output_stream=None):
+    """
+    Convert a draw.io CSV import (frontmatter plus CSV, as produced by add_frontmatter) to a .drawio
+    document in-process, without the draw.io desktop app.
+
+    The frontmatter directives label, style, styles/stylename, connect, width/height, ignore, link,
+    layout, nodespacing, levelspacing and edgespacing are honoured.  Cell ids and edge order follow draw.io's CSV import.
+
+    Args:
+        input_stream (io.StringIO): The draw.io CSV import data.
+        output_stream (io.TextIOBase, optional): Where to write the XML, e.g. an open file.  Writing starts once the
+                                                 layout is done, since the first cell needs its position.
+
+    Returns:
+        io.StringIO: The .drawio XML, or output_stream when one is given.
+    """
+    directives, headers, rows = read_drawio_csv(input_stream)
+    vertices, edges = build_graph(directives, headers, rows)
+    assign_geometry(vertices, edges, directives)
+
+    if output_stream is not None:
+        write_mxfile(vertices, edges, output_stream)
+        return output_stream
+    output_stream = io.StringIO()
+    write_mxfile(vertices, edges, output_stream)
+    output_stream.seek(0)
+    return output_stream
@@ -0,0 +1,62 @@
+import collections
+import os
+
+
+class NullSink:
+    """
+    Observer that discards everything.  Passing it to a pipeline is the same as passing no observer:
+    the fused fast path runs and no intermediate is ever serialized.
+    """
+    enabled = False
+
+    def observe(self, stage_name, content, suffix='.csv'):
+        pass
+
+
+class DirectorySink:
+    """
+    Observer that writes every intermediate to a file in a directory.
+
+    Files are numbered in the order they are observed, e.g. 0_convert_to_csv.csv, 1_delete_height_width.csv.
+    The directory is created if it does not exist.
+
+    Args:
+        path (str): The directory to write to.
+    """
+    enabled = True
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        os.makedirs(path, exist_ok=True)
+
+    def observe(self, stage_name, content, suffix='.csv'):
+        file_name = os.path.join(self.path, f'{self.count}_{stage_name}{suffix}')
+        with open(file_name, 'w') as f:
+            f.write(content)
+        self.count += 1
+
+
+class RingBufferSink:
+    """
+    Observer that keeps the most recent intermediates in memory.
+
+    Args:
+        maxlen (int): The number of intermediates to keep.  Older ones are dropped first.
+    """
+    enabled = True
+
+    def __init__(self, maxlen=32):
+        self.artifacts = collections.deque(maxlen=maxlen)
+
+    def observe(self, stage_name, content, suffix='.csv'):
+        self.artifacts.append((stage_name, content))
+
+    def get(self, stage_name):
+        """
+        Return the content of the most recent intermediate with the given stage name, or None.
+        """
+        for name, content in reversed(self.artifacts):
+            if name == stage_name:
+                return content
+        return None
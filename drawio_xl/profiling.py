@@ -0,0 +1,221 @@
+import atexit
+import collections
+import cProfile
+import multiprocessing
+import pstats
+import sys
+import threading
+
+if __package__:
+    from drawio_xl import instrumentation
+else:
+    import instrumentation
+
+# How often the stack sampler looks at the profiled thread, in seconds
+SAMPLE_INTERVAL = 0.001
+
+# The switch interval is process-wide, so profilers running at once on several threads (a threaded batch) share
+# one lowered setting: the first to start saves the original and the last to stop restores it
+_switch_interval_lock = threading.Lock()
+_switch_interval_users = 0
+_saved_switch_interval = None
+
+
+def _lower_switch_interval(interval):
+    global _switch_interval_users, _saved_switch_interval
+    with _switch_interval_lock:
+        if not _switch_interval_users:
+            _saved_switch_interval = sys.getswitchinterval()
+        _switch_interval_users += 1
+        sys.setswitchinterval(min(sys.getswitchinterval(), interval))
+
+
+def _restore_switch_interval():
+    global _switch_interval_users
+    with _switch_interval_lock:
+        _switch_interval_users -= 1
+        if not _switch_interval_users:
+            sys.setswitchinterval(_saved_switch_interval)
+
+
+class _RawStats:
+    """
+    A pstats dict as pstats.Stats.add() accepts it, for stats sent back from a worker process.
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def frame_label(frame):
+    """
+    Returns:
+        str: The name of a frame in a collapsed stack.  Frames of instrumentation.instrument() are named after the
+             stage they run, e.g. 'stage:parse_decisions', and a conversion wrapped by
+             instrumentation.instrument_pipeline() after its pipeline, e.g. 'pipeline:drawio_to_xl', so stages are
+             easy to find even when the stage function is a lambda.
+    """
+    code = frame.f_code
+    if code.co_filename == instrumentation.__file__:
+        if code.co_name == 'instrument':
+            return f'stage:{frame.f_locals.get("stage")}'
+        if code.co_name == 'wrapper':
+            return f'pipeline:{frame.f_locals.get("pipeline")}'
+    module = frame.f_globals.get('__name__', '?')
+    return f'{module}:{getattr(code, "co_qualname", code.co_name)}'
+
+
+def collapse_stack(frame):
+    """
+    Returns:
+        str: The stack ending in frame in the collapsed format flamegraph tools read: frame labels from the
+             outermost call inwards, separated by ';'.
+    """
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class Profiler:
+    """
+    Profiles a thread two ways at once: cProfile for exact call counts and times (written as .pstats), and a
+    sampler thread that records the thread's full stack every SAMPLE_INTERVAL (written as collapsed stacks for a
+    flame graph).  cProfile's overhead inflates the sampled times of call-heavy code, so read the flame graph for
+    where time goes and the pstats for exact numbers.
+
+    A profiler can be started and stopped many times, e.g. once per file of a batch, and profiles from other
+    processes can be merged in with add(), so one profile covers a whole batch.
+
+    Args:
+        interval (float): The sampling interval in seconds.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.stats = None
+        self._profile = None
+        self._sampler = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """
+        Start profiling the calling thread.
+        """
+        thread_id = threading.get_ident()
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample, args=(thread_id,), name='drawio_xl-profiler',
+                                         daemon=True)
+        # The sampler only runs when the profiled thread gives up the GIL, so make it do so at least as often
+        _lower_switch_interval(self.interval)
+        self._sampler.start()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self):
+        """
+        Stop profiling and add what was profiled since start() to the totals.
+        """
+        self._profile.disable()
+        self._stop.set()
+        self._sampler.join()
+        _restore_switch_interval()
+        self._add_stats(pstats.Stats(self._profile))
+        self._profile = self._sampler = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def export(self):
+        """
+        Returns:
+            tuple: The pstats dict and the stack counts, picklable so a worker process can send them to add().
+        """
+        return (self.stats.stats if self.stats else {}), dict(self.stacks)
+
+    def add(self, stats, stacks):
+        """
+        Merge in a profile exported by another Profiler, e.g. one run by a batch worker.
+        """
+        if stats:
+            self._add_stats(pstats.Stats(_RawStats(stats)))
+        self.stacks.update(stacks)
+
+    def write(self, prefix):
+        """
+        Write the profile to prefix + '.pstats' (for pstats, snakeviz and the like) and prefix + '.collapsed' (one
+        'frame;frame;frame count' line per stack, for flamegraph.pl, speedscope or inferno).
+        """
+        if self.stats is not None:
+            self.stats.dump_stats(prefix + '.pstats')
+        with open(prefix + '.collapsed', 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f'{stack} {count}\n')
+
+    def _add_stats(self, stats):
+        if self.stats is None:
+            self.stats = stats
+        else:
+            self.stats.add(stats)
+
+    def _sample(self, thread_id):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+
+
+# The process's Profiler, or None when profiling is off
+_profiler = None
+
+
+def get_profiler():
+    """
+    Returns:
+        Profiler: The profiler started by start_profiling(), or None.
+    """
+    return _profiler
+
+
+def start_profiling(prefix):
+    """
+    Profile the rest of this process and write prefix.pstats and prefix.collapsed when it exits.  This is what
+    --profile does.
+
+    Returns:
+        Profiler: The running profiler.
+    """
+    global _profiler
+    _profiler = Profiler()
+    _profiler.start()
+    if multiprocessing.parent_process() is None:
+        atexit.register(_finish_profiling, _profiler, prefix)
+    return _profiler
+
+
+def _finish_profiling(profiler, prefix):
+    profiler.stop()
+    profiler.write(prefix)
+    print(f'Profile written to {prefix}.pstats and {prefix}.collapsed', file=sys.stderr)
+
+
+def profile_call(fn, *args):
+    """
+    Call fn(*args) under a new Profiler.  Batch workers use it so the parent can merge their profiles.
+
+    Returns:
+        tuple: What fn returned and the exported profile (see Profiler.export).
+    """
+    profiler = Profiler()
+    with profiler:
+        result = fn(*args)
+    return result, profiler.export()
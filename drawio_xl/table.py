@@ -0,0 +1,249 @@
+import csv
+import io
+import itertools
+
+
+class SparseColumn:
+    """
+    A column that only stores the rows that have a value, such as a decision branch column that is empty on
+    every row that is not a decision.  It reads like a list of str: rows that are not stored hold default.
+
+    Args:
+        values (dict): Row position to value, for the rows that have one.
+        length (int): The number of rows.
+        default (str): The value of every other row.
+    """
+    __slots__ = ('values', 'length', 'default')
+
+    def __init__(self, values, length, default=''):
+        self.values = values
+        self.length = length
+        self.default = default
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        if not self.values:
+            return itertools.repeat(self.default, self.length)
+        return map(self.values.get, range(self.length), itertools.repeat(self.default))
+
+    def __getitem__(self, index):
+        return self.values.get(self._position(index), self.default)
+
+    def __setitem__(self, index, value):
+        index = self._position(index)
+        if value == self.default:
+            self.values.pop(index, None)
+        else:
+            self.values[index] = value
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return f'SparseColumn({self.values!r}, {self.length!r})'
+
+    def map(self, fn):
+        """
+        Returns:
+            SparseColumn: fn applied to every value.  Only the stored values are visited when fn leaves the
+                          default alone; otherwise the result is a list.
+        """
+        if fn(self.default) != self.default:
+            return list(map(fn, self))
+        return SparseColumn({index: fn(value) for index, value in self.values.items()}, self.length, self.default)
+
+    def compress(self, mask):
+        """
+        Returns:
+            SparseColumn: The rows whose entry in mask is true, renumbered.
+        """
+        mask = list(mask)
+        positions = list(itertools.accumulate(map(bool, mask), initial=0))
+        values = {positions[index]: value for index, value in self.values.items() if mask[index]}
+        return SparseColumn(values, positions[-1], self.default)
+
+    def _position(self, index):
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('column index out of range')
+        return index
+
+
+class Table:
+    """
+    A column-oriented CSV table: one list of values per column and a header-to-position index.
+
+    Deleting, renaming and reordering columns only rearrange the header and column lists, so they cost the
+    number of columns rather than the number of rows.  Transforming one column touches only that column's list.
+    Rows are only materialized when the table is written out.
+
+    Args:
+        headers (list): The column names.
+        columns (list): One list of str (or SparseColumn) per header, all of the same length.
+        length (int, optional): The number of rows.  Only needed for a table without columns.
+    """
+    __slots__ = ('headers', 'columns', 'length', '_positions')
+
+    def __init__(self, headers, columns, length=None):
+        self.headers = list(headers)
+        self.columns = list(columns)
+        self.length = len(self.columns[0]) if self.columns else length or 0
+        self._positions = None
+
+    @classmethod
+    def from_rows(cls, headers, rows, chunk_size=10000):
+        """
+        Build a table from an iterable of rows.  Rows are transposed chunk_size at a time, so at most one chunk of
+        rows is held next to the columns.  Rows shorter than the headers are padded with '' and longer ones are cut
+        to the header width.
+
+        Returns:
+            Table: The table.
+        """
+        width = len(headers)
+        columns = [[] for _ in headers]
+        length = 0
+        rows = iter(rows)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            length += len(chunk)
+            if min(map(len, chunk)) != width or max(map(len, chunk)) != width:
+                chunk = [list(row[:width]) + [''] * (width - len(row)) for row in chunk]
+            for column, values in zip(columns, zip(*chunk)):
+                column.extend(values)
+        return cls(headers, columns, length)
+
+    @classmethod
+    def read(cls, input_stream):
+        """
+        Returns:
+            Table: The table parsed from CSV content whose first row holds the headers.
+        """
+        reader = csv.reader(input_stream)
+        return cls.from_rows(next(reader), reader)
+
+    def rows(self):
+        """
+        Returns:
+            iterator: The rows as tuples, built lazily from the columns.
+        """
+        if not self.columns:
+            return itertools.repeat((), self.length)
+        return zip(*self.columns)
+
+    def write(self, frontmatter=''):
+        """
+        Returns:
+            io.StringIO: The table as CSV content, preceded by frontmatter.
+        """
+        output_stream = io.StringIO()
+        output_stream.write(frontmatter)
+        writer = csv.writer(output_stream, lineterminator='\n')
+        writer.writerow(self.headers)
+        writer.writerows(self.rows())
+        output_stream.seek(0)
+        return output_stream
+
+    def __len__(self):
+        return self.length
+
+    def __contains__(self, name):
+        return name in self._index()
+
+    def position(self, name):
+        """
+        Returns:
+            int: The position of the first column called name.
+
+        Raises:
+            ValueError: If there is no such column, as list.index does.
+        """
+        try:
+            return self._index()[name]
+        except KeyError:
+            raise ValueError(f'{name!r} is not a column') from None
+
+    def column(self, name):
+        """
+        Returns:
+            list: The values of the named column.  Changes to the list change the table.
+        """
+        return self.columns[self.position(name)]
+
+    def set_column(self, name, values):
+        self.columns[self.position(name)] = values
+
+    def map_column(self, name, fn):
+        """
+        Replace every value of the named column with fn(value).
+        """
+        position = self.position(name)
+        column = self.columns[position]
+        self.columns[position] = column.map(fn) if isinstance(column, SparseColumn) else list(map(fn, column))
+
+    def add_column(self, name, values):
+        """
+        Append a column.  values must have one entry per row.
+        """
+        self.headers.append(name)
+        self.columns.append(values)
+        self._positions = None
+
+    def delete_column(self, name):
+        """
+        Remove the first column called name.
+
+        Returns:
+            bool: False if there was no such column.
+        """
+        if name not in self:
+            return False
+        self.keep([position for position in range(len(self.headers)) if position != self.position(name)])
+        return True
+
+    def rename(self, headers):
+        """
+        Give the columns new names, in column order.
+        """
+        if len(headers) != len(self.headers):
+            raise ValueError(f'Expected {len(self.headers)} headers, got {len(headers)}')
+        self.headers = list(headers)
+        self._positions = None
+
+    def select(self, names):
+        """
+        Keep only the named columns, in the given order.
+        """
+        self.keep([self.position(name) for name in names])
+
+    def keep(self, positions):
+        """
+        Keep only the columns at the given positions, in the given order.
+        """
+        self.headers = [self.headers[position] for position in positions]
+        self.columns = [self.columns[position] for position in positions]
+        self._positions = None
+
+    def filter_rows(self, mask):
+        """
+        Keep only the rows whose entry in mask is true.
+        """
+        mask = list(mask)
+        if all(mask):
+            return
+        self.columns = [column.compress(mask) if isinstance(column, SparseColumn) else list(itertools.compress(column, mask))
+                        for column in self.columns]
+        self.length = sum(map(bool, mask))
+
+    def _index(self):
+        if self._positions is None:
+            # The first of duplicate headers wins, as with list.index
+            self._positions = {}
+            for position, header in enumerate(self.headers):
+                self._positions.setdefault(header, position)
+        return self._positions
@@ -0,0 +1,492 @@
+import argparse
+import collections
+import html
+import io
+import re
+import xml.etree.ElementTree as ET
+import xml.sax.saxutils
+
+if __package__:
+    from drawio_xl.drawio_to_xl import inflate_diagram
+    from drawio_xl.encoding import open_input
+    from drawio_xl.mxgraph import read_drawio_csv
+    from drawio_xl.mxgraph import build_graph
+    from drawio_xl.mxgraph import format_number
+    from drawio_xl.mxgraph import LAYER_CELL_ID
+    from drawio_xl.xl_to_drawio import prepare_drawio_csv
+else:
+    from drawio_to_xl import inflate_diagram
+    from encoding import open_input
+    from mxgraph import read_drawio_csv
+    from mxgraph import build_graph
+    from mxgraph import format_number
+    from mxgraph import LAYER_CELL_ID
+    from xl_to_drawio import prepare_drawio_csv
+
+GRAPH_ROOT_PATTERN = re.compile(r'<mxGraphModel\b(?:[^>"\']|"[^"]*"|\'[^\']*\')*>\s*<root\s*>')
+
+# The next thing inside <root>: a comment, the closing tag, or the start tag of a top-level cell
+PAGE_TOKEN_PATTERN = re.compile(r'\s*(?:(<!--.*?-->)|(</root\s*>)|<([\w:.-]+)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>)',
+                                re.DOTALL)
+ATTRIBUTE_PATTERN = re.compile(r'([\w:.-]+)\s*=\s*"([^"]*)"')
+SINGLE_QUOTED_ATTRIBUTE_PATTERN = re.compile(r'([\w:.-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+MX_CELL_PATTERN = re.compile(r'<mxCell\b((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>')
+MX_GEOMETRY_PATTERN = re.compile(r'<mxGeometry\b((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>')
+ATTRIBUTE_WHITESPACE = str.maketrans('\t\n\r', '   ')
+NAMED_ENTITIES = {'&quot;': '"', '&apos;': "'"}
+
+OBJECT_TAGS = ('UserObject', 'object')
+
+
+def parse_attributes(text):
+    """
+    Returns:
+        dict: The attributes in the text of a start tag, unescaped and whitespace-normalized as an XML parser would.
+    """
+    if "'" in text:
+        attributes = {name: double or single for name, double, single in SINGLE_QUOTED_ATTRIBUTE_PATTERN.findall(text)}
+    else:
+        attributes = dict(ATTRIBUTE_PATTERN.findall(text))
+    for name, value in attributes.items():
+        if '\n' in value or '\t' in value or '\r' in value:
+            value = attributes[name] = value.translate(ATTRIBUTE_WHITESPACE)
+        if '&' in value:
+            attributes[name] = html.unescape(value) if '&#' in value else xml.sax.saxutils.unescape(value, NAMED_ENTITIES)
+    return attributes
+
+
+def parse_style(style):
+    """
+    Returns:
+        dict: The key=value pairs of an mxCell style.  Bare flags such as 'html' map to None.
+    """
+    pairs = {}
+    for item in style.split(';'):
+        if item:
+            key, separator, value = item.partition('=')
+            pairs[key] = value if separator else None
+    return pairs
+
+
+class Cell:
+    """
+    A top-level cell of a page as found by scan_page: its tag and attributes, where its XML is in the file, and
+    the Element once it has been parsed for editing.  Cells added by a PagePatch have no XML, only an Element.
+    """
+    __slots__ = ('tag', 'attrib', 'start', 'end', 'xml', 'element')
+
+    def __init__(self, tag, attrib, start=None, end=None, xml=None):
+        self.tag = tag
+        self.attrib = attrib
+        self.start = start
+        self.end = end
+        self.xml = xml
+        self.element = None
+
+    def load(self):
+        """
+        Returns:
+            xml.etree.ElementTree.Element: The cell parsed from its XML, parsed only once.
+        """
+        if self.element is None:
+            self.element = ET.fromstring(self.xml)
+        return self.element
+
+    @property
+    def style(self):
+        """The style of the cell, or of the mxCell nested in a UserObject."""
+        if self.element is not None:
+            mx_cell = self.element if self.element.tag == 'mxCell' else self.element.find('mxCell')
+            return mx_cell.get('style', '') if mx_cell is not None else ''
+        if self.tag == 'mxCell':
+            return self.attrib.get('style', '')
+        match = MX_CELL_PATTERN.search(self.xml)
+        return parse_attributes(match.group(1)).get('style', '') if match else ''
+
+    @property
+    def geometry(self):
+        """The attributes of the cell's mxGeometry, or None."""
+        if self.element is not None:
+            geometry = self.element.find('.//mxGeometry')
+            return geometry.attrib if geometry is not None else None
+        match = MX_GEOMETRY_PATTERN.search(self.xml)
+        return parse_attributes(match.group(1)) if match else None
+
+
+def scan_page(data):
+    """
+    Find the top-level cells of the first page of an uncompressed .drawio file without building a tree.  Only the
+    start tags of the cells are tokenized; their content is skipped up to the matching end tag, which is safe
+    because draw.io never nests a cell in a cell of the same tag.
+
+    Args:
+        data (str): The .drawio XML.
+
+    Returns:
+        tuple: The cells (list of Cell, in document order) and the offset of the page's </root> tag.
+
+    Raises:
+        ValueError: If the file has no uncompressed mxGraphModel, or its <root> cannot be tokenized.
+    """
+    match = GRAPH_ROOT_PATTERN.search(data)
+    if match is None:
+        raise ValueError('The .drawio file has no uncompressed mxGraphModel')
+
+    cells = []
+    position = match.end()
+    while True:
+        match = PAGE_TOKEN_PATTERN.match(data, position)
+        if match is None:
+            raise ValueError(f'Unexpected content in the .drawio <root> at offset {position}')
+        comment, root_end, tag, attributes = match.groups()
+        if root_end:
+            return cells, match.start(2)
+        position = match.end()
+        if comment:
+            continue
+
+        start = match.start(3) - 1
+        if not attributes.endswith('/'):
+            end_tag = data.find(f'</{tag}', position)
+            if end_tag < 0:
+                raise ValueError(f'Unclosed <{tag}> in the .drawio <root> at offset {start}')
+            position = data.index('>', end_tag) + 1
+        cells.append(Cell(tag, parse_attributes(attributes), start, position, data[start:position]))
+
+
+def decompress_drawio(data):
+    """
+    Returns:
+        str: The .drawio file with a compressed first page replaced by its mxGraphModel, or data unchanged.
+    """
+    if '<mxGraphModel' in data:
+        return data
+    document = ET.fromstring(data)
+    diagram = document if document.tag == 'diagram' else document.find('diagram')
+    if diagram is None or not (diagram.text or '').strip():
+        return data
+    graph_model = ET.fromstring(b''.join(inflate_diagram(diagram.text)))
+    diagram.text = None
+    diagram.append(graph_model)
+    return ET.tostring(document, encoding='unicode')
+
+
+class PagePatch:
+    """
+    The pending edits of a page: replaced and deleted cells, and cells appended before </root>.  UserObjects are
+    indexed by xl_id and edges by source and target cell id.
+    """
+
+    def __init__(self, data, cells, root_end):
+        self.data = data
+        self.root_end = root_end
+        self.cell_ids = set()
+        self.objects = {}
+        self.cell_by_id = {}
+        self.outgoing = collections.defaultdict(list)
+        self.incoming = collections.defaultdict(list)
+        self.replaced = {}
+        self.appended = []
+        self.next_id = 0
+        for cell in cells:
+            cell_id = cell.attrib.get('id')
+            self.cell_ids.add(cell_id)
+            self.cell_by_id[cell_id] = cell
+            if cell.tag in OBJECT_TAGS and cell.attrib.get('xl_id'):
+                self.objects[cell.attrib['xl_id']] = cell
+            elif cell.tag == 'mxCell' and cell.attrib.get('edge') == '1':
+                self.outgoing[cell.attrib.get('source')].append(cell)
+                self.incoming[cell.attrib.get('target')].append(cell)
+
+    def new_cell_id(self):
+        """
+        Returns:
+            str: A cell id not used on the page.
+        """
+        while True:
+            self.next_id += 1
+            cell_id = f'xl-{self.next_id}'
+            if cell_id not in self.cell_ids:
+                self.cell_ids.add(cell_id)
+                return cell_id
+
+    def edit(self, cell):
+        """
+        Returns:
+            xml.etree.ElementTree.Element: The cell's element, which is written back when the page is rendered.
+        """
+        if cell.start is None:
+            return cell.element
+        self.replaced[cell.start] = cell
+        return cell.load()
+
+    def delete(self, cell):
+        if cell.start is None:
+            self.appended.remove(cell)
+        else:
+            cell.xml = None
+            self.replaced[cell.start] = cell
+
+    def append(self, element):
+        """
+        Add a new top-level cell, returning a Cell that indexes it like the scanned ones.
+        """
+        cell = Cell(element.tag, element.attrib)
+        cell.element = element
+        self.appended.append(cell)
+        self.cell_by_id[element.get('id')] = cell
+        return cell
+
+    def render(self):
+        """
+        Returns:
+            str: The page with every edit applied.  Text outside the edited cells is copied unchanged.
+        """
+        pieces = []
+        position = 0
+        for start in sorted(self.replaced):
+            cell = self.replaced[start]
+            pieces.append(self.data[position:cell.start])
+            if cell.xml is not None:
+                pieces.append(ET.tostring(cell.element, encoding='unicode'))
+            position = cell.end
+        # New cells go on their own lines before the line holding </root>
+        line_start = self.data.rfind('\n', position, self.root_end) + 1
+        if line_start == 0 or self.data[line_start:self.root_end].strip():
+            line_start = self.root_end
+        pieces.append(self.data[position:line_start])
+        for cell in self.appended:
+            pieces.append(ET.tostring(cell.element, encoding='unicode') + '\n')
+        pieces.append(self.data[line_start:])
+        return ''.join(pieces)
+
+
+def patch_diagram(patch, directives, headers, rows):
+    """
+    Bring the cells of a page in line with a draw.io CSV import, touching only the rows that differ.
+
+    Rows are matched to UserObjects by xl_id.  For a matched row, changed attributes are set in place.  The style
+    is regenerated only when the shape or the style column (e.g. status) changed; width and height only when the
+    shape did.  Its outgoing edges are diffed: edges that still exist keep their id and waypoints, labels are
+    updated and the rest are added or removed.  New rows are added next to a predecessor, or below the diagram,
+    and UserObjects whose xl_id is no longer in the CSV are removed with their edges.  Cells that do not come
+    from Excel (no xl_id) are never touched.
+
+    Args:
+        patch (PagePatch): The page, which collects the edits.
+        directives (dict): The frontmatter directives, see mxgraph.parse_frontmatter.
+        headers (list): The CSV headers.
+        rows (list): The CSV rows.
+
+    Returns:
+        dict: The xl_ids that were 'changed', 'added' and 'removed'.
+    """
+    vertices, edges = build_graph(directives, headers, rows)
+    desired = {vertex['values']['xl_id']: vertex for vertex in vertices}
+    xl_id_by_vertex = {vertex['id']: xl_id for xl_id, vertex in desired.items()}
+    desired_outgoing = collections.defaultdict(list)
+    for edge in edges:
+        desired_outgoing[xl_id_by_vertex[edge['source']]].append(edge)
+
+    stylename = directives.get('stylename')
+    added = [xl_id for xl_id in desired if xl_id not in patch.objects]
+    removed = [xl_id for xl_id in patch.objects if xl_id not in desired]
+    changed = []
+
+    for xl_id in added:
+        patch.objects[xl_id] = patch.append(new_user_object(patch.new_cell_id(), desired[xl_id]))
+
+    for xl_id in removed:
+        cell = patch.objects.pop(xl_id)
+        cell_id = cell.attrib['id']
+        patch.delete(cell)
+        for edge in patch.outgoing.pop(cell_id, []) + patch.incoming.pop(cell_id, []):
+            patch.delete(edge)
+            for index, end in ((patch.outgoing, 'source'), (patch.incoming, 'target')):
+                if edge in index.get(edge.attrib.get(end), []):
+                    index[edge.attrib.get(end)].remove(edge)
+
+    for xl_id, vertex in desired.items():
+        cell = patch.objects[xl_id]
+        is_new = xl_id in added
+        row_changed = not is_new and update_user_object(patch, cell, vertex, stylename)
+        target_ids = [patch.objects[xl_id_by_vertex[edge['target']]].attrib['id'] for edge in desired_outgoing[xl_id]]
+        edges_changed = update_edges(patch, cell.attrib['id'], desired_outgoing[xl_id], target_ids)
+        if not is_new and (row_changed or edges_changed):
+            changed.append(xl_id)
+
+    place_new_objects(patch, [patch.objects[xl_id] for xl_id in added], directives)
+    return {'changed': changed, 'added': added, 'removed': removed}
+
+
+def new_user_object(cell_id, vertex):
+    """
+    Returns:
+        xml.etree.ElementTree.Element: A UserObject for a new row.  Its position is set by place_new_objects.
+    """
+    element = ET.Element('UserObject', dict(vertex['attributes']))
+    element.set('id', cell_id)
+    cell = ET.SubElement(element, 'mxCell', {'style': vertex['style'], 'parent': LAYER_CELL_ID, 'vertex': '1'})
+    ET.SubElement(cell, 'mxGeometry', {'width': format_number(vertex['width']),
+                                       'height': format_number(vertex['height']), 'as': 'geometry'})
+    return element
+
+
+def update_user_object(patch, cell, vertex, stylename):
+    """
+    Set the attributes, style and size of an existing UserObject that differ from its row.  The cell is only
+    parsed when something differs.
+
+    Returns:
+        bool: True if anything was changed.
+    """
+    attrib = cell.attrib
+    changed_attributes = [(name, value) for name, value in vertex['attributes'] if attrib.get(name) != value]
+    old_style = cell.style
+    old_shape = new_shape = None
+    if old_style != vertex['style']:
+        old_shape = parse_style(old_style).get('shape')
+        new_shape = parse_style(vertex['style']).get('shape')
+    restyle = old_shape != new_shape or bool(stylename and attrib.get(stylename) != vertex['values'].get(stylename))
+    if not changed_attributes and not restyle:
+        return False
+
+    element = patch.edit(cell)
+    for name, value in changed_attributes:
+        element.set(name, value)
+    mx_cell = element.find('mxCell')
+    if restyle and mx_cell is not None:
+        mx_cell.set('style', vertex['style'])
+        geometry = mx_cell.find('mxGeometry')
+        if old_shape != new_shape and geometry is not None:
+            geometry.set('width', format_number(vertex['width']))
+            geometry.set('height', format_number(vertex['height']))
+    return True
+
+
+def update_edges(patch, cell_id, desired_edges, target_ids):
+    """
+    Diff the edges leaving cell_id against the desired ones.  An existing edge to the same target is reused,
+    preferring one that already has the right label, so its waypoints survive.
+
+    Returns:
+        bool: True if any edge was added, removed or relabelled.
+    """
+    existing = patch.outgoing.get(cell_id, [])
+    if [(edge.attrib.get('target'), edge.attrib.get('value', '')) for edge in existing] == \
+            [(target_id, edge['value']) for target_id, edge in zip(target_ids, desired_edges)]:
+        return False
+
+    modified = False
+    unmatched = list(existing)
+    for target_id, desired_edge in zip(target_ids, desired_edges):
+        candidates = [edge for edge in unmatched if edge.attrib.get('target') == target_id]
+        match = next((edge for edge in candidates if edge.attrib.get('value', '') == desired_edge['value']),
+                     candidates[0] if candidates else None)
+        if match is None:
+            element = ET.Element('mxCell', {
+                'id': patch.new_cell_id(), 'value': desired_edge['value'], 'style': desired_edge['style'],
+                'parent': LAYER_CELL_ID, 'source': cell_id, 'target': target_id, 'edge': '1'})
+            ET.SubElement(element, 'mxGeometry', {'relative': '1', 'as': 'geometry'})
+            edge = patch.append(element)
+            patch.outgoing[cell_id].append(edge)
+            patch.incoming[target_id].append(edge)
+            modified = True
+        else:
+            unmatched.remove(match)
+            if match.attrib.get('value', '') != desired_edge['value']:
+                patch.edit(match).set('value', desired_edge['value'])
+                match.attrib = match.element.attrib
+                modified = True
+
+    for edge in unmatched:
+        patch.delete(edge)
+        patch.outgoing[cell_id].remove(edge)
+        patch.incoming[edge.attrib.get('target')].remove(edge)
+    return modified or bool(unmatched)
+
+
+def get_box(cell):
+    """
+    Returns:
+        tuple: x, y, width and height of a cell, or None if it has no geometry.
+    """
+    geometry = cell.geometry
+    if geometry is None:
+        return None
+    return tuple(float(geometry.get(name, 0)) for name in ('x', 'y', 'width', 'height'))
+
+
+def place_new_objects(patch, new_cells, directives):
+    """
+    Give new UserObjects a position: levelspacing to the right of a placed predecessor if there is one,
+    otherwise in a row below the existing diagram.  Existing geometry is not moved.
+    """
+    if not new_cells:
+        return
+    nodespacing = float(directives.get('nodespacing', 100))
+    levelspacing = float(directives.get('levelspacing', 200))
+    pending = {cell.attrib['id'] for cell in new_cells}
+
+    below = None
+    for cell in new_cells:
+        sources = (patch.cell_by_id.get(edge.attrib.get('source')) for edge in patch.incoming.get(cell.attrib['id'], []))
+        predecessor = next((source for source in sources
+                            if source is not None and source.attrib.get('id') not in pending and get_box(source)), None)
+        geometry = cell.element.find('mxCell/mxGeometry')
+        if predecessor is not None:
+            x, y, width, _ = get_box(predecessor)
+            geometry.set('x', format_number(x + width + levelspacing))
+            geometry.set('y', format_number(y))
+        else:
+            if below is None:
+                boxes = [get_box(other) for other in patch.objects.values() if other.attrib['id'] not in pending]
+                boxes = [box for box in boxes if box is not None]
+                below = [min((box[0] for box in boxes), default=20),
+                         max((box[1] + box[3] for box in boxes), default=20 - nodespacing) + nodespacing]
+            geometry.set('x', format_number(below[0]))
+            geometry.set('y', format_number(below[1]))
+            below[0] += float(geometry.get('width')) + nodespacing
+        pending.discard(cell.attrib['id'])
+
+
+def update_drawio(drawio_stream, xl_stream):
+    """
+    Apply an edited Excel CSV to the .drawio previously generated from it, instead of regenerating the diagram.
+
+    The CSV goes through the same steps as xl_to_drawio up to the draw.io import, then patch_diagram updates the
+    first page.  The page is scanned for its cells without building a tree; only changed cells are parsed and
+    re-serialized, and every other byte of the file is copied through unchanged, so manual layout and styling
+    of untouched rows is kept exactly.  A compressed page is written back uncompressed.
+
+    Args:
+        drawio_stream (io.StringIO): The existing .drawio XML.
+        xl_stream (io.StringIO): The edited Excel CSV.
+
+    Returns:
+        tuple: An io.StringIO with the updated .drawio XML, and the changes reported by patch_diagram.
+    """
+    data = decompress_drawio(drawio_stream.read())
+    patch = PagePatch(data, *scan_page(data))
+    directives, headers, rows = read_drawio_csv(prepare_drawio_csv(xl_stream))
+    changes = patch_diagram(patch, directives, headers, rows)
+    return io.StringIO(patch.render()), changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Update a .drawio generated by xl_to_drawio from an edited Excel CSV, '
+                                                 'keeping the layout of unchanged steps.')
+    parser.add_argument('drawio_file', help='The .drawio file to update.')
+    parser.add_argument('input_file', help='The edited Excel CSV file.')
+    parser.add_argument('output_file', nargs='?', help='Where to write the updated .drawio (default: drawio_file).')
+    args = parser.parse_args()
+
+    with open_input(args.drawio_file) as drawio_stream, open_input(args.input_file) as xl_stream:
+        output_stream, changes = update_drawio(drawio_stream, xl_stream)
+
+    with open(args.output_file or args.drawio_file, 'w') as f:
+        f.write(output_stream.getvalue())
+    print(', '.join(f'{len(xl_ids)} {kind}' for kind, xl_ids in changes.items()))
+
+if __name__ == '__main__':
+    main()
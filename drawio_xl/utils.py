@@ -1,60 +1,252 @@
+import codecs
 import csv
 import io
-import re
-
-def delete_column(input_stream, column_name):
+import itertools
+import shutil
+
+if __package__:
+    from drawio_xl.config import DECISION_HEADER_PATTERN
+    from drawio_xl.config import get_compiled_config
+    from drawio_xl.encoding import DEFAULT_CHUNK_SIZE
+    from drawio_xl.instrumentation import instrument
+    from drawio_xl.table import Table
+    from drawio_xl.table import SparseColumn
+else:
+    from config import DECISION_HEADER_PATTERN
+    from config import get_compiled_config
+    from encoding import DEFAULT_CHUNK_SIZE
+    from instrumentation import instrument
+    from table import Table
+    from table import SparseColumn
+
+def read_table(input_stream):
     """
-    Remove a column from the CSV content.
+    Read CSV content into a header list and a list of rows.
 
     Args:
     input_stream (io.StringIO): The input stream from which to read the CSV content.
-    column_name (str): The name of the column to remove.
 
     Returns:
-    io.StringIO: The CSV content without the specified column.
+    tuple: The headers (list of str) and the rows (list of lists of str).
     """
     reader = csv.reader(input_stream)
+    headers = next(reader)
+    return headers, list(reader)
+
+def iter_csv(headers, rows, frontmatter='', rows_per_chunk=1000):
+    """
+    Serialize a header list and an iterable of rows to CSV content lazily.  This is the generator
+    counterpart of write_table: each chunk can be written out and dropped before the next is built.
+
+    Args:
+    headers (list): The CSV headers.
+    rows (iterable): The rows to write.
+    frontmatter (str): Optional text written before the headers.
+    rows_per_chunk (int): How many rows are serialized into each chunk.
+
+    Returns:
+    generator: The CSV content as str chunks, the first holding the frontmatter and headers.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    buffer.write(frontmatter)
+    writer.writerow(headers)
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, rows_per_chunk))
+        writer.writerows(chunk)
+        if buffer.tell():
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if len(chunk) < rows_per_chunk:
+            return
+
+def write_table(headers, rows, frontmatter=''):
+    """
+    Serialize a header list and an iterable of rows to CSV content in a single pass.
+
+    Args:
+    headers (list): The CSV headers.
+    rows (iterable): The rows to write.  Any iterable of lists works, including a generator.
+    frontmatter (str): Optional text written before the headers.
+
+    Returns:
+    io.StringIO: The CSV content.
+    """
     output_stream = io.StringIO()
+    output_stream.write(frontmatter)
     writer = csv.writer(output_stream, lineterminator='\n')
+    writer.writerow(headers)
+    writer.writerows(rows)
+    output_stream.seek(0)
+    return output_stream
 
-    headers = next(reader)
-    if column_name in headers:
-        column_index = headers.index(column_name)
-        headers.remove(column_name)
+def write_csv(headers, rows, output_stream, frontmatter=''):
+    """
+    Serialize a header list and an iterable of rows straight to an output stream, a chunk at a time (see iter_csv),
+    so rows are written as they are produced and the CSV is never held whole.
 
-        writer.writerow(headers)
+    Args:
+    headers (list): The CSV headers.
+    rows (iterable): The rows to write.
+    output_stream (io.TextIOBase): Where to write, e.g. a file from encoding.open_output.
+    frontmatter (str): Optional text written before the headers.
 
-        for row in reader:
-            del row[column_index]
-            writer.writerow(row)
-    else:
-        input_stream.seek(0)
-        return input_stream
+    Returns:
+    io.TextIOBase: output_stream.
+    """
+    output_stream.writelines(iter_csv(headers, rows, frontmatter))
+    return output_stream
 
-    output_stream.seek(0)
+def copy_output(output, output_stream=None):
+    """
+    Write a finished output, e.g. one from the cache, to output_stream.
+
+    Args:
+    output (io.StringIO): The output, positioned at its start.
+    output_stream (io.TextIOBase): Where to write it.  Without one output is returned as it is.
+
+    Returns:
+    io.TextIOBase: output_stream, or output when there is none.
+    """
+    if output_stream is None:
+        return output
+    shutil.copyfileobj(output, output_stream)
     return output_stream
 
+def observer_enabled(observer):
+    """
+    Returns:
+    bool: True if intermediates should be captured for the observer (see observers.py).
+    """
+    return observer is not None and observer.enabled
+
+def run_stages(table, stages, observer=None, config=None):
+    """
+    Apply a sequence of table stages to a Table without re-serializing between them.
+
+    A stage is a callable that takes the Table and a CompiledConfig and changes the table in
+    place.  Column deletes, renames and reorders only touch the table's metadata, and value
+    transforms touch only the columns they concern.  Stages read their settings from the
+    config they are given, never from a Config of their own.
+
+    If an observer is enabled the CSV content after each stage is passed to the observer.  If
+    instrumentation is on (see instrumentation.py) every stage is recorded.
+
+    Args:
+    table (Table): The table to transform.
+    stages (list): The (name, stage) pairs to apply, in order.
+    observer (object): Optional stage observer, e.g. observers.DirectorySink.
+    config (CompiledConfig): The configuration passed to every stage.  Defaults to get_compiled_config().
+
+    Returns:
+    Table: The transformed table (the same object).
+    """
+    config = config or get_compiled_config()
+    capture = observer_enabled(observer)
+    for name, stage in stages:
+        instrument(name, stage, table, config)
+        if capture:
+            observer.observe(name, table.write().getvalue())
+    return table
+
+def apply_stages(input_stream, stages, observer=None, config=None):
+    """
+    Apply a sequence of table stages to CSV content.  This is the adapter between the Table
+    stages and the io.StringIO functions: the input is parsed into columns once, the whole
+    chain runs on them, and only the final CSV is built.
+
+    Args:
+    input_stream (io.StringIO): The input stream containing the CSV content.
+    stages (list): The (name, stage) pairs to apply, in order (see run_stages).
+    observer (object): Optional stage observer, e.g. observers.DirectorySink.
+    config (CompiledConfig): The configuration passed to every stage.  Defaults to get_compiled_config().
+
+    Returns:
+    io.StringIO: The transformed CSV content.
+    """
+    return run_stages(Table.read(input_stream), stages, observer, config).write()
+
+def apply_stage(input_stream, stage, config=None):
+    """
+    Apply a single table stage to CSV content.  This is the adapter that lets each
+    stream-based stage function share its logic with the fused pipelines.
+
+    Args:
+    input_stream (io.StringIO): The input stream containing the CSV content.
+    stage (callable): The stage to apply (see run_stages).
+    config (CompiledConfig): The configuration passed to the stage.  Defaults to get_compiled_config().
+
+    Returns:
+    io.StringIO: The transformed CSV content.
+    """
+    return apply_stages(input_stream, [(stage.__name__, stage)], config=config)
+
+def delete_column_stage(table, column_name):
+    """
+    Table stage that removes a column.  If the column is not present the table is unchanged.
+
+    Args:
+    table (Table): The table.
+    column_name (str): The name of the column to remove.
+    """
+    table.delete_column(column_name)
+
+def delete_column(input_stream, column_name):
+    """
+    Remove a column from the CSV content.
+
+    Args:
+    input_stream (io.StringIO): The input stream from which to read the CSV content.
+    column_name (str): The name of the column to remove.
+
+    Returns:
+    io.StringIO: The CSV content without the specified column.
+    """
+    table = Table.read(input_stream)
+    if column_name not in table:
+        input_stream.seek(0)
+        return input_stream
+    delete_column_stage(table, column_name)
+    return table.write()
+
 def delete_non_utf8(input_stream):
     """
-    Deletes non-UTF-8 characters from the input stream.
+    Deletes non-UTF-8 bytes from the input stream.
 
-    This function reads each line from the input stream, decodes it as UTF-8 while ignoring any errors,
-    and writes the line to a new output stream. The output stream is then returned.
+    The bytes are decoded as UTF-8 in chunks, dropping every byte that is not valid UTF-8, in a single
+    streaming pass.  A text stream has already been decoded, so its content is returned unchanged.  To
+    decode a file this way as it is read, open it with encoding.open_input(path, errors='ignore').
 
     Args:
-        input_stream (io.StringIO): The input stream.
+        input_stream (io.BufferedIOBase): The input stream, e.g. a file opened in 'rb' mode.
 
     Returns:
-        io.StringIO: The output stream with non-UTF-8 characters deleted.
+        io.StringIO: The output stream with non-UTF-8 bytes deleted.
     """
+    if isinstance(input_stream, io.TextIOBase):
+        return io.StringIO(input_stream.read())
+
+    decoder = codecs.getincrementaldecoder('utf-8')('ignore')
     output_stream = io.StringIO()
-    for line in input_stream:
-        line = line.decode('utf-8', 'ignore') # Decode the line as UTF-8, ignoring any errors
-        output_stream.write(line)
+    for chunk in iter(lambda: input_stream.read(DEFAULT_CHUNK_SIZE), b''):
+        output_stream.write(decoder.decode(chunk))
+    output_stream.write(decoder.decode(b'', final=True))
 
     output_stream.seek(0)
     return output_stream
 
+def delete_empty_cols_stage(table, config=None):
+    """
+    Table stage that removes every column whose header is empty.
+
+    Args:
+        table (Table): The table.
+        config (CompiledConfig): Unused.
+    """
+    table.keep([i for i, h in enumerate(table.headers) if h])
+
 def delete_empty_cols(input_stream):
     """
     Deletes empty columns from the input CSV stream.
@@ -71,21 +263,24 @@ def delete_empty_cols(input_stream):
     Note:
         This function assumes that the first row of the CSV contains the headers.
     """
-    output_stream = io.StringIO()
-    reader = csv.reader(input_stream)
-    writer = csv.writer(output_stream, lineterminator='\n')
+    return apply_stage(input_stream, delete_empty_cols_stage)
 
-    headers = next(reader)
-    indices = [i for i, h in enumerate(headers) if h]
+def is_empty_row(row):
+    """
+    Returns:
+        bool: True if every field of the row is empty or whitespace.
+    """
+    return not any(field.strip() for field in row)
 
-    # Write the non-empty headers to the output
-    writer.writerow([headers[i] for i in indices])
+def delete_empty_rows_stage(table, config=None):
+    """
+    Table stage that drops rows that are empty or contain only whitespace.
 
-    for row in reader:
-        writer.writerow([row[i] for i in indices])
-    
-    output_stream.seek(0)
-    return output_stream
+    Args:
+        table (Table): The table.
+        config (CompiledConfig): Unused.
+    """
+    table.filter_rows([not is_empty_row(row) for row in table.rows()])
 
 def delete_empty_rows(input_stream):
     """
@@ -100,15 +295,10 @@ def delete_empty_rows(input_stream):
     Returns:
         io.StringIO: The output stream with empty rows deleted.
     """
+    # The header row is filtered like any other row
+    rows = (row for row in csv.reader(input_stream) if not is_empty_row(row))
     output_stream = io.StringIO()
-    reader = csv.reader(input_stream)
-    writer = csv.writer(output_stream, lineterminator='\n')
-
-    for row in reader:
-        # Check if the row is not empty
-        if any(field.strip() for field in row):
-            writer.writerow(row)
-    
+    csv.writer(output_stream, lineterminator='\n').writerows(rows)
     output_stream.seek(0)
     return output_stream
 
@@ -220,7 +410,7 @@ def get_max_decision_count_from_headers(headers):
     # Check each header
     for header in headers:
         # If the header matches the pattern "decisionN_id" or "decisionN_label"
-        match = re.match(r'decision(\d+)_(id|label)', header)
+        match = DECISION_HEADER_PATTERN.match(header)
         if match:
             # Extract N from the header and convert it to an integer
             N = int(match.group(1))
@@ -230,6 +420,57 @@ def get_max_decision_count_from_headers(headers):
 
     return max_decision_count
 
+def get_decision_columns(branches, length, max_decision_count=None):
+    """
+    Build the 'decisionN_id' and 'decisionN_label' columns from a sparse decision edge list.
+
+    Only decision rows have branches, so the columns are SparseColumns that store those rows alone: a
+    30-way decision adds 60 columns to the CSV but nothing to the other rows in memory.
+
+    Args:
+        branches (dict): Row position to the list of (id, label) pairs of that decision row, in order.
+        length (int): The number of rows.
+        max_decision_count (int, optional): The number of column pairs.  Longer branch lists are cut.
+                                            Defaults to the longest branch list.
+
+    Returns:
+        list: (header, SparseColumn) pairs in the order decision0_id, decision0_label, decision1_id, ...
+    """
+    if max_decision_count is None:
+        max_decision_count = max(map(len, branches.values()), default=0)
+    id_values = [{} for _ in range(max_decision_count)]
+    label_values = [{} for _ in range(max_decision_count)]
+    for row_index, row_branches in branches.items():
+        for i, (decision_id, decision_label) in enumerate(row_branches[:max_decision_count]):
+            if decision_id:
+                id_values[i][row_index] = decision_id
+            if decision_label:
+                label_values[i][row_index] = decision_label
+
+    columns = []
+    for i in range(max_decision_count):
+        columns.append((f'decision{i}_id', SparseColumn(id_values[i], length)))
+        columns.append((f'decision{i}_label', SparseColumn(label_values[i], length)))
+    return columns
+
+def get_decision_branches(table, rows):
+    """
+    Read the sparse decision edge list back out of the 'decisionN_id' and 'decisionN_label' columns.
+
+    Args:
+        table (Table): The table.
+        rows (iterable): The row positions to read, usually the decision rows.
+
+    Returns:
+        dict: Row position to the list of (id, label) pairs of that row, one per column pair.
+    """
+    max_decision_count = get_max_decision_count_from_headers(table.headers)
+    id_columns = [table.column(f'decision{i}_id') for i in range(max_decision_count)]
+    label_columns = [table.column(f'decision{i}_label') for i in range(max_decision_count)]
+    return {row_index: [(id_column[row_index], label_column[row_index])
+                        for id_column, label_column in zip(id_columns, label_columns)]
+            for row_index in rows}
+
 def get_connect_frontmatter(max_decision_count, connector_style):
     """
     This function generates a string of connection instructions based on the provided max_decision_count and connector_style.  Each line of the string is terminated with a newline character.
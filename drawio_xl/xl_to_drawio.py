@@ -1,32 +1,78 @@
 import io
+import codecs
 import csv
-import subprocess
-import tempfile
+import functools
+import itertools
 import os
 import argparse
-
-
-if __name__ == '__main__':
-    from utils import delete_column
-    from utils import delete_non_utf8
-    from utils import delete_empty_cols
-    from utils import delete_empty_rows
+import sys
+
+
+# __mp_main__ is the name the script gets when process pool workers re-import it, and a module imported
+# by another script (no __package__) needs the same sibling imports
+if __name__ in ['__main__', '__mp_main__'] or not __package__:
+    from utils import delete_empty_cols_stage
+    from utils import delete_empty_rows_stage
+    from table import Table
+    from utils import run_stages
+    from utils import apply_stage
+    from utils import observer_enabled
+    from utils import copy_output
+    from observers import DirectorySink
+    from batch import is_batch_input
+    from batch import run_batch
+    from cache import open_cache
     from utils import get_max_decision_count_from_headers
-    from utils import get_max_decision_count_from_rows
+    from utils import get_decision_columns
     from utils import get_connect_frontmatter
     from utils import get_ignore_frontmatter
-    from config import Config
+    from config import get_compiled_config
+    from config import load_config
+    from instrumentation import METRICS_ENV_VAR
+    from instrumentation import METRICS_MEMORY_ENV_VAR
+    from instrumentation import enable_instrumentation
+    from instrumentation import instrument
+    from instrumentation import instrument_pipeline
+    from profiling import start_profiling
+    from encoding import open_input
+    from encoding import open_output
+    from encoding import DEFAULT_CHUNK_SIZE
+    from encoding import STDOUT
+    from mxgraph import csv_to_mxfile
+    from drawio_pool import get_drawio_backend
+    from drawio_pool import get_drawio_pool
 
 else:
-    from drawio_xl.utils import delete_column
-    from drawio_xl.utils import delete_non_utf8
-    from drawio_xl.utils import delete_empty_cols
-    from drawio_xl.utils import delete_empty_rows
+    from drawio_xl.utils import delete_empty_cols_stage
+    from drawio_xl.utils import delete_empty_rows_stage
+    from drawio_xl.table import Table
+    from drawio_xl.utils import run_stages
+    from drawio_xl.utils import apply_stage
+    from drawio_xl.utils import observer_enabled
+    from drawio_xl.utils import copy_output
+    from drawio_xl.observers import DirectorySink
+    from drawio_xl.batch import is_batch_input
+    from drawio_xl.batch import run_batch
+    from drawio_xl.cache import open_cache
     from drawio_xl.utils import get_max_decision_count_from_headers
-    from drawio_xl.utils import get_max_decision_count_from_rows
+    from drawio_xl.utils import get_decision_columns
     from drawio_xl.utils import get_connect_frontmatter
     from drawio_xl.utils import get_ignore_frontmatter
-    from drawio_xl.config import Config
+    from drawio_xl.config import get_compiled_config
+    from drawio_xl.config import load_config
+    from drawio_xl.instrumentation import METRICS_ENV_VAR
+    from drawio_xl.instrumentation import METRICS_MEMORY_ENV_VAR
+    from drawio_xl.instrumentation import enable_instrumentation
+    from drawio_xl.instrumentation import instrument
+    from drawio_xl.instrumentation import instrument_pipeline
+    from drawio_xl.profiling import start_profiling
+    from drawio_xl.encoding import open_input
+    from drawio_xl.encoding import open_output
+    from drawio_xl.encoding import DEFAULT_CHUNK_SIZE
+    from drawio_xl.encoding import STDOUT
+    from drawio_xl.drawio_pool import get_drawio_backend
+    from drawio_xl.drawio_pool import get_drawio_pool
+    from drawio_xl.mxgraph import csv_to_mxfile
 
 
 
@@ -46,6 +92,25 @@ else:
 # csv_to_drawio.sh > "$output_file"
 
 
+def rename_headers_stage(table, config):
+    """
+    Table stage that converts Excel headers to draw.io CSV headers (see rename_headers).  Only the
+    header names change.
+
+    Args:
+        table (Table): The table.
+        config (CompiledConfig): Supplies xl_to_drawio_header_mapping, the headers with a fixed name.
+    """
+    fixed_headers = config.xl_to_drawio_header_mapping
+    missing = [header for header in fixed_headers if header not in table]
+    if missing:
+        raise ValueError(f'{missing[0]!r} is not in list')
+
+    # rename fixed headers; for all other headers replace spaces with underscores and lowercase the header
+    # TODO lower case and underscore all
+    table.rename([fixed_headers[header] if header in fixed_headers else header.replace(' ', '_').lower()
+                  for header in table.headers])
+
 def rename_headers(input_stream):
     """
     Renames headers in the input CSV stream.
@@ -66,34 +131,27 @@ def rename_headers(input_stream):
     Note:
         This function assumes that the first row of the CSV contains the headers.
     """
+    return apply_stage(input_stream, rename_headers_stage)
 
-    #TODO these should come from a config file
-    fixed_headers = ['Process Step ID', 'Shape Type', 'Connector Label', 'Next Step ID']
-
-    output_stream = io.StringIO()
-    reader = csv.reader(input_stream)
-    writer = csv.writer(output_stream, lineterminator='\n')
-
-    headers = next(reader)
-
-    # for all headers not in fixed_headers, replace spaces with underscores and lowercase the header
-    # TODO lower case and underscore all
-    headers = [header.replace(' ', '_').lower() if header not in fixed_headers else header for header in headers]
-
-    # rename fixed headers
-    # TODO add to config file but keys are lower case and underscored
-    headers[headers.index('Process Step ID')] = 'id'
-    headers[headers.index('Shape Type')] = 'shape'
-    headers[headers.index('Connector Label')] = 'connector_label'
-    headers[headers.index('Next Step ID')] = 'next_step_id'
+def lower_column_case_stage(table, column_name):
+    """
+    Table stage that converts the values of a column to lowercase.
 
-    writer.writerow(headers)
+    Args:
+        table (Table): The table.
+        column_name (str): The column to convert.
+    """
+    table.map_column(column_name, str.lower)
 
-    for row in reader:
-        writer.writerow(row)
+def lower_shape_case_stage(table, config=None):
+    """
+    Table stage that converts the 'shape' column values to lowercase.
 
-    output_stream.seek(0)
-    return output_stream
+    Args:
+        table (Table): The table.
+        config (CompiledConfig): Unused.
+    """
+    lower_column_case_stage(table, "shape")
 
 def lower_shape_case(input_stream):
     """
@@ -108,27 +166,17 @@ def lower_shape_case(input_stream):
     Returns:
         io.StringIO: The output stream with 'shape' column values converted to lowercase.
     """
-    output_stream = io.StringIO()
-    reader = csv.reader(input_stream)
-    writer = csv.writer(output_stream, lineterminator='\n')
+    return apply_stage(input_stream, lower_shape_case_stage)
 
-    # Get the headers from the first row
-    headers = next(reader)
-    # Find the index of the "shape" column
-    shape_type_index = headers.index("shape")
-
-    # Write the headers to the output
-    writer.writerow(headers)
-
-    # Iterate over the rows in the original CSV file
-    for row in reader:
-        # Convert the "shape" entry to lowercase
-        row[shape_type_index] = row[shape_type_index].lower()
-        # Write the modified row to the new CSV file
-        writer.writerow(row)
-    
-    output_stream.seek(0)
-    return output_stream
+def lower_status_case_stage(table, config=None):
+    """
+    Table stage that converts the 'status' column values to lowercase.
+
+    Args:
+        table (Table): The table.
+        config (CompiledConfig): Unused.
+    """
+    lower_column_case_stage(table, "status")
 
 def lower_status_case(input_stream):
     """
@@ -143,25 +191,25 @@ def lower_status_case(input_stream):
     Returns:
         io.StringIO: The output stream with 'status' column values converted to lowercase.
     """
-    output_stream = io.StringIO()
-    reader = csv.reader(input_stream)
-    writer = csv.writer(output_stream, lineterminator='\n')
-
-    # Get the headers from the first row
-    headers = next(reader)
-    # Find the index of the "status" column
-    status_index = headers.index("status")
+    return apply_stage(input_stream, lower_status_case_stage)
 
-    # Write the headers to the output
-    writer.writerow(headers)
+def replace_newlines_stage(table, config=None):
+    """
+    Table stage that replaces newline and carriage return characters with "<br>" in every cell, headers included.
 
-    # Iterate over the rows in the original CSV file and change case
-    for row in reader:
-        row[status_index] = row[status_index].lower()
-        writer.writerow(row)
+    Args:
+        table (Table): The table.
+        config (CompiledConfig): Unused.
+    """
+    def replace(cell):
+        return cell.replace('\n', '<br>').replace('\r', '<br>')
 
-    output_stream.seek(0)
-    return output_stream
+    table.rename([replace(header) for header in table.headers])
+    for position, column in enumerate(table.columns):
+        # Most columns have no line breaks at all, which one scan of the joined column shows
+        joined = '\0'.join(column)
+        if '\n' in joined or '\r' in joined:
+            table.columns[position] = list(map(replace, column))
 
 def replace_newlines(input_stream):
     """
@@ -176,21 +224,17 @@ def replace_newlines(input_stream):
     Returns:
         io.StringIO: The output stream with newline and carriage return characters replaced with "<br>".
     """
-    output_stream = io.StringIO()
-    # Create a CSV reader
-    reader = csv.reader(input_stream)
-    # Create a CSV writer
-    writer = csv.writer(output_stream, lineterminator='\n')
-
-    # Iterate over the rows in the original CSV file
-    for row in reader:
-        # Replace newline and carriage return characters with "<br>" in each cell
-        modified_row = [cell.replace('\n', '<br>').replace('\r', '<br>') for cell in row]
-        # Write the modified row to the new CSV file
-        writer.writerow(modified_row)
-    
-    output_stream.seek(0)
-    return output_stream
+    return apply_stage(input_stream, replace_newlines_stage)
+
+def save_id_stage(table, config=None):
+    """
+    Table stage that copies the 'id' column to a new 'xl_id' column.
+
+    Args:
+        table (Table): The table.
+        config (CompiledConfig): Unused.
+    """
+    table.add_column("xl_id", list(table.column("id")))
 
 def save_id(input_stream):
     """
@@ -206,32 +250,20 @@ def save_id(input_stream):
     Returns:
         io.StringIO: The output stream with the added 'xl_id' column.
     """
+    return apply_stage(input_stream, save_id_stage)
 
-    output_stream = io.StringIO()
-    # Create a CSV reader
-    reader = csv.reader(input_stream)
-    # Get the headers from the first row
-    headers = next(reader)
-    # Find the index of the "id" column
-    id_index = headers.index("id")
-
-    # Add the new "xl_id" header
-    headers.append("xl_id")
-
-    # Create a CSV writer
-    writer = csv.writer(output_stream, lineterminator='\n')
-    # Write the headers to the output
-    writer.writerow(headers)
-
-    # Iterate over the rows in the original CSV file
-    for row in reader:
-        # Copy the value from "id" to "xl_id"
-        row.append(row[id_index])
-        # Write the modified row to the new CSV file
-        writer.writerow(row)
-    
-    output_stream.seek(0)
-    return output_stream
+def rename_shapes_stage(table, config):
+    """
+    Table stage that maps Visio shape names to their draw.io equivalents.
+
+    Args:
+        table (Table): The table.
+        config (CompiledConfig): Supplies xl_to_drawio_shape_mapping.
+    """
+    xl_to_drawio_shape_mapping = config.xl_to_drawio_shape_mapping
+
+    shapes = table.column('shape')
+    table.set_column('shape', list(map(xl_to_drawio_shape_mapping.get, shapes, shapes)))
 
 def rename_shapes(input_stream):
     """
@@ -245,22 +277,22 @@ def rename_shapes(input_stream):
     Returns:
         io.StringIO: The output stream with the renamed 'shape' values.
     """
-    reader = csv.DictReader(input_stream)
-    output_stream = io.StringIO()
-    writer = csv.DictWriter(output_stream, fieldnames=reader.fieldnames, lineterminator='\n')
-    
-    writer.writeheader()
+    return apply_stage(input_stream, rename_shapes_stage)
 
-    config = Config()
-    xl_to_drawio_shape_mapping = config.xl_to_drawio_shape_mapping
+def insert_height_width_stage(table, config):
+    """
+    Table stage that appends 'width' and 'height' columns based on the 'shape' column.
 
-    for row in reader:
-        if row['shape'] in xl_to_drawio_shape_mapping:
-            row['shape'] = xl_to_drawio_shape_mapping[row['shape']]
-        writer.writerow(row)
+    Args:
+        table (Table): The table.
+        config (CompiledConfig): Supplies shape_dimensions and default_dimensions.
+    """
+    shape_dimensions = config.shape_dimensions
+    default_dimensions = config.default_dimensions
 
-    output_stream.seek(0)
-    return output_stream
+    dimensions = [shape_dimensions.get(shape, default_dimensions) for shape in table.column('shape')]
+    table.add_column('width', [width for width, _ in dimensions])
+    table.add_column('height', [height for _, height in dimensions])
 
 def insert_height_width(input_stream):
     """
@@ -278,28 +310,37 @@ def insert_height_width(input_stream):
     Returns:
         io.StringIO: The output stream with the added 'width' and 'height' columns.
     """
-    output_stream = io.StringIO()
-    reader = csv.reader(input_stream)
-    writer = csv.writer(output_stream, lineterminator='\n')
-
-    headers = next(reader)
-    shape_index = headers.index('shape')
-
-    headers.extend(['width', 'height'])
-    writer.writerow(headers)
+    return apply_stage(input_stream, insert_height_width_stage)
 
-    config = Config()
-    shape_dimensions = config.shape_dimensions
+def parse_decisions_stage(table, config=None):
+    """
+    Table stage that splits decision rows' 'next_step_id' and 'connector_label' into 'decisionN_id' and
+    'decisionN_label' columns and drops 'connector_label' (see parse_decisions).  Only decision rows are visited.
 
-    for row in reader:
-        shape = row[shape_index]
-        width, height = shape_dimensions.get(shape, ('100', '100'))
-        row.extend([width, height])
+    The branches are collected as a sparse edge list and become SparseColumns (see get_decision_columns),
+    so the other rows do not grow with the number of branches.
 
-        writer.writerow(row)
-    
-    output_stream.seek(0)
-    return output_stream
+    Args:
+        table (Table): The table.
+        config (CompiledConfig): Unused.
+    """
+    next_step_ids = table.column('next_step_id')
+    connector_labels = table.column('connector_label')
+
+    # The number of column pairs is the most next steps of any decision row
+    max_decision_count = 0
+    branches = {}
+    for row_index, shape in enumerate(table.column('shape')):
+        if shape == "mxgraph.flowchart.decision":
+            decision_ids = [id.strip() for id in next_step_ids[row_index].replace('"', '').split(',')]
+            decision_labels = [label.strip() for label in connector_labels[row_index].replace('"', '').split(',')]
+            max_decision_count = max(max_decision_count, len(decision_ids))
+            branches[row_index] = list(itertools.zip_longest(decision_ids, decision_labels, fillvalue=''))
+            next_step_ids[row_index] = ""
+
+    table.delete_column('connector_label')
+    for header, column in get_decision_columns(branches, len(table), max_decision_count):
+        table.add_column(header, column)
 
 def parse_decisions(input_stream):
     """
@@ -321,46 +362,28 @@ def parse_decisions(input_stream):
     Returns:
         io.StringIO: A stream containing the transformed CSV data.
     """
-    # first pass
-    reader = csv.reader(input_stream)
-    output_stream = io.StringIO()
-    writer = csv.writer(output_stream, lineterminator='\n')
-    
-    headers = next(reader)
-    shape_index = headers.index('shape')
-    next_step_id_index = headers.index('next_step_id')
-    connector_label_index = headers.index('connector_label')
-    rows = list(reader)
+    return apply_stage(input_stream, parse_decisions_stage)
 
-    # Find the max number of decision branches
-    max_decision_count = get_max_decision_count_from_rows(rows, headers)
-
-    # Second Pass
-    input_stream.seek(0)
-    next(reader) # skip the headers
+def get_frontmatter(headers, config=None):
+    """
+    Assemble the draw.io CSV import frontmatter for the given (post parse_decisions) headers: the static
+    frontmatter from config.py followed by the connect and ignore frontmatter from utils.
 
-    headers.extend([f'decision{i}_{suffix}' for i in range(max_decision_count) for suffix in ['id', 'label']])
-    
-    writer.writerow(headers)
-
-    for row in reader:
-        if row[shape_index] == "mxgraph.flowchart.decision":
-            decision_ids = [id.strip() for id in row[next_step_id_index].replace('"', '').split(',')]
-            decision_labels = [label.strip() for label in row[connector_label_index].replace('"', '').split(',')]
-            decision_fields = list(zip(decision_ids + [None]*max_decision_count, decision_labels + [None]*max_decision_count))[:max_decision_count]
-            row[next_step_id_index] = ""
-        else:
-            decision_fields = [(None, None)] * max_decision_count
+    Parameters:
+    headers (list): The CSV headers.
+    config (CompiledConfig): Optional configuration.  Defaults to get_compiled_config().
 
-        row.extend([item for sublist in decision_fields for item in sublist])
+    Returns:
+    str: The frontmatter, ending with a newline.
+    """
+    # Extract max_decision_count from the headers
+    max_decision_count = get_max_decision_count_from_headers(headers)
 
-        writer.writerow(row)
-    
-    # delete 'connector_label'
-    output_stream.seek(0)
-    output_stream = delete_column(output_stream, 'connector_label')
-    
-    return output_stream
+    config = config or get_compiled_config()
+    connector_style = config.connector_style
+    return config.static_frontmatter + \
+        get_connect_frontmatter(max_decision_count, connector_style) + \
+        get_ignore_frontmatter(max_decision_count)
 
 def add_frontmatter(input_stream):
     """
@@ -383,20 +406,11 @@ def add_frontmatter(input_stream):
     # reset the input stream
     input_stream.seek(0)
 
-    # Extract max_decision_count from input_stream data
-    max_decision_count = get_max_decision_count_from_headers(headers)
-
-    # Assemble frontmatter string
-    config = Config()
-    connector_style = config.connector_style
-    frontmatter_content = config.static_frontmatter + \
-                        get_connect_frontmatter(max_decision_count, connector_style) + \
-                        get_ignore_frontmatter(max_decision_count)
     # Create an output stream
     output_stream = io.StringIO()
 
     # Write the frontmatter to the output stream
-    output_stream.write(frontmatter_content)
+    output_stream.write(get_frontmatter(headers))
 
     # Write the input stream
     output_stream.write(input_stream.read())
@@ -404,48 +418,90 @@ def add_frontmatter(input_stream):
     output_stream.seek(0)
     return output_stream
 
-def csv_to_drawio(input_stream):
+def csv_to_drawio(input_stream, config=None, output_stream=None):
     """
-    Converts a CSV file to a Draw.io diagram using the Draw.io command-line tool.
+    Converts a CSV file to a Draw.io diagram.
 
-    This function creates temporary files for the input and output, writes the contents of the input stream to the input file,
-    runs the Draw.io command-line tool to convert the input file to a Draw.io diagram, and writes the output to the output file.
-    The function then reads the output file into a string stream and returns it.
-
-    The temporary input and output files are automatically deleted when they are no longer needed.
+    With the 'native' backend the diagram is emitted in-process by mxgraph.csv_to_mxfile.  With the 'cli' backend
+    the conversion is queued on the process's shared DrawioPool (see drawio_pool.get_drawio_pool), which runs the
+    Draw.io command-line tool on temporary input and output files, killing it after Config.drawio_timeout seconds
+    and retrying a failure Config.drawio_retries times.  At most Config.drawio_workers Draw.io processes run at
+    once, however many conversions are waiting.
 
     Args:
         input_stream (io.StringIO): The input stream containing the CSV data.
+        config (Config, optional): Selects the backend through drawio_backend.  A CompiledConfig works too.
+                                   Defaults to get_compiled_config().
+        output_stream (io.TextIOBase, optional): Where to write the diagram, e.g. an open file, instead of a
+                                                 string stream.
 
     Returns:
-        io.StringIO: A string stream containing the Draw.io diagram.
+        io.StringIO: A string stream containing the Draw.io diagram, or output_stream when one is given.
 
     Raises:
-        subprocess.CalledProcessError: If the Draw.io command fails.
-    """
-    # Create temporary files for the input and output
-    with tempfile.NamedTemporaryFile(suffix='.csv', delete=True, mode='w+') as temp_input, tempfile.NamedTemporaryFile(delete=True, mode='w+') as temp_output:
-        # Write the contents of the input stream to the temporary input file
-        temp_input.write(input_stream.read())
-        temp_input.flush()  # Ensure all data is written to the file
-        
-        #TODO this path should come from a config file
-        config = Config()
-        drawio_path = config.drawio_path
-        command = [drawio_path, "-x", temp_input.name, "-f", "xml", "-o", temp_output.name]
-        
-        # Run the command
-        subprocess.run(command, check=True)
-
-        temp_output.seek(0)
-        return io.StringIO(temp_output.read())    
-
-def xl_to_drawio(input_stream):
+        subprocess.CalledProcessError: If the Draw.io command fails on every attempt.
+        subprocess.TimeoutExpired: If the Draw.io command times out on every attempt.
+    """
+    config = config or get_compiled_config()
+    if get_drawio_backend(config) == 'native':
+        return csv_to_mxfile(input_stream, output_stream)
+
+    return copy_output(get_drawio_pool(config).submit(input_stream).result(), output_stream)
+
+def get_stages():
+    """
+    Returns:
+        list: The (name, stage) pairs of steps 2-10 of xl_to_drawio, in order, as prepare_drawio_csv runs them.
+    """
+    return [
+        ('delete_empty_cols', delete_empty_cols_stage),
+        ('delete_empty_rows', delete_empty_rows_stage),
+        ('rename_headers', rename_headers_stage),
+        ('lower_shape_case', lower_shape_case_stage),
+        ('lower_status_case', lower_status_case_stage),
+        ('replace_newlines', replace_newlines_stage),
+        ('save_id', save_id_stage),
+        ('rename_shapes', rename_shapes_stage),
+        ('insert_height_width', insert_height_width_stage),
+        ('parse_decisions', parse_decisions_stage),
+    ]
+
+@instrument_pipeline('xl_to_drawio')
+def prepare_drawio_csv(input_stream, observer=None, config=None):
+    """
+    Run steps 1-11 of xl_to_drawio and return the draw.io CSV import, frontmatter included.
+
+    The Excel CSV is parsed once into a column-oriented Table and every stage runs on its columns:
+    header changes are metadata-only and value transforms touch only the columns they concern.
+    Decision branches are kept as sparse columns that only store the decision rows.  The CSV is
+    written once at the end, frontmatter included.  The output is identical to chaining the
+    stream-based stage functions.
+
+    Parameters:
+    input_stream (io.TextIOBase): The Excel CSV data.  Any text stream works, including an open file.
+    observer (object): Optional stage observer (see observers.py) that receives the CSV after every step.
+    config (CompiledConfig): Optional configuration injected into every stage.  Defaults to get_compiled_config().
+
+    Returns:
+    io.StringIO: The draw.io CSV import data.
+    """
+    config = config or get_compiled_config()
+    table = instrument('read', Table.read, input_stream)
+
+    run_stages(table, get_stages(), observer, config)
+
+    output_stream = instrument('add_frontmatter', Table.write, table, get_frontmatter(table.headers, config))
+    if observer_enabled(observer):
+        observer.observe('add_frontmatter', output_stream.getvalue())
+    return output_stream
+
+@instrument_pipeline('xl_to_drawio')
+def xl_to_drawio(input_stream, observer=None, cache=None, config=None, output_stream=None):
     """
     This function processes an Excel CSV file and converts it to a draw.io (XML) .drawio file.
 
     The function performs the following steps:
-    1. Removed as it is not needed: Deletes non-utf8 characters.
+    1. Deletes non-utf8 characters.  This is done as the input is decoded (see encoding.py), not as a step.
     2. Deletes empty columns.
     3. Deletes empty rows.
     4. Renames headers.
@@ -458,94 +514,122 @@ def xl_to_drawio(input_stream):
     11. Adds frontmatter to the CSV data.
     12. Converts the CSV data to a draw.io diagram using the draw.io command-line tool.
 
+    Steps 2-11 run fused in prepare_drawio_csv.
+
     Parameters:
     input_stream (io.StringIO): The input stream containing the Excel CSV data.
+    observer (object): Optional stage observer (see observers.py) that receives the output of every step.
+                       Intermediates are only serialized when an observer is enabled.
+    cache (ConversionCache): Optional cache (see cache.py).  On a hit the stored output is returned without parsing.
+                             It is bypassed when an observer is enabled, since the stages then have to run.
+    config (CompiledConfig): Optional configuration.  Defaults to get_compiled_config().  A cache should be
+                             opened with the Config this was compiled from.
+    output_stream (io.TextIOBase): Optional stream, e.g. a file from encoding.open_output, that step 12 writes the
+                                   diagram to instead of a string stream.
 
     Returns:
-    io.StringIO: The output stream containing the processed draw.io data.
+    io.StringIO: The output stream containing the processed draw.io data, or output_stream when one is given.
     """
-    input_stream = delete_empty_cols(input_stream)
-    with open('tests/debug_output/0_delete_empty_cols.csv', 'w') as f:
-        f.write(input_stream.getvalue())
-    input_stream.seek(0)
-
-    input_stream = delete_empty_rows(input_stream)
-    with open('tests/debug_output/1_delete_empty_rows.csv', 'w') as f:
-        f.write(input_stream.getvalue())
-    input_stream.seek(0)
-
-    input_stream = rename_headers(input_stream)
-    with open('tests/debug_output/2_rename_headers.csv', 'w') as f:
-        f.write(input_stream.getvalue())
-    input_stream.seek(0)
-
-    input_stream = lower_shape_case(input_stream)
-    with open('tests/debug_output/3_lower_shape_case.csv', 'w') as f:
-        f.write(input_stream.getvalue())
-    input_stream.seek(0)
-
-    input_stream = lower_status_case(input_stream)
-    with open('tests/debug_output/4_lower_status_case.csv', 'w') as f:
-        f.write(input_stream.getvalue())
-    input_stream.seek(0)
-
-    input_stream = replace_newlines(input_stream)
-    with open('tests/debug_output/5_replace_newlines.csv', 'w') as f:
-        f.write(input_stream.getvalue())
-    input_stream.seek(0)
-
-    input_stream = save_id(input_stream)
-    with open('tests/debug_output/6_save_id.csv', 'w') as f:
-        f.write(input_stream.getvalue())
-    input_stream.seek(0)
-
-    input_stream = rename_shapes(input_stream)
-    with open('tests/debug_output/7_rename_shapes.csv', 'w') as f:
-        f.write(input_stream.getvalue())
-    input_stream.seek(0)
-
-    input_stream = insert_height_width(input_stream)
-    with open('tests/debug_output/8_insert_height_width.csv', 'w') as f:
-        f.write(input_stream.getvalue())
-    input_stream.seek(0)
-
-    input_stream = parse_decisions(input_stream)
-    with open('tests/debug_output/9_parse_decisions.csv', 'w') as f:
-        f.write(input_stream.getvalue())
-    input_stream.seek(0)
-
-    input_stream = add_frontmatter(input_stream)
-    with open('tests/debug_output/10_add_frontmatter.csv', 'w') as f:
-        f.write(input_stream.getvalue())
-    input_stream.seek(0)
-
-    output_stream = csv_to_drawio(input_stream)
-    with open('tests/debug_output/11_csv_to_drawio.drawio', 'w') as f:
-        f.write(output_stream.getvalue())
-    output_stream.seek(0)
-
-    return output_stream
+    if cache is not None and not observer_enabled(observer):
+        return copy_output(cache.convert('xl_to_drawio', input_stream, functools.partial(xl_to_drawio, config=config)),
+                           output_stream)
+
+    config = config or get_compiled_config()
+    drawio_csv = prepare_drawio_csv(input_stream, observer, config)
+    if not observer_enabled(observer):
+        return instrument('csv_to_drawio', csv_to_drawio, drawio_csv, config, output_stream)
+    drawio_stream = instrument('csv_to_drawio', csv_to_drawio, drawio_csv, config)
+    observer.observe('csv_to_drawio', drawio_stream.getvalue(), suffix='.drawio')
+    return copy_output(drawio_stream, output_stream)
+
+def convert_file(input_file, output_file, cache_dir=None, config_file=None, encoding=None, errors='strict',
+                 buffer_size=DEFAULT_CHUNK_SIZE):
+    """
+    Convert one Excel CSV file to a .drawio file.  This is the unit of work of batch mode.
+    """
+    config = load_config(config_file) if config_file else None
+    cache = open_cache(cache_dir, config_file) if cache_dir else None
+    with open_input(input_file, encoding, errors) as input_stream, open_output(output_file, buffer_size) as f:
+        xl_to_drawio(input_stream, cache=cache, config=config, output_stream=f)
 
 def main():
     # Create the argument parser
     parser = argparse.ArgumentParser(description='Convert an Excel CSV file to a drawio.')
-    parser.add_argument('input_file', help='The input CSV file.')
-    parser.add_argument('output_file', help='The output drawio file.')
+    parser.add_argument('input_file', help='The input CSV file, or a directory or quoted glob of them for batch mode.')
+    parser.add_argument('output_file', help='The output drawio file, - for standard output, or in batch mode the directory '
+                                            'to mirror the inputs into.')
+    parser.add_argument('--debug-dir', help='Write the intermediate output of every step to this directory.')
+    parser.add_argument('--processes', type=int, help='Worker processes for batch mode (default: one per CPU).')
+    parser.add_argument('--cache-dir', help='Reuse the output of earlier conversions of identical input from this directory.')
+    parser.add_argument('--clear-cache', action='store_true', help='Empty --cache-dir before converting.')
+    parser.add_argument('--config', help='Read settings from this TOML or JSON file instead of the defaults in config.py.')
+    parser.add_argument('--encoding', help='The input encoding.  By default it is told from the BOM, or is UTF-8 if the start of '
+                                           'the file decodes as UTF-8 and cp1252 otherwise.')
+    parser.add_argument('--strip-invalid', action='store_true', help='Drop bytes that are invalid in the input encoding '
+                                                                      'instead of stopping with an error.')
+    parser.add_argument('--metrics', help='Record the time, rows, bytes and memory of every stage and write them to this file '
+                                          'when done: JSON for a .json file, OpenMetrics text otherwise.')
+    parser.add_argument('--metrics-memory', action='store_true', help='With --metrics, also trace memory allocations (slower).')
+    parser.add_argument('--profile', metavar='PREFIX', help='Profile the run and write PREFIX.pstats and PREFIX.collapsed '
+                                                             '(collapsed stacks for a flame graph).  Batch runs write one '
+                                                             'profile for all files.')
+    parser.add_argument('--buffer-size', type=int, default=DEFAULT_CHUNK_SIZE, metavar='BYTES',
+                        help=f'Buffer this much output before writing it out (default: {DEFAULT_CHUNK_SIZE}).')
 
     # Parse the command-line arguments
     args = parser.parse_args()
 
-    # Read the input file
-    with open(args.input_file, 'r') as f:
-        input_data = f.read()
-    input_stream = io.StringIO(input_data)
-
-    # Call the drawio_to_xl function
-    output_stream = xl_to_drawio(input_stream)
-
-    # Write the output to the output file
-    with open(args.output_file, 'w') as f:
-        f.write(output_stream.getvalue())
+    if args.buffer_size < 1:
+        parser.error('--buffer-size must be at least 1')
+
+    try:
+        config = load_config(args.config) if args.config else None
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    if args.encoding:
+        try:
+            codecs.lookup(args.encoding)
+        except LookupError as e:
+            parser.error(str(e))
+    errors = 'ignore' if args.strip_invalid else 'strict'
+
+    if args.profile:
+        start_profiling(args.profile)
+
+    if args.metrics:
+        # Batch workers started without fork turn instrumentation on from the environment
+        os.environ[METRICS_ENV_VAR] = args.metrics
+        os.environ[METRICS_MEMORY_ENV_VAR] = '1' if args.metrics_memory else ''
+        enable_instrumentation(args.metrics, memory=args.metrics_memory)
+
+    if args.cache_dir and args.clear_cache:
+        open_cache(args.cache_dir, args.config).invalidate()
+
+    if is_batch_input(args.input_file):
+        if args.output_file == STDOUT:
+            parser.error('batch mode writes to a directory, not to standard output')
+        if args.debug_dir:
+            parser.error('--debug-dir only works for a single input file')
+        convert = functools.partial(convert_file, cache_dir=args.cache_dir, config_file=args.config,
+                                    encoding=args.encoding, errors=errors, buffer_size=args.buffer_size)
+        compiled_config = config or get_compiled_config()
+        if get_drawio_backend(compiled_config) == 'cli':
+            # The files wait on draw.io rather than the CPU, so they are converted on threads sharing one DrawioPool,
+            # which bounds the draw.io processes to Config.drawio_workers and applies its timeout and retries
+            processes = args.processes or get_drawio_pool(compiled_config).workers
+            results = run_batch(convert, [args.input_file], args.output_file, '.csv', '.drawio', processes, threads=True)
+        else:
+            results = run_batch(convert, [args.input_file], args.output_file, '.csv', '.drawio', args.processes)
+        sys.exit(1 if any(result['error'] for result in results) else 0)
+
+    # Call the xl_to_drawio function.  The CSV is parsed straight from the file rather than read into memory first,
+    # and the diagram is written straight to the output file (or standard output) as it is emitted.
+    observer = DirectorySink(args.debug_dir) if args.debug_dir else None
+    cache = open_cache(args.cache_dir, args.config) if args.cache_dir else None
+    with open_input(args.input_file, args.encoding, errors) as input_stream, \
+            open_output(args.output_file, args.buffer_size) as f:
+        xl_to_drawio(input_stream, observer, cache, config, output_stream=f)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
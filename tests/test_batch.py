@@ -0,0 +1,129 @@
+import unittest
+import os
+import subprocess
+import tempfile
+from unittest import mock
+from tests.testing_support import TEST_DRAWIO_FILE_DATA
+from tests.testing_support import TEST_XL_FILE_DATA
+
+from drawio_xl.batch import is_batch_input
+from drawio_xl.batch import find_inputs
+from drawio_xl.batch import get_output_file
+from drawio_xl.batch import convert_batch
+from drawio_xl.batch import format_summary
+from drawio_xl.drawio_to_xl import convert_file
+from drawio_xl.instrumentation import disable_instrumentation
+from drawio_xl.instrumentation import enable_instrumentation
+
+
+def write_tree(root, files):
+    for relative_path, content in files.items():
+        path = os.path.join(root, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+
+class TestFindInputs(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.root = self.directory.name
+        write_tree(self.root, {'a.drawio': '', 'sub/b.drawio': '', 'sub/notes.txt': ''})
+
+    def test_directory(self):
+        inputs = find_inputs([self.root], '.drawio')
+
+        self.assertEqual([relative_path for _, relative_path in inputs], ['a.drawio', os.path.join('sub', 'b.drawio')])
+
+    def test_glob(self):
+        inputs = find_inputs([os.path.join(self.root, '**', '*.drawio')], '.drawio')
+
+        self.assertEqual(sorted(relative_path for _, relative_path in inputs), ['a.drawio', os.path.join('sub', 'b.drawio')])
+
+    def test_duplicates_are_dropped(self):
+        inputs = find_inputs([self.root, os.path.join(self.root, 'a.drawio')], '.drawio')
+
+        self.assertEqual(len(inputs), 2)
+
+    def test_is_batch_input(self):
+        self.assertTrue(is_batch_input(self.root))
+        self.assertTrue(is_batch_input('plans/*.drawio'))
+        self.assertFalse(is_batch_input(os.path.join(self.root, 'a.drawio')))
+
+    def test_get_output_file(self):
+        self.assertEqual(get_output_file('out', os.path.join('sub', 'b.drawio'), '.csv'), os.path.join('out', 'sub', 'b.csv'))
+
+
+class TestConvertBatch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.input_dir = os.path.join(self.directory.name, 'in')
+        self.output_dir = os.path.join(self.directory.name, 'out')
+        write_tree(self.input_dir, {'a.drawio': TEST_DRAWIO_FILE_DATA, 'sub/b.drawio': TEST_DRAWIO_FILE_DATA,
+                                    'sub/broken.drawio': '<mxfile>'})
+
+    def test_mirrors_the_input_tree(self):
+        results = convert_batch(convert_file, [self.input_dir], self.output_dir, '.drawio', '.csv', processes=2)
+
+        self.assertEqual([os.path.relpath(result['output_file'], self.output_dir) for result in results],
+                         ['a.csv', os.path.join('sub', 'b.csv'), os.path.join('sub', 'broken.csv')])
+        for result in results[:2]:
+            self.assertIsNone(result['error'])
+            with open(result['output_file']) as f:
+                self.assertEqual(f.read(), TEST_XL_FILE_DATA)
+        self.assertIn('ParseError', results[2]['error'])
+        # The failed conversion leaves no output, partial or temporary
+        self.assertEqual(sorted(os.listdir(os.path.join(self.output_dir, 'sub'))), ['b.csv'])
+
+        summary = format_summary(results, 1.0)
+        self.assertIn('3 files (1 failed)', summary)
+        self.assertIn('FAILED', summary)
+
+    def test_memory_is_not_traced_on_threads(self):
+        instrumentation = enable_instrumentation(memory=True)
+        self.addCleanup(disable_instrumentation)
+
+        with mock.patch('sys.stderr'):
+            convert_batch(convert_file, [self.input_dir], self.output_dir, '.drawio', '.csv', processes=2, threads=True)
+
+        # The files converted at the same time, so per-stage memory would have counted each other's allocations
+        self.assertTrue(instrumentation.records)
+        self.assertTrue(all(record['peak_bytes'] is None for record in instrumentation.records))
+        self.assertTrue(instrumentation.memory)
+
+    def test_command_line(self):
+        result = subprocess.run(['python3', 'drawio_xl/drawio_to_xl.py', os.path.join(self.input_dir, 'sub', 'b.*'),
+                                 self.output_dir], capture_output=True, text=True)
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('1 files (0 failed)', result.stdout)
+        with open(os.path.join(self.output_dir, 'b.csv')) as f:
+            self.assertEqual(f.read(), TEST_XL_FILE_DATA)
+
+    def test_command_line_reports_failures(self):
+        result = subprocess.run(['python3', 'drawio_xl/drawio_to_xl.py', self.input_dir, self.output_dir],
+                                capture_output=True, text=True)
+
+        self.assertEqual(result.returncode, 1)
+        self.assertIn('3 files (1 failed)', result.stdout)
+
+    def test_single_file_options_are_rejected(self):
+        for script, option in [('drawio_to_xl.py', ['--pages', 'split']), ('drawio_to_xl.py', ['--debug-dir', 'debug']),
+                               ('xl_to_drawio.py', ['--debug-dir', 'debug'])]:
+            with self.subTest(script=script, option=option):
+                result = subprocess.run(['python3', f'drawio_xl/{script}', self.input_dir, self.output_dir] + option,
+                                        capture_output=True, text=True)
+
+                self.assertEqual(result.returncode, 2)
+                self.assertIn('only works for a single input file', result.stderr)
+
+    def test_xl_to_drawio_command_line(self):
+        write_tree(self.input_dir, {'plans/plan.csv': TEST_XL_FILE_DATA})
+
+        result = subprocess.run(['python3', 'drawio_xl/xl_to_drawio.py', os.path.join(self.input_dir, 'plans'),
+                                 self.output_dir], capture_output=True, text=True)
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, 'plan.drawio')))
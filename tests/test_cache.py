@@ -0,0 +1,114 @@
+import unittest
+import io
+import os
+import subprocess
+import tempfile
+import time
+from unittest import mock
+from tests.testing_support import TEST_DRAWIO_FILE_DATA
+from tests.testing_support import TEST_XL_FILE_DATA
+
+from drawio_xl.cache import ConversionCache
+from drawio_xl.cache import config_fingerprint
+from drawio_xl.config import Config
+from drawio_xl.drawio_to_xl import drawio_to_xl
+from drawio_xl.observers import RingBufferSink
+import drawio_xl.drawio_to_xl
+
+
+class TestConfigFingerprint(unittest.TestCase):
+    def test_output_fields_change_the_fingerprint(self):
+        self.assertEqual(config_fingerprint(Config()), config_fingerprint(Config()))
+        self.assertNotEqual(config_fingerprint(Config()), config_fingerprint(Config(connector_style='endArrow=none;')))
+
+    def test_auto_backend_is_hashed_as_resolved(self):
+        with tempfile.TemporaryDirectory() as directory:
+            drawio_path = os.path.join(directory, 'draw.io')
+            config = Config(drawio_path=drawio_path, drawio_backend='auto')
+            without_drawio = config_fingerprint(config)
+            open(drawio_path, 'w').close()
+            with_drawio = config_fingerprint(config)
+
+        # Installing draw.io switches 'auto' from the native emitter to the draw.io CLI, whose output differs
+        self.assertEqual(without_drawio, config_fingerprint(Config(drawio_path=drawio_path, drawio_backend='native')))
+        self.assertEqual(with_drawio, config_fingerprint(Config(drawio_path=drawio_path, drawio_backend='cli')))
+        self.assertNotEqual(without_drawio, with_drawio)
+
+    def test_pool_settings_do_not(self):
+        self.assertEqual(config_fingerprint(Config()), config_fingerprint(Config(drawio_workers=8, drawio_timeout=5)))
+
+
+class TestConversionCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.cache = ConversionCache(self.directory.name)
+
+    def test_hit_skips_parsing(self):
+        first = drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA), cache=self.cache)
+
+        with mock.patch.object(drawio_xl.drawio_to_xl, 'convert_to_table', side_effect=AssertionError('parsed')):
+            second = drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA), cache=self.cache)
+
+        self.assertEqual(first.getvalue(), TEST_XL_FILE_DATA)
+        self.assertEqual(second.getvalue(), TEST_XL_FILE_DATA)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_key_depends_on_input_conversion_and_config(self):
+        key = self.cache.key('drawio_to_xl', b'data')
+
+        self.assertNotEqual(key, self.cache.key('drawio_to_xl', b'data!'))
+        self.assertNotEqual(key, self.cache.key('xl_to_drawio', b'data'))
+        other_config = ConversionCache(self.directory.name, config=Config(drawio_to_xl_shape_mapping={}))
+        self.assertNotEqual(key, other_config.key('drawio_to_xl', b'data'))
+
+    def test_observer_bypasses_the_cache(self):
+        drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA), cache=self.cache)
+        sink = RingBufferSink()
+
+        drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA), sink, self.cache)
+
+        self.assertEqual(self.cache.hits, 0)
+        self.assertIsNotNone(sink.get('convert_to_csv'))
+
+    def test_lru_eviction(self):
+        cache = ConversionCache(self.directory.name, max_bytes=350)
+        for age, name in zip([30, 20, 10], ['a', 'b', 'c']):
+            cache.put(name * 64, name * 100)
+            # Distinct modification times in the past, 'a' oldest
+            os.utime(cache._path(name * 64), (time.time() - age, time.time() - age))
+        cache.get('a' * 64)
+
+        cache.put('d' * 64, 'd' * 100)
+
+        self.assertIsNotNone(cache.get('a' * 64))
+        self.assertIsNone(cache.get('b' * 64))
+        self.assertIsNotNone(cache.get('c' * 64))
+        self.assertIsNotNone(cache.get('d' * 64))
+
+    def test_invalidate(self):
+        self.cache.put('a' * 64, 'a')
+        self.cache.put('b' * 64, 'b')
+
+        self.cache.invalidate('a' * 64)
+        self.assertIsNone(self.cache.get('a' * 64))
+        self.assertEqual(self.cache.get('b' * 64), 'b')
+
+        self.cache.invalidate()
+        self.assertIsNone(self.cache.get('b' * 64))
+
+    def test_command_line(self):
+        input_file = os.path.join(self.directory.name, 'plan.drawio')
+        output_file = os.path.join(self.directory.name, 'plan.csv')
+        cache_dir = os.path.join(self.directory.name, 'cache')
+        with open(input_file, 'w') as f:
+            f.write(TEST_DRAWIO_FILE_DATA)
+
+        for _ in range(2):
+            result = subprocess.run(['python3', 'drawio_xl/drawio_to_xl.py', input_file, output_file, '--cache-dir', cache_dir],
+                                    capture_output=True, text=True)
+            self.assertEqual(result.returncode, 0, result.stderr)
+
+        self.assertEqual(sum(len(files) for _, _, files in os.walk(cache_dir)), 1)
+        with open(output_file) as f:
+            self.assertEqual(f.read(), TEST_XL_FILE_DATA)
@@ -0,0 +1,181 @@
+import unittest
+import dataclasses
+import io
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+from tests.testing_support import TEST_DRAWIO_FILE_DATA
+from tests.testing_support import TEST_XL_FILE_DATA
+
+from drawio_xl import config as config_module
+from drawio_xl.config import Config
+from drawio_xl.config import compile_config
+from drawio_xl.config import compiled_config_path
+from drawio_xl.config import get_compiled_config
+from drawio_xl.config import load_config
+from drawio_xl.drawio_to_xl import drawio_to_xl
+from drawio_xl.xl_to_drawio import prepare_drawio_csv
+
+
+class TestCompiledConfig(unittest.TestCase):
+    def test_built_once_per_process(self):
+        self.assertIs(get_compiled_config(), get_compiled_config())
+
+    def test_is_read_only(self):
+        config = get_compiled_config()
+
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            config.connector_style = ''
+        with self.assertRaises(TypeError):
+            config.xl_to_drawio_shape_mapping['process'] = 'rectangle'
+
+    def test_reverse_header_mapping(self):
+        config = get_compiled_config()
+
+        self.assertEqual(config.drawio_to_xl_header_mapping['next_step_id'], 'Next Step ID')
+        for xl_header, drawio_header in config.xl_to_drawio_header_mapping.items():
+            self.assertEqual(config.drawio_to_xl_header_mapping[drawio_header], xl_header)
+
+    def test_compiling_copies_the_mappings(self):
+        config = Config()
+        compiled = compile_config(config)
+        config.shape_dimensions['mxgraph.flowchart.process'] = ('1', '1')
+
+        self.assertEqual(compiled.shape_dimensions['mxgraph.flowchart.process'], ('200', '100'))
+
+    def test_pickles(self):
+        config = get_compiled_config()
+
+        self.assertEqual(pickle.loads(pickle.dumps(config)), config)
+
+
+class TestInjectedConfig(unittest.TestCase):
+    def test_stages_use_the_injected_config(self):
+        config = Config()
+        config.xl_to_drawio_shape_mapping['process'] = 'rectangle'
+        config.shape_dimensions['rectangle'] = ('300', '60')
+
+        output = prepare_drawio_csv(io.StringIO(TEST_XL_FILE_DATA), config=compile_config(config)).getvalue()
+
+        self.assertIn('rectangle,', output)
+        self.assertIn(',300,60', output)
+        self.assertNotIn('mxgraph.flowchart.process', output)
+
+    def test_default_config_is_unchanged_output(self):
+        self.assertEqual(drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA), config=get_compiled_config()).getvalue(),
+                         drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA)).getvalue())
+
+
+class TestLoadConfig(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        # Every test starts from a cold process-level cache
+        config_module._load_config.cache_clear()
+        self.addCleanup(config_module._load_config.cache_clear)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_toml_settings_replace_the_defaults(self):
+        path = self.write('settings.toml', 'connector_style = "endArrow=none;"\n'
+                                           '[shape_dimensions]\n"mxgraph.flowchart.process" = [240, 80]\n')
+
+        config = load_config(path)
+
+        self.assertEqual(config.connector_style, 'endArrow=none;')
+        self.assertEqual(dict(config.shape_dimensions), {'mxgraph.flowchart.process': ('240', '80')})
+        self.assertEqual(config.xl_header_order, get_compiled_config().xl_header_order)
+
+    def test_pool_settings_are_kept(self):
+        path = self.write('settings.toml', 'drawio_workers = 3\ndrawio_timeout = 5\ndrawio_retries = 0\n')
+
+        config = load_config(path)
+
+        self.assertEqual((config.drawio_workers, config.drawio_timeout, config.drawio_retries), (3, 5.0, 0))
+
+    def test_json(self):
+        path = self.write('settings.json', json.dumps({'xl_to_drawio_header_mapping': {'Step': 'id'}}))
+
+        self.assertEqual(load_config(path).drawio_to_xl_header_mapping['id'], 'Step')
+
+    def test_invalid_files_are_rejected(self):
+        for name, content in [('a.toml', 'colour = "red"\n'),
+                              ('b.toml', 'drawio_workers = -1\n'),
+                              ('c.json', '{"xl_to_drawio_shape_mapping": {"process": 1}}'),
+                              ('d.json', '{"shape_dimensions": {"x": [1]}}'),
+                              ('e.json', '{"xl_to_drawio_header_mapping": {"A": "id", "B": "id"}}'),
+                              ('f.toml', 'drawio_path = \n'),
+                              ('g.yaml', '')]:
+            with self.subTest(name=name), self.assertRaises(ValueError):
+                load_config(self.write(name, content))
+
+    def test_compiled_form_is_reused_until_the_content_changes(self):
+        path = self.write('settings.toml', 'connector_style = "a"\n')
+        self.assertEqual(load_config(path).connector_style, 'a')
+        self.assertTrue(os.path.exists(compiled_config_path(path)))
+
+        with mock.patch.object(config_module, 'parse_config', side_effect=AssertionError('parsed again')):
+            # Unchanged file: the compiled form is read without opening the file
+            config_module._load_config.cache_clear()
+            self.assertEqual(load_config(path).connector_style, 'a')
+            # Touched but identical: the hash matches
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            self.assertEqual(load_config(path).connector_style, 'a')
+
+        self.write('settings.toml', 'connector_style = "bb"\n')
+        self.assertEqual(load_config(path).connector_style, 'bb')
+
+    def test_corrupt_compiled_file_is_rebuilt(self):
+        path = self.write('settings.json', '{"connector_style": "a"}')
+        self.write(os.path.basename(compiled_config_path(path)), 'not JSON')
+
+        self.assertEqual(load_config(path).connector_style, 'a')
+
+    def test_compiled_file_is_json(self):
+        path = self.write('settings.toml', 'drawio_timeout = 5\n')
+        load_config(path)
+
+        with open(compiled_config_path(path)) as f:
+            entry = json.load(f)
+        self.assertEqual(entry['settings']['drawio_timeout'], 5.0)
+        self.assertEqual(os.stat(compiled_config_path(path)).st_mode & 0o077, 0)
+
+    def test_compiled_file_writable_by_others_is_ignored(self):
+        path = self.write('settings.toml', 'connector_style = "a"\n')
+        load_config(path)
+        cache_path = compiled_config_path(path)
+        with open(cache_path) as f:
+            entry = json.load(f)
+        entry['settings']['drawio_path'] = '/tmp/not-draw.io'
+        with open(cache_path, 'w') as f:
+            json.dump(entry, f)
+        os.chmod(cache_path, 0o666)
+
+        config_module._load_config.cache_clear()
+        self.assertEqual(load_config(path).drawio_path, get_compiled_config().drawio_path)
+
+    def test_command_line(self):
+        config_file = self.write('settings.json', json.dumps({'xl_to_drawio_shape_mapping': {'process': 'rectangle'}}))
+        input_file = self.write('plan.csv', TEST_XL_FILE_DATA)
+        output_file = os.path.join(self.directory.name, 'plan.drawio')
+
+        subprocess.run([sys.executable, 'drawio_xl/xl_to_drawio.py', input_file, output_file, '--config', config_file],
+                       check=True, capture_output=True)
+
+        with open(output_file) as f:
+            drawio = f.read()
+        self.assertIn('shape=rectangle', drawio)
+        self.assertNotIn('shape=mxgraph.flowchart.process', drawio)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+import unittest
+import io
+import json
+import os
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import mock
+from tests.testing_support import TEST_DRAWIO_CSV_FILE_DATA
+from tests.testing_support import TEST_DRAWIO_FILE_DATA
+from tests.testing_support import TEST_XL_FILE_DATA
+from tests.testing_support import normalize_xml
+
+from drawio_xl import drawio_pool as drawio_pool_module
+from drawio_xl.config import Config
+from drawio_xl.config import compile_config
+from drawio_xl.config import get_compiled_config
+from drawio_xl.drawio_pool import DrawioPool
+from drawio_xl.drawio_pool import DrawioPoolClosed
+from drawio_xl.drawio_pool import get_drawio_pool
+from drawio_xl.drawio_pool import shutdown_drawio_pools
+from drawio_xl.xl_to_drawio import add_frontmatter
+from drawio_xl.xl_to_drawio import csv_to_drawio
+
+
+def write_fake_drawio(directory, body):
+    """
+    Write a shell script standing in for the draw.io CLI.  It is called as: draw.io -x INPUT -f xml -o OUTPUT
+    """
+    path = os.path.join(directory, 'draw.io')
+    with open(path, 'w') as f:
+        f.write('#!/bin/sh\n' + body + '\n')
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
+
+
+class TestDrawioPool(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def cli_config(self, body):
+        return Config(drawio_path=write_fake_drawio(self.directory.name, body), drawio_backend='cli')
+
+    def test_map_keeps_input_order(self):
+        # The fake draw.io echoes its input, with later jobs finishing first
+        config = self.cli_config('sleep "0.$(cat "$2")"; cp "$2" "$6"')
+
+        with DrawioPool(config, workers=4) as pool:
+            outputs = [output.getvalue() for output in pool.map(io.StringIO(str(3 - i)) for i in range(4))]
+
+        self.assertEqual(outputs, ['3', '2', '1', '0'])
+
+    def test_retries_failed_conversions(self):
+        counter = os.path.join(self.directory.name, 'attempts')
+        config = self.cli_config(f'echo x >> {counter}; [ "$(wc -l < {counter})" -ge 3 ] || exit 1; cp "$2" "$6"')
+
+        with DrawioPool(config, workers=1, retries=2, backoff=0) as pool:
+            output = pool.submit(io.StringIO('data')).result()
+
+        self.assertEqual(output.getvalue(), 'data')
+        with open(counter) as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+    def test_gives_up_after_retries(self):
+        config = self.cli_config('exit 3')
+
+        with DrawioPool(config, workers=1, retries=1, backoff=0) as pool:
+            future = pool.submit(io.StringIO('data'))
+
+        with self.assertRaises(subprocess.CalledProcessError) as context:
+            future.result()
+        self.assertEqual(context.exception.returncode, 3)
+
+    def test_timeout(self):
+        config = self.cli_config('sleep 10')
+
+        start = time.perf_counter()
+        with DrawioPool(config, workers=1, timeout=0.2, retries=0) as pool:
+            future = pool.submit(io.StringIO('data'))
+            with self.assertRaises(subprocess.TimeoutExpired):
+                future.result()
+        self.assertLess(time.perf_counter() - start, 5)
+
+    def test_cancel_kills_running_conversions(self):
+        config = self.cli_config('sleep 10')
+        pool = DrawioPool(config, workers=1, retries=3, backoff=0)
+        running = pool.submit(io.StringIO('data'))
+        queued = pool.submit(io.StringIO('data'))
+        time.sleep(0.2)
+
+        start = time.perf_counter()
+        pool.shutdown(wait=True, cancel=True)
+
+        self.assertLess(time.perf_counter() - start, 5)
+        self.assertTrue(queued.cancelled())
+        with self.assertRaises(DrawioPoolClosed):
+            running.result()
+        with self.assertRaises(DrawioPoolClosed):
+            pool.submit(io.StringIO('data'))
+
+    def test_no_process_is_started_after_cancelling(self):
+        pool = DrawioPool(self.cli_config('cp "$2" "$6"'), workers=1)
+        pool.shutdown(wait=True, cancel=True)
+
+        with mock.patch.object(drawio_pool_module.subprocess, 'Popen') as popen:
+            with self.assertRaises(DrawioPoolClosed):
+                pool._run_drawio('data')
+        popen.assert_not_called()
+
+    def test_compiled_config(self):
+        with DrawioPool(get_compiled_config()) as pool:
+            self.assertGreaterEqual(pool.workers, 1)
+
+        config = compile_config(Config(drawio_backend='native', drawio_workers=3, drawio_timeout=5, drawio_retries=0))
+        with DrawioPool(config) as pool:
+            self.assertEqual((pool.workers, pool.timeout, pool.retries), (3, 5.0, 0))
+
+    def test_native_backend(self):
+        with DrawioPool(Config(drawio_backend='native'), workers=2) as pool:
+            outputs = list(pool.map(add_frontmatter(io.StringIO(TEST_DRAWIO_CSV_FILE_DATA)) for _ in range(3)))
+
+        for output in outputs:
+            self.assertEqual(normalize_xml(output.getvalue()), normalize_xml(TEST_DRAWIO_FILE_DATA))
+
+
+class TestSharedPool(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.addCleanup(shutdown_drawio_pools)
+
+    def test_csv_to_drawio_runs_draw_io_through_the_pool(self):
+        counter = os.path.join(self.directory.name, 'attempts')
+        drawio_path = write_fake_drawio(self.directory.name,
+                                        f'echo x >> {counter}; [ "$(wc -l < {counter})" -ge 2 ] || exit 1; cp "$2" "$6"')
+        config = Config(drawio_path=drawio_path, drawio_backend='cli', drawio_retries=1)
+
+        output_stream = io.StringIO()
+        csv_to_drawio(io.StringIO('data'), compile_config(config), output_stream)
+
+        # The first attempt failed and was retried by the pool
+        self.assertEqual(output_stream.getvalue(), 'data')
+        self.assertIs(get_drawio_pool(compile_config(config)), get_drawio_pool(config))
+
+    def test_batch_conversions_share_the_pool_and_time_out(self):
+        # Plans with 'slow' in them hang draw.io; the others are converted by copying the CSV import
+        drawio_path = write_fake_drawio(self.directory.name, 'grep -q slow "$2" && sleep 10; cp "$2" "$6"')
+        config_file = os.path.join(self.directory.name, 'config.json')
+        with open(config_file, 'w') as f:
+            json.dump({'drawio_path': drawio_path, 'drawio_backend': 'cli', 'drawio_workers': 2,
+                       'drawio_timeout': 0.5, 'drawio_retries': 0}, f)
+        input_dir = os.path.join(self.directory.name, 'in')
+        os.mkdir(input_dir)
+        for name, plan in [('a', TEST_XL_FILE_DATA), ('b', TEST_XL_FILE_DATA.replace('Cell B', 'slow')),
+                           ('c', TEST_XL_FILE_DATA)]:
+            with open(os.path.join(input_dir, f'{name}.csv'), 'w') as f:
+                f.write(plan)
+        output_dir = os.path.join(self.directory.name, 'out')
+
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, 'drawio_xl/xl_to_drawio.py', input_dir, output_dir,
+                                 '--config', config_file], capture_output=True, text=True)
+
+        self.assertLess(time.perf_counter() - start, 8)
+        self.assertEqual(result.returncode, 1)
+        self.assertIn('TimeoutExpired', result.stdout)
+        self.assertTrue(os.path.exists(os.path.join(output_dir, 'a.drawio')))
+        self.assertTrue(os.path.exists(os.path.join(output_dir, 'c.drawio')))
+
+
+if __name__ == '__main__':
+    unittest.main()
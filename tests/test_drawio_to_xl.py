@@ -3,6 +3,10 @@ import io
 import subprocess
 import os
 import csv
+import re
+import base64
+import urllib.parse
+import zlib
 from tests.testing_support import normalize_csv
 from tests.testing_support import TEST_DRAWIO_FILE_DATA
 from tests.testing_support import TEST_DRAWIO_CSV_FILE_DATA
@@ -19,6 +23,18 @@ from drawio_xl.drawio_to_xl import insert_newlines
 from drawio_xl.drawio_to_xl import rename_headers
 from drawio_xl.drawio_to_xl import reorder_headers
 from drawio_xl.drawio_to_xl import drawio_to_xl
+from drawio_xl.drawio_to_xl import drawio_to_xl_rows
+from drawio_xl.utils import write_table
+from drawio_xl.drawio_to_xl import inflate_diagram
+from drawio_xl.drawio_to_xl import drawio_to_xl_pages
+from drawio_xl.drawio_to_xl import add_page_column
+from drawio_xl.drawio_to_xl import page_output_file
+from drawio_xl.drawio_to_xl import convert_to_table
+from drawio_xl.drawio_to_xl import get_id_headers
+from drawio_xl.drawio_to_xl import IdRemap
+from drawio_xl.table import SparseColumn
+from drawio_xl.table import Table
+from drawio_xl.xl_to_drawio import xl_to_drawio
 
 class TestConvertToCSV(unittest.TestCase):    
     def test_convert_to_csv(self):
@@ -34,7 +50,77 @@ class TestConvertToCSV(unittest.TestCase):
         
         # Check that the actual output matches the expected output
         self.assertEqual(normalize_csv(actual_output), normalize_csv(expected_output))
+
+    def test_convert_to_csv_from_file(self):
+        self.maxDiff = None
+
+        # The diagram is streamed straight from an open file
+        with open('tests/test_drawio.drawio', 'r') as input_stream:
+            actual_output = convert_to_csv(input_stream).read()
+
+        self.assertEqual(normalize_csv(actual_output), normalize_csv(TEST_DRAWIO_CSV_FILE_DATA))
+
+    def test_convert_to_csv_edge_inside_user_object(self):
+        # Labelled edges can be wrapped in a UserObject of their own
+        input_data = """<mxfile><diagram><mxGraphModel><root>
+            <mxCell id="0" /><mxCell id="1" parent="0" />
+            <UserObject label="" id="a"><mxCell style="shape=mxgraph.flowchart.process;" vertex="1" parent="1" /></UserObject>
+            <UserObject label="" id="b"><mxCell style="shape=mxgraph.flowchart.process;" vertex="1" parent="1" /></UserObject>
+            <UserObject label="" id="e"><mxCell edge="1" source="a" target="b" parent="1" /></UserObject>
+        </root></mxGraphModel></diagram></mxfile>"""
+        actual_output = convert_to_csv(io.StringIO(input_data)).read()
+        expected_output = "height,id,next_step_id,shape,width,xl_id\n100,a,b,mxgraph.flowchart.process,200,a\n100,b,,mxgraph.flowchart.process,200,b\n"
+        self.assertEqual(actual_output, expected_output)
         
+def compress_diagram(drawio_data):
+    """Compress the mxGraphModel of a .drawio document the way draw.io does."""
+    graph_model = re.search(r'<mxGraphModel.*</mxGraphModel>', drawio_data, re.DOTALL).group(0)
+    deflater = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    quoted = urllib.parse.quote(graph_model, safe="!*'()").encode('ascii')
+    packed = base64.b64encode(deflater.compress(quoted) + deflater.flush()).decode('ascii')
+    return drawio_data.replace(graph_model, packed), graph_model, packed
+
+class TestCompressedDiagram(unittest.TestCase):
+    def test_inflate_diagram(self):
+        graph_model = '<mxGraphModel><root><UserObject label="caf\u00e9 \u2013 100%" id="2" /></root></mxGraphModel>'
+        _, _, packed = compress_diagram(f'<mxfile><diagram>{graph_model}</diagram></mxfile>')
+        # Small chunks split percent escapes and multi-byte characters across chunk boundaries
+        for chunk_size in [4, 8, 12, 65536]:
+            inflated = b''.join(inflate_diagram(packed, chunk_size=chunk_size)).decode('utf-8')
+            self.assertEqual(inflated, graph_model)
+
+    def test_drawio_to_xl_compressed(self):
+        compressed_data, _, _ = compress_diagram(TEST_DRAWIO_FILE_DATA)
+        output_stream = drawio_to_xl(io.StringIO(compressed_data))
+        self.assertEqual(output_stream.getvalue(), TEST_XL_FILE_DATA)
+
+def two_page_drawio():
+    """A two page document: the test diagram plain on 'First' and compressed on 'Second'."""
+    plain_page = re.search(r'<diagram.*</diagram>', TEST_DRAWIO_FILE_DATA, re.DOTALL).group(0)
+    compressed_page = re.search(r'<diagram.*</diagram>', compress_diagram(TEST_DRAWIO_FILE_DATA)[0], re.DOTALL).group(0)
+    plain_page = re.sub(r'name="[^"]*"', 'name="First"', plain_page, count=1)
+    compressed_page = re.sub(r'name="[^"]*"', 'name="Second"', compressed_page, count=1)
+    return f'<mxfile>{plain_page}{compressed_page}</mxfile>'
+
+class TestPages(unittest.TestCase):
+    def test_drawio_to_xl_pages(self):
+        for processes in [1, 2]:
+            page_outputs = drawio_to_xl_pages(io.StringIO(two_page_drawio()), processes)
+            self.assertEqual([page_name for page_name, _ in page_outputs], ['First', 'Second'])
+            for _, output_stream in page_outputs:
+                self.assertEqual(output_stream.getvalue(), TEST_XL_FILE_DATA)
+
+    def test_add_page_column(self):
+        page_outputs = [
+            ('First', io.StringIO('Process Step ID,Owner\n1,nate\n')),
+            ('Second', io.StringIO('Process Step ID,Status\n2,done\n')),
+        ]
+        expected_output = 'Page,Process Step ID,Owner,Status\nFirst,1,nate,\nSecond,2,,done\n'
+        self.assertEqual(add_page_column(page_outputs).getvalue(), expected_output)
+
+    def test_page_output_file(self):
+        self.assertEqual(page_output_file('out/plan.csv', 'Page 1/draft'), 'out/plan_Page_1_draft.csv')
+
 class TestStripFrontMatter(unittest.TestCase):
     def test_strip_front_matter(self):
         input_data = io.StringIO("# This is a comment\nThis is not a comment\n# Another comment")
@@ -68,6 +154,25 @@ class TestReplaceIdsWithXlId(unittest.TestCase):
         actual_output = actual_output_stream.read()
         self.assertEqual(actual_output, expected_output)
 
+    def test_replace_ids_beyond_the_third_decision(self):
+        csv_content = 'id,xl_id,decision0_id,decision3_id,decision11_id,decision11_label,next_step_id\n1,A,2,3,1,1,\n2,B,,,,,3\n3,C,,,,,\n'
+        expected_output = 'id,xl_id,decision0_id,decision3_id,decision11_id,decision11_label,next_step_id\nA,A,B,C,A,1,\nB,B,,,,,C\nC,C,,,,,\n'
+        self.assertEqual(replace_ids_with_xl_ids(io.StringIO(csv_content)).getvalue(), expected_output)
+
+    def test_id_remap(self):
+        remap = IdRemap({'1': 'A', '2': 'B'})
+
+        self.assertEqual([remap[cell] for cell in ['1', '2,1', '2,9', '9', '']], ['A', 'B,A', 'B', '', ''])
+        # Lists are remapped once and then looked up
+        self.assertEqual(remap['2,1'], 'B,A')
+        self.assertIn('2,1', remap)
+        self.assertEqual(remap.id_to_xl_id, {'1': 'A', '2': 'B'})
+
+    def test_id_headers(self):
+        table = Table(['id', 'decision12_id', 'next_step_id', 'decision12_label', 'decision0_idx', 'next_step_id'], [[]] * 6)
+
+        self.assertEqual(get_id_headers(table), ['decision12_id', 'next_step_id'])
+
 class TestDeleteXlIds(unittest.TestCase):
     def test_delete_xl_ids(self):
         csv_content = 'id,xl_id,next_step_id,decision0_id,decision1_id,decision2_id\n100,100,"200,300",300,400,500\n200,200,100,300,400,500\n300,300,100,200,400,500\n400,400,100,200,300,500\n500,500,100,200,300,400\n'
@@ -117,6 +222,31 @@ mxgraph.flowchart.decision,"id3, id4, id5","label3, label4, label5"
         output_stream = parse_decisions(input_stream)
         self.assertEqual(expected_output, output_stream.getvalue())
 
+class TestWideDecisions(unittest.TestCase):
+    def test_thirty_way_decision_round_trip(self):
+        branches = [str(i) for i in range(3, 33)]
+        rows = ['1,,Decide,,,,,,,,,"' + ','.join(branches) + '",decision,"' + ','.join(f'L{i}' for i in branches) + '"']
+        rows += [f'{i},,Step {i},,,,,,,,,,process,' for i in branches]
+        xl_csv = TEST_XL_FILE_DATA.splitlines()[0] + '\n' + '\n'.join(rows) + '\n'
+
+        drawio_csv = convert_to_csv(xl_to_drawio(io.StringIO(xl_csv))).getvalue()
+        self.assertIn('decision29_id', drawio_csv.splitlines()[0])
+        self.assertNotIn('decision30_id', drawio_csv.splitlines()[0])
+
+        output = drawio_to_xl(xl_to_drawio(io.StringIO(xl_csv))).getvalue()
+        decision_row = next(csv.DictReader(io.StringIO(output)))
+        self.assertEqual(decision_row['Next Step ID'], ', '.join(branches))
+        self.assertEqual(decision_row['Connector Label'], ', '.join(f'L{i}' for i in branches))
+
+    def test_decision_columns_are_sparse(self):
+        table = convert_to_table(io.StringIO(TEST_DRAWIO_FILE_DATA))
+
+        decision_columns = [column for header, column in zip(table.headers, table.columns) if header.startswith('decision')]
+        self.assertTrue(decision_columns)
+        for column in decision_columns:
+            self.assertIsInstance(column, SparseColumn)
+            self.assertLess(len(column.values), len(table))
+
 class TestInsertNewlines(unittest.TestCase):
     def test_insert_newlines(self):
         self.maxDiff = None
@@ -180,6 +310,31 @@ class TestDrawioToXl(unittest.TestCase):
         # Compare the actual output with the expected output
         self.assertEqual(expected_output, actual_output)
 
+    def test_drawio_to_xl_matches_staged_pipeline(self):
+        self.maxDiff = None
+
+        # Chain the stream-based stages, round-tripping the CSV between each one
+        staged_stream = convert_to_csv(io.StringIO(TEST_DRAWIO_FILE_DATA))
+        for stage in [strip_front_matter, delete_height_width, replace_ids_with_xl_ids, delete_xl_ids,
+                      parse_decisions, rename_shapes, insert_newlines, rename_headers, reorder_headers]:
+            staged_stream = stage(staged_stream)
+
+        # The fused pipeline must produce byte-identical output
+        output_stream = drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA))
+        self.assertEqual(staged_stream.getvalue(), output_stream.getvalue())
+
+    def test_drawio_to_xl_rows(self):
+        headers, rows = drawio_to_xl_rows(io.StringIO(TEST_DRAWIO_FILE_DATA))
+
+        self.assertNotIsInstance(rows, list)
+        self.assertEqual(normalize_csv(write_table(headers, rows).getvalue()), normalize_csv(TEST_XL_FILE_DATA))
+
+    def test_drawio_to_xl_writes_to_the_output_stream(self):
+        output_stream = io.StringIO()
+
+        self.assertIs(drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA), output_stream=output_stream), output_stream)
+        self.assertEqual(output_stream.getvalue(), TEST_XL_FILE_DATA)
+
 
 class TestCommandLineInterface(unittest.TestCase):
     def setUp(self):
@@ -209,6 +364,13 @@ class TestCommandLineInterface(unittest.TestCase):
         # Check if the output matches the expected output
         self.assertEqual(output, expected_output)
 
+    def test_drawio_to_xl_to_standard_output(self):
+        result = subprocess.run(['python3', 'drawio_xl/drawio_to_xl.py', self.input_file, '-', '--buffer-size', '16'],
+                                capture_output=True, text=True)
+
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout, TEST_XL_FILE_DATA)
+
     def tearDown(self):
         # Delete the output file
         if os.path.exists(self.output_file):
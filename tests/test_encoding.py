@@ -0,0 +1,184 @@
+import unittest
+import codecs
+import io
+import os
+import subprocess
+import sys
+import tempfile
+from tests.testing_support import TEST_DRAWIO_FILE_DATA
+from tests.testing_support import TEST_XL_FILE_DATA
+
+from drawio_xl.cache import ConversionCache
+from drawio_xl.drawio_to_xl import drawio_to_xl
+from drawio_xl.encoding import MappedFile
+from drawio_xl.encoding import decode_stream
+from drawio_xl.encoding import open_binary
+from drawio_xl.encoding import open_input
+from drawio_xl.encoding import open_output
+from drawio_xl.encoding import open_xml_input
+from drawio_xl.encoding import sniff_encoding
+from drawio_xl.xl_to_drawio import prepare_drawio_csv
+
+# The test plan with characters that are encoded differently in UTF-8 and cp1252
+XL_DATA = TEST_XL_FILE_DATA.replace('Cell B', 'Cellule “é” – B')
+
+
+class TestSniffEncoding(unittest.TestCase):
+    def test_bom(self):
+        self.assertEqual(sniff_encoding(codecs.BOM_UTF8 + b'a,b'), 'utf-8-sig')
+        self.assertEqual(sniff_encoding('a,b'.encode('utf-16')), 'utf-16')
+        self.assertEqual(sniff_encoding('a,b'.encode('utf-32')), 'utf-32')
+
+    def test_utf8(self):
+        self.assertEqual(sniff_encoding(XL_DATA.encode('utf-8')), 'utf-8')
+        self.assertEqual(sniff_encoding(b'ascii only'), 'utf-8')
+        # A character cut off by the end of the sniffed bytes
+        self.assertEqual(sniff_encoding('é'.encode('utf-8') * 3 + 'é'.encode('utf-8')[:1]), 'utf-8')
+
+    def test_cp1252(self):
+        self.assertEqual(sniff_encoding(XL_DATA.encode('cp1252')), 'cp1252')
+        self.assertEqual(sniff_encoding(XL_DATA.encode('cp1252'), fallback='latin-1'), 'latin-1')
+
+    def test_utf8_with_stray_bytes(self):
+        self.assertEqual(sniff_encoding(XL_DATA.encode('utf-8') + b'\xff'), 'utf-8')
+
+
+class TestDecodeStream(unittest.TestCase):
+    def test_encodings_decode_to_the_same_text(self):
+        for data in [XL_DATA.encode('utf-8'), codecs.BOM_UTF8 + XL_DATA.encode('utf-8'),
+                     XL_DATA.encode('cp1252'), XL_DATA.encode('utf-16')]:
+            with self.subTest(data=data[:4]):
+                self.assertEqual(decode_stream(io.BytesIO(data)).read(), XL_DATA)
+
+    def test_characters_split_across_chunks(self):
+        self.assertEqual(decode_stream(io.BytesIO(XL_DATA.encode('utf-8')), chunk_size=3).read(), XL_DATA)
+
+    def test_invalid_bytes(self):
+        data = XL_DATA.encode('utf-8').replace(b'Cellule', b'Ce\x80llule')
+
+        with self.assertRaises(UnicodeDecodeError):
+            decode_stream(io.BytesIO(data)).read()
+        self.assertEqual(decode_stream(io.BytesIO(data), errors='ignore').read(), XL_DATA)
+        with self.assertRaises(ValueError):
+            decode_stream(io.BytesIO(data), errors='skip')
+
+    def test_explicit_encoding(self):
+        data = 'é'.encode('latin-1')
+
+        self.assertEqual(decode_stream(io.BytesIO(data), encoding='latin-1').read(), 'é')
+
+    def test_conversion_of_a_cp1252_export(self):
+        expected = prepare_drawio_csv(io.StringIO(XL_DATA)).getvalue()
+
+        self.assertEqual(prepare_drawio_csv(decode_stream(io.BytesIO(XL_DATA.encode('cp1252')))).getvalue(), expected)
+
+
+class TestOpenInput(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_bom_is_not_part_of_the_first_header(self):
+        path = self.write('plan.csv', codecs.BOM_UTF8 + XL_DATA.encode('utf-8'))
+
+        with open_input(path) as input_stream:
+            self.assertTrue(input_stream.readline().startswith('Process Step ID,'))
+
+    def test_files_are_mapped(self):
+        path = self.write('plan.csv', XL_DATA.encode('utf-8'))
+
+        with open_input(path) as input_stream:
+            self.assertIsInstance(input_stream.buffer, MappedFile)
+            self.assertEqual(input_stream.read(), XL_DATA)
+        with open_input(path, mapped=False) as input_stream:
+            self.assertNotIsInstance(input_stream.buffer, MappedFile)
+
+    def test_empty_file_is_not_mapped(self):
+        path = self.write('empty.csv', b'')
+
+        with open_binary(path) as binary_stream:
+            self.assertNotIsInstance(binary_stream, MappedFile)
+        with open_input(path) as input_stream:
+            self.assertEqual(input_stream.read(), '')
+
+    def test_mapped_file(self):
+        path = self.write('data', b'0123456789')
+
+        with MappedFile(path) as mapped_file:
+            self.assertEqual(mapped_file.peek(3), b'012')
+            self.assertEqual(mapped_file.read(4), b'0123')
+            buffer = bytearray(4)
+            self.assertEqual(mapped_file.readinto(buffer), 4)
+            self.assertEqual(buffer, b'4567')
+            self.assertEqual(mapped_file.read(), b'89')
+            self.assertEqual(mapped_file.readinto(buffer), 0)
+            mapped_file.seek(2)
+            self.assertEqual(mapped_file.tell(), 2)
+        self.assertTrue(mapped_file.closed)
+
+    def test_xml_parser_reads_utf8_from_the_mapped_file(self):
+        path = self.write('plan.drawio', TEST_DRAWIO_FILE_DATA.encode('utf-8'))
+        expected = drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA)).getvalue()
+
+        with open_xml_input(path) as input_stream:
+            self.assertIsInstance(input_stream, MappedFile)
+            self.assertEqual(drawio_to_xl(input_stream).getvalue(), expected)
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ConversionCache(directory)
+            for _ in range(2):
+                with open_xml_input(path) as input_stream:
+                    self.assertEqual(drawio_to_xl(input_stream, cache=cache).getvalue(), expected)
+
+    def test_other_xml_input_is_decoded(self):
+        path = self.write('plan.drawio', TEST_DRAWIO_FILE_DATA.encode('utf-8'))
+
+        with open_xml_input(path, encoding='utf-8') as input_stream:
+            self.assertEqual(input_stream.read(), TEST_DRAWIO_FILE_DATA)
+        with open_xml_input(path, errors='ignore') as input_stream:
+            self.assertEqual(input_stream.read(), TEST_DRAWIO_FILE_DATA)
+
+    def test_output_is_buffered(self):
+        path = os.path.join(self.directory.name, 'plan.drawio')
+
+        with open_output(path, buffer_size=64) as output_stream:
+            output_stream.write('x' * 32)
+            self.assertEqual(os.path.getsize(path), 0)
+            output_stream.write('x' * 64)
+            self.assertGreater(os.path.getsize(path), 0)
+        self.assertEqual(os.path.getsize(path), 96)
+
+    def test_output_is_utf8_with_unix_newlines(self):
+        path = os.path.join(self.directory.name, 'plan.csv')
+        # An EncodingWarning is raised if the output falls back to the locale's encoding
+        code = ('from drawio_xl.encoding import open_output\n'
+                f'with open_output({path!r}) as f: f.write("Cellule “é”\\nB\\n")')
+
+        subprocess.run([sys.executable, '-X', 'warn_default_encoding', '-W', 'error::EncodingWarning', '-c', code],
+                       check=True, capture_output=True)
+
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), 'Cellule “é”\nB\n'.encode('utf-8'))
+
+    def test_command_line(self):
+        input_file = self.write('plan.csv', XL_DATA.encode('utf-8').replace(b'Cellule', b'Ce\x80llule'))
+        config_file = self.write('config.json', b'{"drawio_backend": "native"}')
+        output_file = os.path.join(self.directory.name, 'plan.drawio')
+        command = [sys.executable, 'drawio_xl/xl_to_drawio.py', input_file, output_file, '--config', config_file]
+
+        failed = subprocess.run(command, capture_output=True, text=True)
+        self.assertNotEqual(failed.returncode, 0)
+        self.assertIn('UnicodeDecodeError', failed.stderr)
+
+        subprocess.run(command + ['--strip-invalid'], check=True, capture_output=True)
+        with open(output_file, encoding='utf-8') as f:
+            self.assertIn('Cellule “é” – B', f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,219 @@
+import unittest
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from unittest import mock
+from tests.testing_support import TEST_DRAWIO_FILE_DATA
+from tests.testing_support import TEST_XL_FILE_DATA
+
+from drawio_xl import instrumentation as instrumentation_module
+from drawio_xl.cache import ConversionCache
+from drawio_xl.config import Config
+from drawio_xl.config import compile_config
+from drawio_xl.drawio_to_xl import drawio_to_xl
+from drawio_xl.instrumentation import disable_instrumentation
+from drawio_xl.instrumentation import enable_from_environment
+from drawio_xl.instrumentation import enable_instrumentation
+from drawio_xl.instrumentation import get_instrumentation
+from drawio_xl.instrumentation import instrument
+from drawio_xl.instrumentation import table_bytes
+from drawio_xl.instrumentation import METRIC_FAMILIES
+from drawio_xl.table import SparseColumn
+from drawio_xl.table import Table
+from drawio_xl.xl_to_drawio import xl_to_drawio
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(disable_instrumentation)
+        # Nothing is written when the test process exits
+        patcher = mock.patch.object(instrumentation_module.atexit, 'register')
+        self.register = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_off_by_default(self):
+        self.assertIsNone(get_instrumentation())
+        self.assertEqual(drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA)).getvalue(), TEST_XL_FILE_DATA)
+
+    def test_records_every_drawio_to_xl_stage(self):
+        instrumentation = enable_instrumentation()
+
+        output = drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA)).getvalue()
+
+        self.assertEqual(output, TEST_XL_FILE_DATA)
+        self.assertEqual([record['stage'] for record in instrumentation.records], [
+            'convert_to_table', 'get_id_to_xl_id', 'delete_height_width', 'replace_ids_with_xl_ids', 'delete_xl_ids',
+            'parse_decisions', 'rename_shapes', 'insert_newlines', 'rename_headers', 'reorder_headers', 'write', 'total'])
+        self.assertEqual({record['pipeline'] for record in instrumentation.records}, {'drawio_to_xl'})
+        records = {record['stage']: record for record in instrumentation.records}
+        self.assertEqual(records['total']['bytes_in'], len(TEST_DRAWIO_FILE_DATA.encode('utf-8')))
+        self.assertEqual(records['total']['bytes_out'], len(output.encode('utf-8')))
+        self.assertEqual(records['rename_shapes']['rows_in'], records['rename_shapes']['rows_out'])
+        self.assertGreater(records['rename_shapes']['rows_out'], 0)
+        self.assertIsNone(records['total']['allocated_bytes'])
+        for record in instrumentation.records:
+            self.assertGreaterEqual(record['wall_seconds'], 0)
+            self.assertGreaterEqual(record['cpu_seconds'], 0)
+
+    def test_xl_to_drawio_and_memory(self):
+        instrumentation = enable_instrumentation(memory=True)
+
+        xl_to_drawio(io.StringIO(TEST_XL_FILE_DATA), config=compile_config(Config(drawio_backend='native')))
+
+        stages = [record['stage'] for record in instrumentation.records]
+        self.assertEqual(stages[0], 'read')
+        self.assertEqual(stages[-3:], ['add_frontmatter', 'csv_to_drawio', 'total'])
+        self.assertGreater(instrumentation.records[-1]['peak_bytes'], 0)
+
+    def test_peak_of_an_enclosing_stage_covers_the_stages_it_runs(self):
+        instrumentation = enable_instrumentation(memory=True)
+
+        def outer():
+            buffer = bytearray(4 * 1024 * 1024)
+            del buffer
+            instrument('inner', lambda: bytearray(1024))
+
+        instrument('outer', outer)
+
+        records = {record['stage']: record for record in instrumentation.records}
+        self.assertLess(records['inner']['peak_bytes'], 1024 * 1024)
+        self.assertGreaterEqual(records['outer']['peak_bytes'], 4 * 1024 * 1024)
+
+    def test_threads_keep_their_own_peaks(self):
+        instrumentation = enable_instrumentation(memory=True)
+        started, finish = threading.Event(), threading.Event()
+
+        def wait():
+            started.set()
+            finish.wait(10)
+
+        thread = threading.Thread(target=instrument, args=('waiting', wait))
+        thread.start()
+        started.wait(10)
+        # A stage run here while the thread's is in progress neither sees nor pops the thread's entry
+        instrument('here', lambda: None)
+        self.assertEqual(instrumentation._peaks, [])
+        finish.set()
+        thread.join()
+
+        self.assertEqual(sorted(record['stage'] for record in instrumentation.records), ['here', 'waiting'])
+
+    def test_a_conversion_inside_another_is_not_recorded_twice(self):
+        instrumentation = enable_instrumentation()
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ConversionCache(directory)
+            drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA), cache=cache)
+            drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA), cache=cache)
+
+        runs = {entry['stage']: entry['runs'] for entry in instrumentation.summary()}
+        # Both calls are recorded, but the stages only ran on the miss
+        self.assertEqual(runs['total'], 2)
+        self.assertEqual(runs['write'], 1)
+
+    def test_summary_and_openmetrics(self):
+        instrumentation = enable_instrumentation()
+        drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA))
+        drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA))
+
+        summary = {entry['stage']: entry for entry in instrumentation.summary()}
+        self.assertEqual(summary['total']['runs'], 2)
+        self.assertEqual(summary['total']['bytes_in'], 2 * len(TEST_DRAWIO_FILE_DATA.encode('utf-8')))
+
+        text = instrumentation.to_openmetrics()
+        self.assertTrue(text.endswith('# EOF\n'))
+        self.assertIn('# UNIT drawio_xl_stage_wall_seconds seconds', text)
+        self.assertIn('drawio_xl_stage_runs_total{pipeline="drawio_to_xl",stage="parse_decisions"} 2', text)
+        # Memory was not traced, so it is left out rather than reported as zero
+        self.assertNotIn('drawio_xl_stage_peak_bytes{', text)
+
+    def test_metric_names_end_in_their_unit(self):
+        # OpenMetrics parsers reject a family with a unit whose name does not end in it
+        for name, _, _, unit, _ in METRIC_FAMILIES:
+            if unit:
+                self.assertTrue(name.endswith('_' + unit), name)
+
+    def test_write_picks_the_format_from_the_extension(self):
+        instrumentation = enable_instrumentation()
+        drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA))
+        with tempfile.TemporaryDirectory() as directory:
+            instrumentation.write(os.path.join(directory, 'metrics.json'))
+            instrumentation.write(os.path.join(directory, 'metrics.prom'))
+            with open(os.path.join(directory, 'metrics.json')) as f:
+                self.assertEqual(len(json.load(f)['records']), len(instrumentation.records))
+            with open(os.path.join(directory, 'metrics.prom')) as f:
+                self.assertTrue(f.read().startswith('# TYPE'))
+
+        with self.assertRaises(ValueError):
+            instrumentation.write('metrics.txt', 'csv')
+
+    def test_environment(self):
+        self.assertIsNone(enable_from_environment({}))
+
+        instrumentation = enable_from_environment({'DRAWIO_XL_METRICS': 'metrics.json', 'DRAWIO_XL_METRICS_MEMORY': '1'})
+
+        self.assertIs(get_instrumentation(), instrumentation)
+        self.assertTrue(instrumentation.memory)
+        self.register.assert_called_once_with(instrumentation.write, 'metrics.json', None)
+
+    def test_table_bytes(self):
+        table = Table(['a', 'bc'], [['x', 'é'], SparseColumn({1: 'yz'}, 2, default='-')])
+
+        self.assertEqual(table_bytes(table), 3 + 3 + 3)
+
+
+class TestCommandLine(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_metrics_file(self):
+        with open(self.path('plan.drawio'), 'w') as f:
+            f.write(TEST_DRAWIO_FILE_DATA)
+
+        subprocess.run([sys.executable, 'drawio_xl/drawio_to_xl.py', self.path('plan.drawio'), self.path('plan.csv'),
+                        '--metrics', self.path('metrics.json')], check=True, capture_output=True)
+
+        with open(self.path('metrics.json')) as f:
+            summary = json.load(f)['summary']
+        self.assertEqual(summary[0]['stage'], 'convert_to_table')
+        self.assertEqual(summary[-1]['stage'], 'total')
+
+    def test_metrics_with_cache(self):
+        with open(self.path('plan.drawio'), 'w') as f:
+            f.write(TEST_DRAWIO_FILE_DATA)
+        command = [sys.executable, 'drawio_xl/drawio_to_xl.py', self.path('plan.drawio'), self.path('plan.csv'),
+                   '--metrics', self.path('metrics.json'), '--cache-dir', self.path('cache')]
+
+        for _ in range(2):
+            subprocess.run(command, check=True, capture_output=True)
+
+        with open(self.path('metrics.json')) as f:
+            summary = {entry['stage']: entry for entry in json.load(f)['summary']}
+        self.assertEqual(summary['total']['bytes_in'], len(TEST_DRAWIO_FILE_DATA.encode('utf-8')))
+        with open(self.path('plan.csv')) as f:
+            self.assertEqual(f.read(), TEST_XL_FILE_DATA)
+
+    def test_batch_workers_send_their_records_back(self):
+        for name in ['a', 'b']:
+            with open(self.path(f'{name}.csv'), 'w') as f:
+                f.write(TEST_XL_FILE_DATA)
+        with open(self.path('config.json'), 'w') as f:
+            json.dump({'drawio_backend': 'native'}, f)
+
+        subprocess.run([sys.executable, 'drawio_xl/xl_to_drawio.py', self.path('*.csv'), self.path('out'),
+                        '--processes', '2', '--config', self.path('config.json'),
+                        '--metrics', self.path('metrics.prom')], check=True, capture_output=True)
+
+        with open(self.path('metrics.prom')) as f:
+            self.assertIn('drawio_xl_stage_runs_total{pipeline="xl_to_drawio",stage="total"} 2', f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import io
+import xml.etree.ElementTree as ET
+from tests.testing_support import TEST_DRAWIO_CSV_FILE_DATA
+from tests.testing_support import TEST_DRAWIO_FILE_DATA
+
+from drawio_xl.layout import break_cycles
+from drawio_xl.layout import assign_layers
+from drawio_xl.layout import layered_layout
+from drawio_xl.layout import parallel_edge_points
+from drawio_xl.layout import VERTICAL
+from drawio_xl.mxgraph import csv_to_mxfile
+from drawio_xl.xl_to_drawio import add_frontmatter
+
+
+class TestBreakCycles(unittest.TestCase):
+    def test_removes_back_edges_and_self_loops(self):
+        edges = [(0, 1), (1, 2), (2, 0), (2, 2), (2, 3)]
+
+        self.assertEqual(break_cycles(4, edges), [(0, 1), (1, 2), (2, 3)])
+
+
+class TestAssignLayers(unittest.TestCase):
+    def test_longest_path(self):
+        # 0 -> 1 -> 2 and a shortcut 0 -> 2
+        self.assertEqual(assign_layers(3, [(0, 1), (1, 2), (0, 2)]), [0, 1, 2])
+
+    def test_sources_sit_next_to_their_successor(self):
+        # 3 only feeds the last step, so it belongs in the layer before it
+        self.assertEqual(assign_layers(4, [(0, 1), (1, 2), (3, 2)]), [0, 1, 2, 1])
+
+
+class TestLayeredLayout(unittest.TestCase):
+    def test_horizontal_spacing(self):
+        positions = layered_layout([(200, 100), (100, 100), (200, 50)], [(0, 1), (0, 2)],
+                                   nodespacing=100, levelspacing=200, left=0, top=0)
+
+        # Layer 1 is as wide as its widest vertex and the narrower one is centred in it
+        self.assertEqual(positions[0], (0, 75))
+        self.assertEqual(positions[1], (450, 0))
+        self.assertEqual(positions[2], (400, 200))
+
+    def test_vertical(self):
+        positions = layered_layout([(100, 50), (100, 50)], [(0, 1)], direction=VERTICAL,
+                                   levelspacing=200, left=0, top=0)
+
+        self.assertEqual(positions, [(0, 0), (0, 250)])
+
+    def test_cycles(self):
+        positions = layered_layout([(100, 100)] * 3, [(0, 1), (1, 2), (2, 0)], left=0, top=0)
+
+        self.assertEqual([x for x, _ in positions], [0, 300, 600])
+
+    def test_matches_drawio_layers(self):
+        input_stream = add_frontmatter(io.StringIO(TEST_DRAWIO_CSV_FILE_DATA))
+
+        def x_by_id(xml_string):
+            return {user_object.get('id'): user_object.find('mxCell/mxGeometry').get('x')
+                    for user_object in ET.fromstring(xml_string).iter('UserObject')}
+
+        expected = x_by_id(TEST_DRAWIO_FILE_DATA)
+        actual = x_by_id(csv_to_mxfile(input_stream).getvalue())
+
+        # Every step except 10 and 11, which draw.io places a layer further on, lands in the same column as draw.io's layout
+        for cell_id in ['2', '3', '4', '5', '6', '7', '8', '9']:
+            self.assertEqual(actual[cell_id], expected[cell_id])
+
+
+class TestParallelEdgePoints(unittest.TestCase):
+    def test_spreads_edges_between_the_same_vertices(self):
+        positions = [(0, 0), (300, 0), (300, 200)]
+        sizes = [(100, 100)] * 3
+
+        points = parallel_edge_points(positions, sizes, [(0, 1), (1, 0), (0, 2), (0, 1), (2, 2)], edgespacing=40)
+
+        # The three edges between 0 and 1 cross the gap between them 40 apart, whichever way they point
+        self.assertEqual(points[0], [(200, 10)])
+        self.assertEqual(points[1], [(200, 50)])
+        self.assertEqual(points[3], [(200, 90)])
+        self.assertEqual(points[2], [])
+        self.assertEqual(points[4], [])
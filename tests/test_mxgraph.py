@@ -0,0 +1,129 @@
+import unittest
+import io
+import xml.etree.ElementTree as ET
+from tests.testing_support import TEST_DRAWIO_CSV_FILE_DATA
+from tests.testing_support import TEST_DRAWIO_FILE_DATA
+from tests.testing_support import normalize_xml
+
+from drawio_xl.config import Config
+from drawio_xl.mxgraph import parse_frontmatter
+from drawio_xl.mxgraph import csv_to_mxfile
+from drawio_xl.xl_to_drawio import add_frontmatter
+from drawio_xl.xl_to_drawio import csv_to_drawio
+from drawio_xl.xl_to_drawio import get_drawio_backend
+from drawio_xl.drawio_to_xl import convert_to_csv
+
+
+class TestParseFrontmatter(unittest.TestCase):
+    def test_parse_frontmatter(self):
+        directives = parse_frontmatter([
+            '## a comment: with a colon\n',
+            '# styles: { \\\n',
+            '# "todo" : "shape=%shape%;" }\n',
+            '# stylename: status\n',
+            '# connect: {"from": "next_step_id", "to": "id"}\n',
+            '# connect: {"from": "decision0_id", "to": "id", "fromlabel": "decision0_label"}\n',
+            '# ignore: id, shape\n',
+        ])
+
+        self.assertEqual(directives['styles'], {'todo': 'shape=%shape%;'})
+        self.assertEqual(directives['stylename'], 'status')
+        self.assertEqual([connect['from'] for connect in directives['connect']], ['next_step_id', 'decision0_id'])
+        self.assertEqual(directives['ignore'], ['id', 'shape'])
+        self.assertNotIn('a comment', directives)
+
+
+class TestCsvToMxfile(unittest.TestCase):
+    def test_matches_drawio_import(self):
+        self.maxDiff = None
+        input_stream = add_frontmatter(io.StringIO(TEST_DRAWIO_CSV_FILE_DATA))
+
+        output_stream = csv_to_mxfile(input_stream)
+
+        self.assertEqual(normalize_xml(output_stream.getvalue()), normalize_xml(TEST_DRAWIO_FILE_DATA))
+
+    def test_styles_and_geometry(self):
+        input_stream = add_frontmatter(io.StringIO(TEST_DRAWIO_CSV_FILE_DATA))
+
+        root = ET.fromstring(csv_to_mxfile(input_stream).getvalue())
+
+        cell = root.find(".//UserObject[@id='3']/mxCell")
+        self.assertEqual(cell.get('style'), 'whiteSpace=wrap;shape=mxgraph.flowchart.decision;fillColor=#d5e8d4;strokeColor=#82b366;html=1;')
+        geometry = cell.find('mxGeometry')
+        self.assertEqual((geometry.get('width'), geometry.get('height')), ('100', '100'))
+
+    def test_escapes_attribute_values(self):
+        input_stream = io.StringIO('# label: %name%\n'
+                                   'id,name\n'
+                                   '1,"say ""hi""\nand <bye> & go"\n')
+
+        root = ET.fromstring(csv_to_mxfile(input_stream).getvalue())
+
+        self.assertEqual(root.find('.//UserObject').get('name'), 'say "hi"\nand <bye> & go')
+
+    def test_namespace_prefixes_identity_ids(self):
+        input_stream = io.StringIO('# namespace: csvimport-\n'
+                                   '# identity: xl_id\n'
+                                   '# connect: {"from": "next", "to": "xl_id"}\n'
+                                   'xl_id,next,name\n'
+                                   '7,8,a\n'
+                                   '8,,b\n'
+                                   '7,8,c\n')
+
+        root = ET.fromstring(csv_to_mxfile(input_stream).getvalue())
+
+        # The repeated identity updates the first vertex, and the edge is numbered after the root and layer cells
+        user_objects = root.findall('.//UserObject')
+        self.assertEqual([(user_object.get('id'), user_object.get('xl_id'), user_object.get('name'))
+                          for user_object in user_objects],
+                         [('csvimport-7', '7', 'c'), ('csvimport-8', '8', 'b')])
+        edge = root.find(".//mxCell[@edge='1']")
+        self.assertEqual((edge.get('id'), edge.get('source'), edge.get('target')), ('2', 'csvimport-7', 'csvimport-8'))
+
+    def test_namespace_without_identity_keeps_drawio_numbering(self):
+        input_stream = io.StringIO('# namespace: csvimport-\n'
+                                   'xl_id,name\n'
+                                   '7,a\n')
+
+        root = ET.fromstring(csv_to_mxfile(input_stream).getvalue())
+
+        self.assertEqual(root.find('.//UserObject').get('id'), '2')
+
+    def test_edgespacing_separates_parallel_edges(self):
+        input_stream = io.StringIO('# connect: {"from": "next", "to": "id"}\n'
+                                   '# connect: {"from": "also", "to": "id"}\n'
+                                   '# layout: horizontalflow\n'
+                                   '# edgespacing: 30\n'
+                                   'id,next,also\n'
+                                   '1,2,2\n'
+                                   '2,,\n')
+
+        root = ET.fromstring(csv_to_mxfile(input_stream).getvalue())
+
+        ys = [float(point.get('y')) for point in root.iter('mxPoint')]
+        self.assertEqual(len(ys), 2)
+        self.assertEqual(abs(ys[0] - ys[1]), 30)
+
+    def test_round_trips_through_drawio_to_xl(self):
+        input_stream = add_frontmatter(io.StringIO(TEST_DRAWIO_CSV_FILE_DATA))
+
+        output_stream = csv_to_mxfile(input_stream)
+
+        self.assertEqual(convert_to_csv(output_stream).getvalue().splitlines()[0],
+                         convert_to_csv(io.StringIO(TEST_DRAWIO_FILE_DATA)).getvalue().splitlines()[0])
+
+
+class TestDrawioBackend(unittest.TestCase):
+    def test_auto_falls_back_to_native(self):
+        self.assertEqual(get_drawio_backend(Config(drawio_path='/nonexistent/draw.io')), 'native')
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            get_drawio_backend(Config(drawio_backend='electron'))
+
+    def test_native_backend(self):
+        input_stream = add_frontmatter(io.StringIO(TEST_DRAWIO_CSV_FILE_DATA))
+
+        output_stream = csv_to_drawio(input_stream, Config(drawio_backend='native'))
+
+        self.assertEqual(normalize_xml(output_stream.getvalue()), normalize_xml(TEST_DRAWIO_FILE_DATA))
@@ -0,0 +1,56 @@
+import unittest
+import io
+import os
+import tempfile
+from tests.testing_support import TEST_DRAWIO_FILE_DATA
+from tests.testing_support import TEST_XL_FILE_DATA
+
+from drawio_xl.observers import NullSink
+from drawio_xl.observers import DirectorySink
+from drawio_xl.observers import RingBufferSink
+from drawio_xl.drawio_to_xl import drawio_to_xl
+from drawio_xl.drawio_to_xl import convert_to_csv
+from drawio_xl.xl_to_drawio import prepare_drawio_csv
+
+
+class TestRingBufferSink(unittest.TestCase):
+    def test_captures_every_drawio_to_xl_stage(self):
+        sink = RingBufferSink()
+        output_stream = drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA), sink)
+
+        self.assertEqual([name for name, _ in sink.artifacts], [
+            'convert_to_csv', 'delete_height_width', 'replace_ids_with_xl_ids', 'delete_xl_ids',
+            'parse_decisions', 'rename_shapes', 'insert_newlines', 'rename_headers', 'reorder_headers'])
+        self.assertEqual(sink.get('convert_to_csv'), convert_to_csv(io.StringIO(TEST_DRAWIO_FILE_DATA)).getvalue())
+        self.assertEqual(sink.get('reorder_headers'), output_stream.getvalue())
+
+    def test_observing_does_not_change_the_output(self):
+        expected_output = prepare_drawio_csv(io.StringIO(TEST_XL_FILE_DATA)).getvalue()
+        sink = RingBufferSink()
+        output_stream = prepare_drawio_csv(io.StringIO(TEST_XL_FILE_DATA), sink)
+        self.assertEqual(output_stream.getvalue(), expected_output)
+        self.assertEqual(sink.get('add_frontmatter'), expected_output)
+
+    def test_maxlen(self):
+        sink = RingBufferSink(maxlen=2)
+        drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA), sink)
+        self.assertEqual([name for name, _ in sink.artifacts], ['rename_headers', 'reorder_headers'])
+        self.assertIsNone(sink.get('convert_to_csv'))
+
+class TestDirectorySink(unittest.TestCase):
+    def test_writes_numbered_files(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            debug_dir = os.path.join(temp_dir, 'debug_output')
+            output_stream = drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA), DirectorySink(debug_dir))
+
+            self.assertIn('0_convert_to_csv.csv', os.listdir(debug_dir))
+            with open(os.path.join(debug_dir, '8_reorder_headers.csv')) as f:
+                self.assertEqual(f.read(), output_stream.getvalue())
+
+class TestNullSink(unittest.TestCase):
+    def test_null_sink(self):
+        output_stream = drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA), NullSink())
+        self.assertEqual(output_stream.getvalue(), TEST_XL_FILE_DATA)
+
+if __name__ == '__main__':
+    unittest.main()
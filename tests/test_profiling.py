@@ -0,0 +1,109 @@
+import unittest
+import io
+import os
+import pstats
+import subprocess
+import sys
+import tempfile
+import threading
+from tests.testing_support import TEST_DRAWIO_FILE_DATA
+
+from drawio_xl.drawio_to_xl import drawio_to_xl
+from drawio_xl.instrumentation import instrument
+from drawio_xl.profiling import Profiler
+from drawio_xl.profiling import collapse_stack
+
+
+def function_names(stats):
+    return {function_name: calls for (_, _, function_name), (_, calls, *_) in stats.stats.items()}
+
+
+class TestProfiler(unittest.TestCase):
+    def test_profiles_a_conversion(self):
+        with Profiler() as profiler:
+            drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA))
+
+        self.assertEqual(function_names(profiler.stats)['convert_to_table'], 1)
+
+    def test_stages_are_labelled_in_collapsed_stacks(self):
+        stack = instrument('my_stage', lambda: collapse_stack(sys._getframe()))
+
+        labels = stack.split(';')
+        self.assertEqual(labels[-2], 'stage:my_stage')
+        self.assertTrue(labels[-1].endswith('<lambda>'))
+
+    def test_profiles_from_other_processes_are_merged(self):
+        exported = []
+        for _ in range(2):
+            with Profiler() as profiler:
+                drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA))
+            profiler.stacks['a;b'] += 1
+            exported.append(profiler.export())
+
+        total = Profiler()
+        for stats, stacks in exported:
+            total.add(stats, stacks)
+
+        self.assertEqual(function_names(total.stats)['convert_to_table'], 2)
+        self.assertEqual(total.stacks['a;b'], 2)
+
+    def test_overlapping_profilers_restore_the_switch_interval(self):
+        original = sys.getswitchinterval()
+        first_started, second_started, first_stopped = threading.Event(), threading.Event(), threading.Event()
+        intervals = []
+
+        def first():
+            with Profiler():
+                first_started.set()
+                second_started.wait(10)
+            first_stopped.set()
+
+        def second():
+            first_started.wait(10)
+            with Profiler():
+                second_started.set()
+                first_stopped.wait(10)
+                intervals.append(sys.getswitchinterval())
+
+        threads = [threading.Thread(target=first), threading.Thread(target=second)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # The first profiler stopped while the second still needed the lowered interval
+        self.assertLess(intervals[0], original)
+        self.assertEqual(sys.getswitchinterval(), original)
+
+    def test_write(self):
+        profiler = Profiler()
+        with profiler:
+            drawio_to_xl(io.StringIO(TEST_DRAWIO_FILE_DATA))
+        profiler.stacks['main;stage:parse_decisions'] += 3
+
+        with tempfile.TemporaryDirectory() as directory:
+            prefix = os.path.join(directory, 'profile')
+            profiler.write(prefix)
+
+            self.assertIn('convert_to_table', function_names(pstats.Stats(prefix + '.pstats')))
+            with open(prefix + '.collapsed') as f:
+                self.assertIn('main;stage:parse_decisions 3\n', f.read())
+
+
+class TestCommandLine(unittest.TestCase):
+    def test_batch_profile_covers_every_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ['a', 'b']:
+                with open(os.path.join(directory, f'{name}.drawio'), 'w') as f:
+                    f.write(TEST_DRAWIO_FILE_DATA)
+            prefix = os.path.join(directory, 'profile')
+
+            subprocess.run([sys.executable, 'drawio_xl/drawio_to_xl.py', directory, os.path.join(directory, 'out'),
+                            '--processes', '2', '--profile', prefix], check=True, capture_output=True)
+
+            self.assertEqual(function_names(pstats.Stats(prefix + '.pstats'))['convert_to_table'], 2)
+            self.assertTrue(os.path.exists(prefix + '.collapsed'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+import io
+
+from drawio_xl.table import SparseColumn
+from drawio_xl.table import Table
+
+
+class TestTable(unittest.TestCase):
+    def setUp(self):
+        self.table = Table.read(io.StringIO("id,shape,owner\n1,process,nate\n2,decision,alan\n"))
+
+    def test_read_and_write_round_trip(self):
+        self.assertEqual(self.table.headers, ['id', 'shape', 'owner'])
+        self.assertEqual(self.table.columns, [['1', '2'], ['process', 'decision'], ['nate', 'alan']])
+        self.assertEqual(len(self.table), 2)
+        self.assertEqual(self.table.write('# x\n').getvalue(), "# x\nid,shape,owner\n1,process,nate\n2,decision,alan\n")
+
+    def test_ragged_rows_are_fitted_to_the_headers(self):
+        table = Table.from_rows(['a', 'b'], [['1'], ['2', '3', '4'], []], chunk_size=2)
+
+        self.assertEqual(list(table.rows()), [('1', ''), ('2', '3'), ('', '')])
+
+    def test_column_operations_leave_the_values_alone(self):
+        shapes = self.table.column('shape')
+
+        self.table.delete_column('id')
+        self.table.rename(['Shape', 'Owner'])
+        self.table.select(['Owner', 'Shape'])
+
+        self.assertEqual(self.table.headers, ['Owner', 'Shape'])
+        # Columns move as a whole, they are not copied
+        self.assertIs(self.table.column('Shape'), shapes)
+        self.assertEqual(list(self.table.rows()), [('nate', 'process'), ('alan', 'decision')])
+
+    def test_delete_missing_column(self):
+        self.assertFalse(self.table.delete_column('width'))
+        self.assertEqual(self.table.headers, ['id', 'shape', 'owner'])
+
+    def test_missing_column_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            self.table.position('width')
+
+    def test_map_and_add_columns(self):
+        self.table.map_column('owner', str.upper)
+        self.table.add_column('xl_id', list(self.table.column('id')))
+
+        self.assertEqual(self.table.write().getvalue(), "id,shape,owner,xl_id\n1,process,NATE,1\n2,decision,ALAN,2\n")
+
+    def test_filter_rows(self):
+        self.table.filter_rows([False, True])
+
+        self.assertEqual(len(self.table), 1)
+        self.assertEqual(list(self.table.rows()), [('2', 'decision', 'alan')])
+
+    def test_duplicate_headers_resolve_to_the_first(self):
+        table = Table(['a', 'a'], [['1'], ['2']])
+
+        self.assertEqual(table.column('a'), ['1'])
+
+    def test_table_without_columns_keeps_its_rows(self):
+        self.table.keep([])
+
+        self.assertEqual(list(self.table.rows()), [(), ()])
+        self.assertEqual(self.table.write().getvalue(), "\n\n\n")
+
+
+class TestSparseColumn(unittest.TestCase):
+    def setUp(self):
+        self.table = Table(['id', 'decision0_id'], [['1', '2', '3', '4'], SparseColumn({1: '3', 3: '1'}, 4)])
+
+    def test_reads_like_a_list(self):
+        column = self.table.column('decision0_id')
+
+        self.assertEqual(list(column), ['', '3', '', '1'])
+        self.assertEqual(column[-1], '1')
+        self.assertEqual(self.table.write().getvalue(), "id,decision0_id\n1,\n2,3\n3,\n4,1\n")
+
+    def test_only_stored_values_are_mapped(self):
+        self.table.map_column('decision0_id', lambda value: {'1': 'a', '3': 'c'}.get(value, value))
+
+        column = self.table.column('decision0_id')
+        self.assertIsInstance(column, SparseColumn)
+        self.assertEqual(column.values, {1: 'c', 3: 'a'})
+
+    def test_mapping_the_default_makes_it_dense(self):
+        self.table.map_column('decision0_id', lambda value: value or '-')
+
+        self.assertEqual(self.table.column('decision0_id'), ['-', '3', '-', '1'])
+
+    def test_filter_rows_renumbers(self):
+        self.table.filter_rows([True, False, True, True])
+
+        self.assertEqual(self.table.column('decision0_id').values, {2: '1'})
+        self.assertEqual(list(self.table.rows()), [('1', ''), ('3', ''), ('4', '1')])
+
+    def test_setting_the_default_drops_the_value(self):
+        column = self.table.column('decision0_id')
+        column[1] = ''
+        column[0] = 'x'
+
+        self.assertEqual(column.values, {0: 'x', 3: '1'})
+        with self.assertRaises(IndexError):
+            column[4] = 'y'
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import xml.etree.ElementTree as ET
+from tests.testing_support import TEST_DRAWIO_FILE_DATA
+from tests.testing_support import TEST_XL_FILE_DATA
+
+from drawio_xl.drawio_to_xl import drawio_to_xl
+from drawio_xl.update import parse_attributes
+from drawio_xl.update import scan_page
+from drawio_xl.update import update_drawio
+
+
+def edit_csv(replacements=(), drop=(), append=()):
+    lines = TEST_XL_FILE_DATA.splitlines()
+    for old, new in replacements:
+        lines = [line.replace(old, new) for line in lines]
+    lines = [line for line in lines if line.split(',', 1)[0] not in drop] + list(append)
+    return '\n'.join(lines) + '\n'
+
+
+def find_cell(drawio, cell_id):
+    return ET.fromstring(drawio).find(f'.//root/*[@id="{cell_id}"]')
+
+
+class TestScanPage(unittest.TestCase):
+    def test_finds_top_level_cells(self):
+        cells, root_end = scan_page(TEST_DRAWIO_FILE_DATA)
+
+        self.assertEqual([cell.attrib['id'] for cell in cells[:3]], ['0', '1', '2'])
+        self.assertTrue(TEST_DRAWIO_FILE_DATA.startswith('</root>', root_end))
+        self.assertEqual(cells[2].tag, 'UserObject')
+        self.assertEqual(cells[2].geometry['x'], '20')
+        for cell in cells:
+            self.assertEqual(cell.load().get('id'), cell.attrib['id'])
+
+    def test_attributes_are_unescaped(self):
+        attributes = parse_attributes(' label="a&lt;br&gt;&quot;b&quot;&#10;c" note=\'x\ny\'')
+
+        self.assertEqual(attributes, {'label': 'a<br>"b"\nc', 'note': 'x y'})
+
+    def test_rejects_compressed_or_empty_files(self):
+        with self.assertRaises(ValueError):
+            scan_page('<mxfile><diagram>abc</diagram></mxfile>')
+
+
+class TestUpdateDrawio(unittest.TestCase):
+    def test_unchanged_csv_leaves_the_file_identical(self):
+        output_stream, changes = update_drawio(io.StringIO(TEST_DRAWIO_FILE_DATA), io.StringIO(TEST_XL_FILE_DATA))
+
+        self.assertEqual(output_stream.getvalue(), TEST_DRAWIO_FILE_DATA)
+        self.assertEqual(changes, {'changed': [], 'added': [], 'removed': []})
+
+    def test_changed_attributes_are_patched_in_place(self):
+        edited = edit_csv([('Cell B', 'Cell B revised'), ('4,,Cell C,doing', '4,,Cell C,done')])
+
+        output_stream, changes = update_drawio(io.StringIO(TEST_DRAWIO_FILE_DATA), io.StringIO(edited))
+        drawio = output_stream.getvalue()
+
+        self.assertEqual(changes['changed'], ['3', '4'])
+        self.assertEqual(find_cell(drawio, '3').get('description'), 'Cell B revised')
+        # The status column drives the style, the geometry is kept
+        cell_c = find_cell(drawio, '4').find('mxCell')
+        self.assertIn('fillColor=#d5e8d4', cell_c.get('style'))
+        self.assertEqual(cell_c.find('mxGeometry').get('x'), '820')
+        self.assertEqual(drawio_to_xl(io.StringIO(drawio)).getvalue(), edited)
+
+    def test_untouched_cells_and_waypoints_are_copied_verbatim(self):
+        edited = edit_csv([('Cell B', 'Cell B revised')])
+
+        output_stream, _ = update_drawio(io.StringIO(TEST_DRAWIO_FILE_DATA), io.StringIO(edited))
+
+        original_cells, _ = scan_page(TEST_DRAWIO_FILE_DATA)
+        updated_cells, _ = scan_page(output_stream.getvalue())
+        differing = [old.attrib['id'] for old, new in zip(original_cells, updated_cells) if old.xml != new.xml]
+        self.assertEqual(differing, ['3'])
+        self.assertIn('<mxPoint x="232" y="286.25" />', output_stream.getvalue())
+
+    def test_new_row_is_added_with_its_edges(self):
+        edited = edit_csv(append=['12,bob,New step,todo,,,,,,,,8,process,'])
+
+        output_stream, changes = update_drawio(io.StringIO(TEST_DRAWIO_FILE_DATA), io.StringIO(edited))
+        drawio = output_stream.getvalue()
+
+        self.assertEqual(changes['added'], ['12'])
+        new_object = ET.fromstring(drawio).find('.//UserObject[@xl_id="12"]')
+        self.assertEqual(new_object.get('description'), 'New step')
+        self.assertIsNotNone(new_object.find('mxCell/mxGeometry').get('y'))
+        edges = ET.fromstring(drawio).findall(f'.//mxCell[@source="{new_object.get("id")}"]')
+        self.assertEqual([edge.get('target') for edge in edges], ['8'])
+        self.assertEqual(drawio_to_xl(io.StringIO(drawio)).getvalue(), edited)
+
+    def test_removed_row_takes_its_edges(self):
+        edited = edit_csv([('"3,4,5,9"', '"3,4,5"')], drop=['9'])
+
+        output_stream, changes = update_drawio(io.StringIO(TEST_DRAWIO_FILE_DATA), io.StringIO(edited))
+        drawio = output_stream.getvalue()
+
+        self.assertEqual(changes['removed'], ['9'])
+        self.assertIsNone(find_cell(drawio, '9'))
+        self.assertEqual(ET.fromstring(drawio).findall('.//mxCell[@target="9"]'), [])
+        self.assertEqual(drawio_to_xl(io.StringIO(drawio)).getvalue(), edited)
+
+    def test_changed_next_steps_rewire_edges(self):
+        edited = edit_csv([('10,,,,,,,,,,,7,', '10,,,,,,,,,,,8,')])
+
+        output_stream, changes = update_drawio(io.StringIO(TEST_DRAWIO_FILE_DATA), io.StringIO(edited))
+
+        self.assertEqual(changes['changed'], ['10'])
+        self.assertEqual(drawio_to_xl(io.StringIO(output_stream.getvalue())).getvalue(), edited)
+
+
+class TestMain(unittest.TestCase):
+    def test_updates_the_file_in_place(self):
+        with tempfile.TemporaryDirectory() as directory:
+            drawio_file = os.path.join(directory, 'plan.drawio')
+            input_file = os.path.join(directory, 'plan.csv')
+            with open(drawio_file, 'w') as f:
+                f.write(TEST_DRAWIO_FILE_DATA)
+            with open(input_file, 'w') as f:
+                f.write(edit_csv([('Cell B', 'Cell B revised')]))
+
+            result = subprocess.run([sys.executable, 'drawio_xl/update.py', drawio_file, input_file],
+                                    capture_output=True, text=True, check=True)
+
+            self.assertEqual(result.stdout.strip(), '1 changed, 0 added, 0 removed')
+            with open(drawio_file) as f:
+                self.assertIn('Cell B revised', f.read())
@@ -9,7 +9,42 @@ from drawio_xl.utils import get_max_decision_count_from_headers
 from drawio_xl.utils import get_max_decision_count_from_rows
 from drawio_xl.utils import get_connect_frontmatter
 from drawio_xl.utils import get_ignore_frontmatter
-
+from drawio_xl.utils import iter_csv
+from drawio_xl.utils import write_table
+from drawio_xl.utils import apply_stages
+from drawio_xl.utils import delete_column_stage
+from drawio_xl.utils import delete_empty_rows_stage
+
+
+class TestIterCSV(unittest.TestCase):
+    def test_matches_write_table_for_any_chunk_size(self):
+        headers = ['name', 'note']
+        rows = [['Alice', 'a, b'], ['Bob', 'line\nbreak'], ['Carol', '']]
+        expected = write_table(headers, rows, frontmatter='# x\n').getvalue()
+        for rows_per_chunk in (1, 2, 3, 10):
+            chunks = list(iter_csv(headers, iter(rows), '# x\n', rows_per_chunk))
+            self.assertEqual(''.join(chunks), expected)
+
+    def test_rows_are_pulled_one_chunk_at_a_time(self):
+        pulled = []
+
+        def rows():
+            for i in range(5):
+                pulled.append(i)
+                yield [str(i)]
+
+        chunks = iter_csv(['n'], rows(), rows_per_chunk=2)
+        self.assertEqual(next(chunks), 'n\n0\n1\n')
+        self.assertEqual(pulled, [0, 1])
+
+class TestApplyStages(unittest.TestCase):
+    def test_stages_compose(self):
+        csv_content = io.StringIO("name,age,height\nAlice,20,160\n,,\nBob,25,175\n")
+        stages = [
+            ('delete_empty_rows', delete_empty_rows_stage),
+            ('delete_height', lambda table, config: delete_column_stage(table, 'height')),
+        ]
+        self.assertEqual(apply_stages(csv_content, stages).getvalue(), "name,age\nAlice,20\nBob,25\n")
 
 class TestDeleteColumn(unittest.TestCase):
     def test_delete_column(self):
@@ -37,6 +72,14 @@ class TestDeleteNonUTF8(unittest.TestCase):
         # Check that the output is as expected
         self.assertEqual(output_stream.getvalue(), 'Hello, world!')
 
+    def test_characters_are_kept_whole(self):
+        input_stream = io.BytesIO('é'.encode('utf-8') * 100000 + b'\xff')
+
+        self.assertEqual(delete_non_utf8(input_stream).getvalue(), 'é' * 100000)
+
+    def test_text_stream_is_unchanged(self):
+        self.assertEqual(delete_non_utf8(io.StringIO('Hello, world!')).getvalue(), 'Hello, world!')
+
 class TestDeleteEmptyCols(unittest.TestCase):
     def test_delete_empty_cols(self):
         # Create a StringIO object with some CSV data
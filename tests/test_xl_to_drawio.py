@@ -12,6 +12,7 @@ from tests.testing_support import TEST_XL_FILE_DATA
 
 from drawio_xl.utils import get_max_decision_count_from_headers, get_connect_frontmatter, get_ignore_frontmatter
 from drawio_xl.config import Config
+from drawio_xl.config import compile_config
 
 
 from drawio_xl.xl_to_drawio import rename_headers
@@ -25,6 +26,8 @@ from drawio_xl.xl_to_drawio import parse_decisions
 from drawio_xl.xl_to_drawio import add_frontmatter
 from drawio_xl.xl_to_drawio import csv_to_drawio
 from drawio_xl.xl_to_drawio import xl_to_drawio
+from drawio_xl.xl_to_drawio import prepare_drawio_csv
+from drawio_xl.utils import delete_empty_cols, delete_empty_rows
 from drawio_xl.xl_to_drawio import add_frontmatter
 
 
@@ -172,6 +175,20 @@ class TestAddFrontmatter(unittest.TestCase):
         # Check that the output data ends with the input stream data
         self.assertTrue(output_data.endswith(input_data))
 
+class TestPrepareDrawioCsv(unittest.TestCase):
+    def test_prepare_drawio_csv_matches_staged_pipeline(self):
+        self.maxDiff = None
+
+        # Chain the stream-based stages, round-tripping the CSV between each one
+        staged_stream = io.StringIO(TEST_XL_FILE_DATA)
+        for stage in [delete_empty_cols, delete_empty_rows, rename_headers, lower_shape_case, lower_status_case,
+                      replace_newlines, save_id, rename_shapes, insert_height_width, parse_decisions, add_frontmatter]:
+            staged_stream = stage(staged_stream)
+
+        # The fused executor must produce byte-identical output
+        output_stream = prepare_drawio_csv(io.StringIO(TEST_XL_FILE_DATA))
+        self.assertEqual(staged_stream.getvalue(), output_stream.getvalue())
+
 class TestCsvToDrawio(unittest.TestCase):
     def test_csv_to_drawio(self):
         self.maxDiff = None
@@ -203,6 +220,14 @@ class TestXlToDrawio(unittest.TestCase):
         # Compare the output to the expected output
         self.assertEqual(normalize_xml(output_stream.getvalue()), normalize_xml(expected_output))
 
+    def test_xl_to_drawio_writes_to_the_output_stream(self):
+        output_stream = io.StringIO()
+        config = compile_config(Config(drawio_backend='native'))
+
+        self.assertIs(xl_to_drawio(io.StringIO(TEST_XL_FILE_DATA), config=config, output_stream=output_stream),
+                      output_stream)
+        self.assertEqual(output_stream.getvalue(), xl_to_drawio(io.StringIO(TEST_XL_FILE_DATA), config=config).getvalue())
+
 class TestCommandLineInterface(unittest.TestCase):
     def setUp(self):
         self.output_file = 'tests/test_output.drawio'
@@ -232,6 +257,13 @@ class TestCommandLineInterface(unittest.TestCase):
         # Check if the output matches the expected output
         self.assertEqual(normalize_xml(output), normalize_xml(expected_output))
 
+    def test_xl_to_drawio_to_standard_output(self):
+        result = subprocess.run(['python3', 'drawio_xl/xl_to_drawio.py', self.input_file, '-'], capture_output=True,
+                                text=True)
+
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(normalize_xml(result.stdout), normalize_xml(TEST_DRAWIO_FILE_DATA))
+
     def tearDown(self):
         # Delete the output file
         if os.path.exists(self.output_file):